@@ -0,0 +1,24 @@
+import click
+import frappe
+from frappe.commands import get_site, pass_context
+
+
+@click.command("rebuild-mikrotik-counters")
+@pass_context
+def rebuild_mikrotik_counters(context):
+    """Recompute the MikroTik dashboard counters from Customer Subscription"""
+    from mikrotik_integration.mikrotik_integration.doctype.mikrotik_router_counter.mikrotik_router_counter import (
+        rebuild_all_counters,
+    )
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        routers = rebuild_all_counters()
+        click.echo(f"Rebuilt counters for {routers} routers")
+    finally:
+        frappe.destroy()
+
+
+commands = [rebuild_mikrotik_counters]
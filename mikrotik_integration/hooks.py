@@ -12,13 +12,28 @@ app_include_js = [
     "/assets/mikrotik_integration/js/mikrotik_integration.js"
 ]
 
+# Website
+# -------
+
+portal_menu_items = [
+    {"title": "My Internet", "route": "/internet_usage", "role": "Customer"}
+]
+
 # DocTypes
 # --------
 doc_events = {
     "Customer Subscription": {
+        "before_validate": "mikrotik_integration.mikrotik_integration.doctype.mikrotik_router_counter.mikrotik_router_counter.remember_subscription_contribution",
         "validate": "mikrotik_integration.mikrotik_integration.doctype.customer_subscription.customer_subscription.validate",
         "on_submit": "mikrotik_integration.mikrotik_integration.doctype.customer_subscription.customer_subscription.on_submit",
-        "before_cancel": "mikrotik_integration.mikrotik_integration.doctype.customer_subscription.customer_subscription.before_cancel"
+        "before_update_after_submit": "mikrotik_integration.mikrotik_integration.doctype.mikrotik_router_counter.mikrotik_router_counter.remember_subscription_contribution",
+        "before_cancel": [
+            "mikrotik_integration.mikrotik_integration.doctype.mikrotik_router_counter.mikrotik_router_counter.remember_subscription_contribution",
+            "mikrotik_integration.mikrotik_integration.doctype.customer_subscription.customer_subscription.before_cancel"
+        ],
+        "on_update": "mikrotik_integration.mikrotik_integration.doctype.mikrotik_router_counter.mikrotik_router_counter.update_subscription_counters",
+        "on_update_after_submit": "mikrotik_integration.mikrotik_integration.doctype.mikrotik_router_counter.mikrotik_router_counter.update_subscription_counters",
+        "on_cancel": "mikrotik_integration.mikrotik_integration.doctype.mikrotik_router_counter.mikrotik_router_counter.update_subscription_counters"
     },
     "Sales Invoice": {
         "on_submit": "mikrotik_integration.mikrotik_integration.doctype.customer_subscription.customer_subscription.handle_invoice_submission"
@@ -36,17 +51,26 @@ doc_events = {
 scheduler_events = {
     "daily": [
         "mikrotik_integration.mikrotik_integration.doctype.customer_subscription.customer_subscription.process_expired_subscriptions",
-        "mikrotik_integration.mikrotik_integration.doctype.mikrotik_api_log.mikrotik_api_log.clear_old_logs"
+        "mikrotik_integration.mikrotik_integration.doctype.mikrotik_api_log.mikrotik_api_log.clear_old_logs",
+        "mikrotik_integration.mikrotik_integration.doctype.mikrotik_router_counter.mikrotik_router_counter.rebuild_all_counters",
+        "mikrotik_integration.mikrotik_integration.doctype.mikrotik_job_profile.mikrotik_job_profile.clear_old_profiles",
+        "mikrotik_integration.mikrotik_integration.doctype.mikrotik_sync_run.mikrotik_sync_run.clear_old_sync_runs"
     ],
     "hourly": [
         "mikrotik_integration.mikrotik_integration.doctype.customer_subscription.customer_subscription.sync_usage_data"
     ],
     "cron": {
+        "* * * * *": [
+            "mikrotik_integration.mikrotik_integration.doctype.subscription_payment_activation.subscription_payment_activation.enqueue_pending_activations",
+            "mikrotik_integration.mikrotik_integration.doctype.mikrotik_router_operation.mikrotik_router_operation.enqueue_pending_outboxes",
+            "mikrotik_integration.mikrotik_integration.log_volume.flush_log_windows"
+        ],
         "*/2 * * * *": [
             "mikrotik_integration.mikrotik_integration.doctype.customer_subscription.customer_subscription.sync_router_status"
         ],
         "*/5 * * * *": [
-            "mikrotik_integration.utils.sync_all_routers"
+            "mikrotik_integration.utils.sync_all_routers",
+            "mikrotik_integration.mikrotik_integration.listener.ensure_listeners"
         ]
     }
 }
@@ -0,0 +1,193 @@
+import time
+
+import frappe
+import numpy as np
+from frappe.utils import cint, flt
+
+# Two readings per router are enough for rates; older ones are dropped
+SNAPSHOT_COUNT = 2
+# Routers that stop syncing drop out of the analytics
+SNAPSHOT_TTL = 24 * 60 * 60
+DEFAULT_TOP = 20
+# A router reboot resets every counter on it, so the flagged list is capped
+MAX_FLAGGED = 500
+# Spread of rates above which a user is flagged, in robust standard deviations
+DEFAULT_SPIKE_SCORE = 6
+# Slower users are never flagged as spikes, however quiet the rest of the fleet is
+DEFAULT_SPIKE_MIN_MBPS = 1
+# Least spread of rates a score is measured in, so a fleet of nearly equal users
+# does not turn small differences into spikes
+DEFAULT_SPIKE_MIN_SPREAD_MBPS = 0.5
+# A counter growing faster than this cannot be real traffic
+DEFAULT_MAX_MBPS = 1000
+PERCENTILES = (50, 90, 95, 99)
+# Scales the median absolute deviation to a standard deviation for normal data
+MAD_SCALE = 1.4826
+
+
+def get_snapshot_key(router):
+    return f"mikrotik_usage_snapshots::{router}"
+
+
+def record_usage_snapshot(router, readings, sampled_at=None):
+    """Keep a router's latest usage readings as columnar arrays
+
+    `readings` maps subscription names to their router counter total in MB.
+    Called by the usage sync, so the analytics never ask a router.
+    """
+    if not readings:
+        return
+
+    names = np.array(list(readings.keys()))
+    used_mb = np.fromiter(readings.values(), dtype=np.float64, count=len(readings))
+    # Sorted by name so snapshots are aligned with a binary search
+    order = np.argsort(names)
+    snapshot = {
+        "sampled_at": sampled_at or time.time(),
+        "names": names[order],
+        "used_mb": used_mb[order]
+    }
+
+    key = get_snapshot_key(router)
+    snapshots = (frappe.cache().get_value(key) or [])[-(SNAPSHOT_COUNT - 1):] + [snapshot]
+    frappe.cache().set_value(key, snapshots, expires_in_sec=SNAPSHOT_TTL)
+
+
+def load_fleet(routers=None):
+    """Usage of every user seen in a router's last two snapshots, as columnar arrays
+
+    Users missing from the previous snapshot have nothing to compare with
+    and are left out.
+    """
+    if routers is None:
+        routers = frappe.get_all("MikroTik Settings", filters={"disabled": 0}, pluck="name")
+
+    columns = {"names": [], "router_index": [], "previous_mb": [], "current_mb": [], "seconds": []}
+    loaded = []
+    for router in routers:
+        snapshots = frappe.cache().get_value(get_snapshot_key(router)) or []
+        if len(snapshots) < 2:
+            continue
+        previous, current = snapshots[-2], snapshots[-1]
+        seconds = current["sampled_at"] - previous["sampled_at"]
+        if seconds <= 0 or not len(previous["names"]):
+            continue
+
+        position = np.searchsorted(previous["names"], current["names"])
+        position = np.minimum(position, len(previous["names"]) - 1)
+        found = previous["names"][position] == current["names"]
+
+        count = int(found.sum())
+        columns["names"].append(current["names"][found])
+        columns["router_index"].append(np.full(count, len(loaded), dtype=np.int32))
+        columns["previous_mb"].append(previous["used_mb"][position[found]])
+        columns["current_mb"].append(current["used_mb"][found])
+        columns["seconds"].append(np.full(count, seconds))
+        loaded.append(router)
+
+    fleet = {
+        field: np.concatenate(values) if values else np.array([])
+        for field, values in columns.items()
+    }
+    fleet["routers"] = loaded
+    return fleet
+
+
+def compute_usage_stats(fleet, top=DEFAULT_TOP):
+    """Deltas, rates, percentiles and anomaly flags of the whole fleet at once
+
+    A total that went down (user re-created or router rebooted) counts again
+    from zero, as in the portal's daily usage, and is flagged as a reset.
+    Spikes are rates far above the median of the users with traffic, measured
+    in median absolute deviations so the heavy users themselves do not hide
+    them. Idle users are left out of both, as on a mostly idle fleet they
+    would make the median and its deviation zero and every user a spike.
+    """
+    current = fleet["current_mb"]
+    delta = current - fleet["previous_mb"]
+    reset = delta < 0
+    delta = np.where(reset, current, delta)
+    # MB over seconds to megabits per second
+    rate = delta * 8 / fleet["seconds"] if len(delta) else delta
+
+    stats = {
+        "users": len(rate),
+        "routers": len(fleet["routers"]),
+        "total_mbps": float(rate.sum()),
+        "percentiles": {},
+        "delta_mb": delta,
+        "rate_mbps": rate,
+        "top": np.array([], dtype=np.int64),
+        "reset": reset,
+        "spike": np.zeros(len(rate), dtype=bool),
+        "jump": np.zeros(len(rate), dtype=bool),
+        "score": np.zeros(len(rate))
+    }
+    if not len(rate):
+        return stats
+
+    stats["percentiles"] = dict(zip(PERCENTILES, np.percentile(rate, PERCENTILES).tolist()))
+
+    spike_score = flt(frappe.conf.get("mikrotik_spike_score")) or DEFAULT_SPIKE_SCORE
+    spike_min = flt(frappe.conf.get("mikrotik_spike_min_mbps")) or DEFAULT_SPIKE_MIN_MBPS
+    min_spread = flt(frappe.conf.get("mikrotik_spike_min_spread_mbps")) or DEFAULT_SPIKE_MIN_SPREAD_MBPS
+    max_mbps = flt(frappe.conf.get("mikrotik_max_user_mbps")) or DEFAULT_MAX_MBPS
+
+    active = rate[rate > 0]
+    if not len(active):
+        active = rate
+    median = np.median(active)
+    spread = max(np.median(np.abs(active - median)) * MAD_SCALE, min_spread)
+    score = (rate - median) / spread
+    stats.update(
+        score=score,
+        spike=(score > spike_score) & (rate > spike_min),
+        jump=rate > max_mbps
+    )
+
+    # Only the top rows are sorted, however large the fleet
+    top = min(cint(top) or DEFAULT_TOP, len(rate))
+    candidates = np.argpartition(-rate, top - 1)[:top]
+    stats["top"] = candidates[np.argsort(-rate[candidates], kind="stable")]
+    return stats
+
+
+def get_row(fleet, stats, index):
+    flags = [flag for flag in ("reset", "spike", "jump") if stats[flag][index]]
+    return {
+        "subscription": str(fleet["names"][index]),
+        "router": fleet["routers"][fleet["router_index"][index]],
+        "delta_mb": float(stats["delta_mb"][index]),
+        "rate_mbps": float(stats["rate_mbps"][index]),
+        "used_mb": float(fleet["current_mb"][index]),
+        "score": float(stats["score"][index]),
+        "interval_seconds": float(fleet["seconds"][index]),
+        "flags": flags
+    }
+
+
+def get_analytics(routers=None, top=DEFAULT_TOP):
+    """Fleet summary with the top talkers and the flagged users, highest scores first"""
+    started = time.perf_counter()
+    fleet = load_fleet(routers)
+    stats = compute_usage_stats(fleet, top)
+    flagged = np.flatnonzero(stats["reset"] | stats["spike"] | stats["jump"])
+    flagged = flagged[np.argsort(-stats["score"][flagged], kind="stable")]
+
+    return {
+        "users": stats["users"],
+        "routers": stats["routers"],
+        "total_mbps": stats["total_mbps"],
+        "percentiles": stats["percentiles"],
+        "top_talkers": [get_row(fleet, stats, index) for index in stats["top"]],
+        "flagged_count": len(flagged),
+        "flagged": [get_row(fleet, stats, index) for index in flagged[:MAX_FLAGGED]],
+        "elapsed_ms": (time.perf_counter() - started) * 1000
+    }
+
+
+@frappe.whitelist()
+def get_usage_analytics(router=None, top=DEFAULT_TOP):
+    """Per-user throughput, top talkers and suspicious counter jumps from the latest usage syncs"""
+    frappe.only_for("System Manager")
+    return get_analytics([router] if router else None, top)
@@ -1,8 +1,29 @@
+import base64
+import json
+
 import frappe
+import routeros_api
 from frappe import _
-from frappe.utils import now, add_days, get_first_day, get_last_day
+from frappe.query_builder import Order
+from frappe.query_builder.functions import Coalesce, Count, Sum
+from frappe.utils import cint, now, add_days, get_date_str
 from frappe.utils.data import format_date
 from mikrotik_integration.utils import format_bytes, parse_mikrotik_date
+from mikrotik_integration.mikrotik_integration.drivers import get_driver, is_missing_item_error
+from mikrotik_integration.mikrotik_integration.log_volume import log_router_error
+from mikrotik_integration.mikrotik_integration.telemetry import get_latest_samples, get_series
+from mikrotik_integration.mikrotik_integration.doctype.mikrotik_settings.mikrotik_settings import RouterUnreachableError
+from mikrotik_integration.mikrotik_integration.doctype.mikrotik_router_counter.mikrotik_router_counter import (
+    get_router_counters,
+)
+
+def is_router_unreachable(error):
+    """Check if an error means the router could not be reached, rather than refused a command"""
+    return isinstance(error, (
+        RouterUnreachableError,
+        routeros_api.exceptions.RouterOsApiConnectionError,
+        OSError
+    ))
 
 class MikrotikAPI:
     def __init__(self):
@@ -12,221 +33,226 @@ class MikrotikAPI:
     def get_usage(self, api, conn_type, username):
         """Get usage data for user from MikroTik router"""
         try:
-            usage_data = {"data_used_mb": 0, "last_login": None}
-            
-            if conn_type.service_name == "hotspot":
-                user = api.get_resource('/ip/hotspot/user/').get(name=username)
-                active = api.get_resource('/ip/hotspot/active/').get(user=username)
-            elif conn_type.service_name in ["pppoe", "l2tp", "pptp"]:
-                user = api.get_resource('/ppp/secret/').get(name=username)
-                active = api.get_resource('/ppp/active/').get(name=username)
-            elif conn_type.service_name == "openvpn":
-                user = api.get_resource('/interface/ovpn-server/user/').get(name=username)
-                active = api.get_resource('/interface/ovpn-server/active/').get(name=username)
-            else:
-                error_msg = _("Unsupported connection type: {0}").format(conn_type.service_name)
-                self.log_api_error(api.host, "get_usage", {"username": username}, error_msg)
-                frappe.throw(error_msg)
-                
-            if user and len(user) > 0:
-                # Get bytes in/out 
-                bytes_in = float(user[0].get('bytes-in', '0'))
-                bytes_out = float(user[0].get('bytes-out', '0'))
-                usage_data["data_used_mb"] = (bytes_in + bytes_out) / (1024 * 1024)  # Convert to MB
-                
-                # Get last login time if active
-                if active and len(active) > 0:
-                    usage_data["last_login"] = parse_mikrotik_date(active[0].get('last-logged', None))
-                    
-            return usage_data
-            
+            usage = get_driver(api, conn_type.service_name).usage_snapshot([username]).get(username)
+            if not usage:
+                return {"data_used_mb": 0, "last_login": None}
+            return {"data_used_mb": usage["data_used_mb"], "last_login": usage["last_login"]}
+
         except Exception as e:
             self.log_api_error(
                 api.host,
                 "get_usage",
                 {"username": username, "connection_type": conn_type.service_name},
-                str(e)
+                e
             )
             return None
 
     def check_user_status(self, api, conn_type, username):
         """Check if user is enabled in MikroTik router"""
         try:
-            if conn_type.service_name == "hotspot":
-                users = api.get_resource('/ip/hotspot/user/').get(name=username)
-            elif conn_type.service_name in ["pppoe", "l2tp", "pptp"]:
-                users = api.get_resource('/ppp/secret/').get(name=username)
-            elif conn_type.service_name == "openvpn":
-                users = api.get_resource('/interface/ovpn-server/user/').get(name=username)
-            else:
-                error_msg = _("Unsupported connection type: {0}").format(conn_type.service_name)
-                self.log_api_error(api.host, "check_user_status", {"username": username}, error_msg)
-                frappe.throw(error_msg)
-                
-            if users and len(users) > 0:
-                return "Active" if not users[0].get('disabled', 'false') == 'true' else "Suspended"
-            return "Not Found"
-            
+            user = get_driver(api, conn_type.service_name).list([username]).get(username)
+            if not user:
+                return "Not Found"
+            return "Suspended" if user.get("disabled") == "true" else "Active"
+
         except Exception as e:
             self.log_api_error(
                 api.host,
                 "check_user_status",
                 {"username": username, "connection_type": conn_type.service_name},
-                str(e)
+                e
             )
             return "Error"
 
     def log_api_error(self, router, operation, parameters, error=""):
-        """Log MikroTik API errors to Frappe error log"""
-        error_log = frappe.log_error(
-            message=f"MikroTik API Error\nRouter: {router}\nOperation: {operation}\nParameters: {parameters}\nError: {error}",
+        """Log MikroTik API errors to Frappe error log, once per window for repeats"""
+        log_router_error(
+            router,
+            operation,
+            error,
+            dict(parameters, error=str(error)),
             title="MikroTik API Error"
         )
-        frappe.publish_realtime('mikrotik_api_error', {
-            'name': error_log.name,
-            'creation': error_log.creation,
-            'operation': operation,
-            'router': router
-        })
 
 
 @frappe.whitelist()
 def get_dashboard_data(router=None):
     """Get data for MikroTik dashboard"""
     stats = get_subscription_stats(router)
-    active_users = get_active_users(router)
     failed_api_calls = get_failed_api_calls(router)
+    error_count = get_failed_api_call_count(router)
     usage_chart = get_usage_chart_data(router)
+    router_health = get_router_health(router)
 
     return {
         "stats": stats,
-        "active_users": active_users,
         "failed_api_calls": failed_api_calls,
-        "usage_chart": usage_chart
+        "error_count": error_count,
+        "usage_chart": usage_chart,
+        "router_health": router_health
     }
 
 def get_subscription_stats(router=None):
-    """Get subscription statistics"""
-    filters = {"docstatus": 1}
-    if router:
-        filters["mikrotik_settings"] = router
+    """Get subscription statistics from the per-router counters"""
+    counters = get_router_counters(router)
 
-    # Get active subscriptions count
-    active_subs = frappe.get_all(
-        "Customer Subscription",
-        filters=dict(filters, status="Active"),
-        pluck="name"
-    )
+    revenue = {}
+    for counter in counters:
+        for currency, amount in counter.revenue.items():
+            revenue[currency] = revenue.get(currency, 0) + amount
 
-    # Get pending payments count
-    pending_payments = frappe.get_all(
-        "Customer Subscription",
-        filters=dict(filters, payment_status="Pending"),
-        pluck="name"
-    )
+    # Show the default currency when several are collected, any single one otherwise
+    currency = frappe.defaults.get_global_default("currency")
+    if len(revenue) == 1:
+        currency = next(iter(revenue))
+
+    return {
+        "active_subscriptions": sum(c.active_subscriptions for c in counters),
+        "pending_payments": sum(c.pending_payments for c in counters),
+        "monthly_revenue": revenue.get(currency, 0),
+        "currency": currency,
+        "revenue_by_currency": revenue,
+        "total_usage_mb": sum(c.total_usage_mb or 0 for c in counters)
+    }
+
+ACTIVE_USER_SORT_FIELDS = {
+    "customer_name": "customer_name",
+    "username": "username_mikrotik",
+    "connection_type": "connection_type",
+    "data_used": "data_used_mb",
+    "last_login": "last_login",
+    "expiry": "expiry_date",
+}
+ACTIVE_USERS_MAX_PAGE_LENGTH = 500
+
+@frappe.whitelist()
+def get_active_users(router=None, search=None, sort_by="customer_name", sort_order="asc",
+                     cursor=None, page_length=100):
+    """Get one page of currently active users
+
+    Pages are keyset based: `cursor` is the `next_cursor` of the previous page.
+    The keyset is on the raw column, so with the (status, column, name) indexes
+    every page is an index range read however deep the user scrolls. Values
+    are returned raw and formatted by the client.
+    """
+    sort_field = ACTIVE_USER_SORT_FIELDS.get(sort_by) or "customer_name"
+    descending = (sort_order or "").lower() == "desc"
+    page_length = min(cint(page_length) or 100, ACTIVE_USERS_MAX_PAGE_LENGTH)
+
+    sub = frappe.qb.DocType("Customer Subscription")
+    sort_key = sub[sort_field]
 
-    # Calculate monthly revenue
-    month_start = get_first_day(now())
-    month_end = get_last_day(now())
-    completed_payments = frappe.get_all(
-        "Customer Subscription",
-        filters=dict(
-            filters,
-            payment_status="Completed",
-            payment_date=["between", [month_start, month_end]]
-        ),
-        fields=["sum(price) as total", "currency"]
+    query = (
+        frappe.qb.from_(sub)
+        .where(sub.docstatus == 1)
+        .where(sub.status == "Active")
     )
+    if router:
+        query = query.where(sub.mikrotik_settings == router)
+    if search:
+        pattern = f"%{search}%"
+        query = query.where(
+            sub.customer_name.like(pattern)
+            | sub.customer.like(pattern)
+            | sub.username_mikrotik.like(pattern)
+        )
+
+    # Only the first page pays for the count the client needs to size its scrollbar
+    total = None
+    if not cursor:
+        total = query.select(Count("*")).run()[0][0]
+
+    if cursor:
+        query = query.where(get_keyset_condition(sub, sort_key, descending, *decode_cursor(cursor)))
 
-    # Get total usage for today
-    today_usage = frappe.get_all(
-        "Customer Subscription",
-        filters=dict(filters, status="Active"),
-        fields=["sum(data_used_mb) as total"]
+    order = Order.desc if descending else Order.asc
+    users = (
+        query.select(
+            sub.name,
+            sub.customer,
+            sub.customer_name,
+            sub.username_mikrotik.as_("username"),
+            sub.connection_type,
+            sub.data_used_mb.as_("data_used"),
+            sub.last_login,
+            sub.is_online,
+            sub.payment_status,
+            sub.expiry_date.as_("expiry"),
+            sort_key.as_("sort_key")
+        )
+        .orderby(sort_key, order=order)
+        .orderby(sub.name, order=order)
+        .limit(page_length)
+        .run(as_dict=True)
     )
 
+    next_cursor = None
+    if len(users) == page_length:
+        next_cursor = encode_cursor(users[-1].sort_key, users[-1].name)
+    for user in users:
+        del user["sort_key"]
+
     return {
-        "active_subscriptions": len(active_subs),
-        "pending_payments": len(pending_payments),
-        "monthly_revenue": completed_payments[0].total if completed_payments else 0,
-        "currency": completed_payments[0].currency if completed_payments else frappe.defaults.get_global_default("currency"),
-        "total_usage_mb": today_usage[0].total if today_usage else 0
+        "users": users,
+        "next_cursor": next_cursor,
+        "total": total
     }
 
-def get_active_users(router=None):
-    """Get list of currently active users"""
-    filters = {
-        "docstatus": 1,
-        "status": "Active"
-    }
-    if router:
-        filters["mikrotik_settings"] = router
+def get_keyset_condition(sub, sort_key, descending, last_value, last_name):
+    """Rows after (`last_value`, `last_name`) in the page order
 
-    users = frappe.get_all(
-        "Customer Subscription",
-        filters=filters,
-        fields=[
-            "customer as customer",
-            "customer_name",
-            "username_mikrotik as username",
-            "connection_type",
-            "data_used_mb as data_used",
-            "last_login as uptime",
-            "payment_status",
-            "expiry_date as expiry"
-        ]
-    )
+    NULLs sort before every value, as in MariaDB, and are compared with IS NULL
+    since they match nothing else. The bound on the column alone is repeated
+    outside the OR so the index can start its range there.
+    """
+    if last_value is None:
+        if descending:
+            return sort_key.isnull() & (sub.name < last_name)
+        return (sort_key.isnull() & (sub.name > last_name)) | sort_key.notnull()
 
-    # Format the data
-    for user in users:
-        user.data_used = f"{user.data_used} MB"
-        user.uptime = format_date(user.uptime) if user.uptime else "Never"
-        user.expiry = format_date(user.expiry)
-        user.customer = f"{user.customer_name} ({user.customer})"
+    if descending:
+        return ((sort_key <= last_value) & ((sort_key < last_value) | (sub.name < last_name))) | sort_key.isnull()
+    return (sort_key >= last_value) & ((sort_key > last_value) | (sub.name > last_name))
+
+def encode_cursor(value, name):
+    return base64.urlsafe_b64encode(json.dumps([value, name], default=str).encode()).decode()
 
-    return users
+def decode_cursor(cursor):
+    try:
+        value, name = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return value, name
+    except (ValueError, TypeError):
+        frappe.throw(_("Invalid page cursor"))
 
 def get_failed_api_calls(router=None):
-    """Get recent failed API calls from error log"""
+    """Get recent failed API calls, repeats of an error counted on one entry"""
     filters = {
-        "creation": [">=", add_days(now(), -1)],  # Last 24 hours
-        "title": ["like", "MikroTik API Error%"]
+        "status": "Failed",
+        "timestamp": [">=", add_days(now(), -1)]  # Last 24 hours
     }
+    if router:
+        filters["router"] = router
 
-    # Search in error log for MikroTik API errors
-    logs = frappe.get_all(
-        "Error Log",
+    return frappe.get_all(
+        "MikroTik API Log",
         filters=filters,
-        fields=["creation as timestamp", "message"],
-        order_by="creation desc",
+        fields=["timestamp", "operation", "router", "status", "error_class", "occurrences"],
+        order_by="timestamp desc",
         limit=10
     )
 
-    # Parse the logs to extract operation and router
-    formatted_logs = []
-    for log in logs:
-        error_lines = log.message.split("\n")
-        router_name = ""
-        operation = ""
-        
-        for line in error_lines:
-            if line.startswith("Router:"):
-                router_name = line.replace("Router:", "").strip()
-            elif line.startswith("Operation:"):
-                operation = line.replace("Operation:", "").strip()
-
-        # Only include if we have both router and operation
-        if router_name and operation:
-            # Include if no specific router filter or matches filter
-            if not router or router_name == router:  
-                formatted_logs.append({
-                    "timestamp": log.timestamp,
-                    "operation": operation,
-                    "router": router_name,
-                    "status": "Failed"
-                })
-
-    return formatted_logs
+def get_failed_api_call_count(router=None):
+    """Failed API calls of the last 24 hours, repeats included, over every entry rather than the listed ones"""
+    log = frappe.qb.DocType("MikroTik API Log")
+    query = (
+        frappe.qb.from_(log)
+        .select(Sum(Coalesce(log.occurrences, 1)))
+        .where(log.status == "Failed")
+        .where(log.timestamp >= add_days(now(), -1))
+    )
+    if router:
+        query = query.where(log.router == router)
+    return cint(query.run()[0][0])
 
 @frappe.whitelist()
 def test_provision(subscription):
@@ -247,62 +273,25 @@ def test_provision(subscription):
         
         # Get API connection
         api = router_doc.get_api_connection()
-        
-        # Prepare command based on connection type
-        if conn_type.service_name == "hotspot":
-            cmd = "/ip hotspot user add"
-        elif conn_type.service_name in ["pppoe", "l2tp", "pptp"]:
-            cmd = "/ppp secret add"
-        elif conn_type.service_name == "openvpn":
-            cmd = "/interface ovpn-server user add"
-        else:
-            return {
-                "success": False,
-                "message": f"Unsupported connection type: {conn_type.service_name}"
-            }
+        try:
+            driver = get_driver(api, conn_type.service_name)
 
-        # Get bandwidth limits
-        limits = conn_type.get_bandwidth_limits()
-        
-        # Build parameters
-        params = {
-            "name": username,
-            "password": password,
-            "profile": conn_type.profile_name
-        }
-        
-        if conn_type.service_name in ["pppoe", "l2tp", "pptp"]:
-            params["service"] = conn_type.service_name
-        
-        # Apply bandwidth limits if not using profile
-        if not conn_type.parent_profile:
-            if limits.get("speed_limit_rx"):
-                params["rate-limit"] = f"{limits['speed_limit_rx']}/{limits['speed_limit_tx']}"
-            if limits.get("burst_limit_rx"):
-                params["burst-limit"] = f"{limits['burst_limit_rx']}/{limits['burst_limit_tx']}"
-
-        # Execute command
-        api.get_resource(cmd).add(**params)
-        
-        # Test if user was created
-        if conn_type.service_name == "hotspot":
-            users = api.get_resource('/ip/hotspot/user/').get(name=username)
-        elif conn_type.service_name in ["pppoe", "l2tp", "pptp"]:
-            users = api.get_resource('/ppp/secret/').get(name=username)
-        elif conn_type.service_name == "openvpn":
-            users = api.get_resource('/interface/ovpn-server/user/').get(name=username)
-            
-        api.close()
-        
-        if users and len(users) > 0:
-            # Clean up test user
-            if conn_type.service_name == "hotspot":
-                api.get_resource('/ip/hotspot/user/remove').remove(id=users[0].get('id'))
-            elif conn_type.service_name in ["pppoe", "l2tp", "pptp"]:
-                api.get_resource('/ppp/secret/remove').remove(id=users[0].get('id'))
-            elif conn_type.service_name == "openvpn":
-                api.get_resource('/interface/ovpn-server/user/remove').remove(id=users[0].get('id'))
-                
+            # Build parameters, with the limits resolved through parent profiles
+            params = driver.build_user(
+                conn_type.service_name, username, password, **conn_type.get_user_limit_params()
+            )
+
+            # Create the user, check it exists and clean it up again
+            result = driver.add_many([params])[0]
+            if isinstance(result, Exception):
+                raise result
+            users = driver.list([username])
+            if username in users:
+                driver.remove_many([users[username].get("id")])
+        finally:
+            api.close()
+
+        if users:
             return {
                 "success": True,
                 "message": "Test provision successful"
@@ -312,35 +301,59 @@ def test_provision(subscription):
                 "success": False,
                 "message": "Failed to create test user"
             }
-            
+
     except Exception as e:
         return {
             "success": False,
             "message": str(e)
         }
 
+def get_router_health(router=None):
+    """Latest telemetry of each router, and the last day of it for one router
+
+    Read from the samples the router sync collects, so no router is contacted.
+    """
+    filters = {"name": router} if router else {"disabled": 0}
+    routers = frappe.get_all("MikroTik Settings", filters=filters, fields=["name", "last_sync"])
+    samples = get_latest_samples([r.name for r in routers])
+
+    rows = []
+    for r in routers:
+        sample = samples.get(r.name) or {}
+        interfaces = (sample.get("interfaces") or {}).values()
+        rows.append({
+            "router": r.name,
+            "cpu": sample.get("cpu"),
+            "memory": sample.get("memory"),
+            "uptime": sample.get("uptime"),
+            "rx_bps": sum(rx for rx, _tx in interfaces),
+            "tx_bps": sum(tx for _rx, tx in interfaces),
+            # Epoch seconds, shown in the browser's time zone
+            "sampled_at": sample.get("at"),
+            "last_sync": r.last_sync
+        })
+
+    chart = {"at": [], "cpu": [], "memory": []}
+    if router:
+        for point in get_series(router, "5m"):
+            chart["at"].append(point["at"])
+            chart["cpu"].append(point["cpu"])
+            chart["memory"].append(point["memory"] or 0)
+
+    return {"routers": rows, "chart": chart}
+
 def get_usage_chart_data(router=None):
     """Get daily bandwidth usage data"""
-    filters = {
-        "docstatus": 1,
-        "status": "Active",
-        "creation": [">=", add_days(now(), -30)]  # Last 30 days
-    }
-    if router:
-        filters["mikrotik_settings"] = router
+    cutoff = get_date_str(add_days(now(), -30))  # Last 30 days
 
-    daily_usage = frappe.get_all(
-        "Customer Subscription",
-        filters=filters,
-        fields=[
-            "DATE(creation) as date",
-            "sum(data_used_mb) as usage"
-        ],
-        group_by="DATE(creation)",
-        order_by="date"
-    )
+    daily_usage = {}
+    for counter in get_router_counters(router):
+        for day, usage in counter.usage_by_day.items():
+            if day >= cutoff:
+                daily_usage[day] = daily_usage.get(day, 0) + usage
 
+    days = sorted(daily_usage)
     return {
-        "labels": [format_date(d.date) for d in daily_usage],
-        "values": [d.usage for d in daily_usage]
-    }
\ No newline at end of file
+        "labels": [format_date(day) for day in days],
+        "values": [daily_usage[day] for day in days]
+    }
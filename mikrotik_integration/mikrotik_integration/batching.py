@@ -0,0 +1,98 @@
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import cint
+
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_COMMIT_EVERY = 100
+SAVEPOINT = "mikrotik_batch_row"
+
+
+def get_chunk_size():
+    return cint(frappe.conf.get("mikrotik_batch_chunk_size")) or DEFAULT_CHUNK_SIZE
+
+
+def iter_chunks(doctype, filters=None, fields=None, chunk_size=None):
+    """Yield lists of matching rows in `name` order, one chunk per query
+
+    Each chunk continues after the last name of the previous one, so every
+    query is an index range scan however far the job got, and rows changed
+    by the job itself so they stop matching are neither skipped nor repeated.
+    Only the current chunk is held in memory.
+    """
+    chunk_size = cint(chunk_size) or get_chunk_size()
+    fields = list(fields or ["name"])
+    if "name" not in fields:
+        fields.append("name")
+
+    last_name = None
+    while True:
+        chunk_filters = dict(filters or {})
+        if last_name is not None:
+            chunk_filters["name"] = [">", last_name]
+
+        rows = frappe.get_all(
+            doctype,
+            filters=chunk_filters,
+            fields=fields,
+            order_by="name asc",
+            limit_page_length=chunk_size
+        )
+        if not rows:
+            return
+
+        yield rows
+        if len(rows) < chunk_size:
+            return
+        last_name = rows[-1].name
+
+
+def iter_rows(doctype, filters=None, fields=None, chunk_size=None):
+    """Yield matching rows one at a time, fetched in chunks by `iter_chunks`"""
+    for rows in iter_chunks(doctype, filters, fields, chunk_size):
+        yield from rows
+
+
+class CommitPolicy:
+    """Commit a batch job's work every `every` rows instead of after each one
+
+    Each row runs inside a savepoint, so a failing row only undoes its own
+    changes and the rows before it are committed with the next batch.
+    Callbacks registered with `after_row` run once the row succeeded, and are
+    dropped with a failing row.
+    """
+
+    def __init__(self, every=None):
+        self.every = max(cint(every or frappe.conf.get("mikrotik_batch_commit_every") or DEFAULT_COMMIT_EVERY), 1)
+        self.pending = 0
+
+    @contextmanager
+    def row(self):
+        frappe.db.savepoint(SAVEPOINT)
+        frappe.flags.batch_row_callbacks = []
+        try:
+            yield
+        except Exception:
+            frappe.db.rollback(save_point=SAVEPOINT)
+            raise
+        finally:
+            callbacks = frappe.flags.pop("batch_row_callbacks", None) or []
+
+        for callback in callbacks:
+            callback()
+
+        self.pending += 1
+        if self.pending >= self.every:
+            self.commit()
+
+    def commit(self):
+        frappe.db.commit()
+        self.pending = 0
+
+
+def after_row(callback):
+    """Call `callback` once the current batch row succeeded, or at once outside a batch row"""
+    if frappe.flags.batch_row_callbacks is None:
+        callback()
+    else:
+        frappe.flags.batch_row_callbacks.append(callback)
@@ -10,6 +10,12 @@ frappe.ui.form.on("Connection Type", {
             });
         }
 
+        if (!frm.is_new()) {
+            frm.add_custom_button(__('Push Limits to Routers'), function() {
+                frm.call('enqueue_limit_push');
+            });
+        }
+
         // Format bandwidth fields on save
         ['speed_limit_rx', 'speed_limit_tx', 'burst_limit_rx', 'burst_limit_tx'].forEach(field => {
             frm.set_value_if_missing(field, '');
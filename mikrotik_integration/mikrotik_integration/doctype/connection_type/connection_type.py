@@ -4,6 +4,17 @@
 import frappe
 from frappe import _
 from frappe.model.document import Document
+from mikrotik_integration.mikrotik_integration.drivers import get_driver, is_missing_item_error
+from mikrotik_integration.mikrotik_integration.pcq import SHARED_PCQ, ensure_queue_objects
+from mikrotik_integration.mikrotik_integration.rate_limit import PRIORITY_BACKGROUND
+
+REPROFILE_BATCH_SIZE = 100
+REPROFILE_JOB_TIMEOUT = 3600
+# Fields whose change has to be pushed to the users already on the routers
+LIMIT_FIELDS = [
+    "profile_name", "parent_profile", "bandwidth_mode",
+    "speed_limit_rx", "speed_limit_tx", "burst_limit_rx", "burst_limit_tx"
+]
 
 
 class ConnectionType(Document):
@@ -13,6 +24,25 @@ class ConnectionType(Document):
         self.validate_parent_profile()
         self.validate_circular_inheritance()
 
+    def on_update(self):
+        """Push changed limits to the users of this type and of types inheriting from it"""
+        if self.get_doc_before_save() and any(self.has_value_changed(field) for field in LIMIT_FIELDS):
+            self.enqueue_limit_push()
+
+    @frappe.whitelist()
+    def enqueue_limit_push(self):
+        """Queue a push of the current limits to every affected router user"""
+        frappe.enqueue(
+            "mikrotik_integration.mikrotik_integration.doctype.connection_type.connection_type.push_connection_type_limits",
+            queue="long",
+            timeout=REPROFILE_JOB_TIMEOUT,
+            job_id=f"mikrotik_reprofile::{self.name}",
+            deduplicate=True,
+            enqueue_after_commit=True,
+            connection_type=self.name
+        )
+        frappe.msgprint(_("Updating router users with the new limits in the background"), alert=True)
+
     def validate_bandwidth_format(self):
         """Validate bandwidth limit formats"""
         for field in ['speed_limit_rx', 'speed_limit_tx', 'burst_limit_rx', 'burst_limit_tx']:
@@ -58,3 +88,156 @@ class ConnectionType(Document):
             'burst_limit_rx': self.get_inherited_value('burst_limit_rx'),
             'burst_limit_tx': self.get_inherited_value('burst_limit_tx')
         }
+
+    def get_user_limit_params(self, clear=False):
+        """RouterOS user parameters for the profile and bandwidth limits, with inheritance
+
+        In Shared PCQ mode the profile carries the limits, so users only get the
+        profile. `clear` blanks every limit that is not set, so pushing to
+        existing users also removes limits that were taken off or left from the
+        other mode.
+        """
+        params = {"profile": self.profile_name}
+        if self.bandwidth_mode == SHARED_PCQ:
+            if clear:
+                params.update({"rate-limit": "", "burst-limit": ""})
+            return params
+
+        limits = self.get_bandwidth_limits()
+        if limits.get("speed_limit_rx"):
+            params["rate-limit"] = f"{limits['speed_limit_rx']}/{limits['speed_limit_tx']}"
+        if limits.get("burst_limit_rx"):
+            params["burst-limit"] = f"{limits['burst_limit_rx']}/{limits['burst_limit_tx']}"
+        if clear:
+            params.setdefault("rate-limit", "")
+            params.setdefault("burst-limit", "")
+        return params
+
+
+def get_connection_type_tree(connection_type):
+    """Return a connection type and every type inheriting from it, directly or not"""
+    tree = [connection_type]
+    parents = [connection_type]
+    while parents:
+        children = frappe.get_all(
+            "Connection Type",
+            filters={"parent_profile": ["in", parents], "name": ["not in", tree]},
+            pluck="name"
+        )
+        tree.extend(children)
+        parents = children
+    return tree
+
+
+def push_connection_type_limits(connection_type):
+    """Push the limits of a connection type tree to its users, one router at a time"""
+    subscriptions = frappe.get_all(
+        "Customer Subscription",
+        filters={
+            "connection_type": ["in", get_connection_type_tree(connection_type)],
+            "docstatus": 1,
+            "status": ["in", ["Active", "Suspended"]],
+            "mikrotik_settings": ["is", "set"]
+        },
+        fields=["name", "mikrotik_settings"],
+        order_by="mikrotik_settings, name"
+    )
+    by_router = {}
+    for sub in subscriptions:
+        by_router.setdefault(sub.mikrotik_settings, []).append(sub.name)
+
+    totals = {"updated": 0, "missing": 0, "errors": 0}
+    progress = {"done": 0, "total": len(subscriptions)}
+
+    def report(count):
+        progress["done"] += count
+        frappe.publish_progress(
+            progress["done"] * 100 / (progress["total"] or 1),
+            title=_("Updating router users"),
+            doctype="Connection Type",
+            docname=connection_type,
+            description=_("{0} of {1} subscriptions").format(progress["done"], progress["total"])
+        )
+
+    for router_name, names in by_router.items():
+        try:
+            result = push_router_limits(router_name, names, report)
+        except Exception as e:
+            frappe.log_error(
+                f"Error pushing limits of {connection_type} to router {router_name}: {str(e)}",
+                "Connection Type Update Error"
+            )
+            frappe.db.rollback()
+            result = {"errors": len(names)}
+        for key, value in result.items():
+            totals[key] += value
+
+    frappe.publish_realtime("connection_type_limits_pushed", dict(totals, connection_type=connection_type))
+    return totals
+
+
+def push_router_limits(router_name, names, report=None):
+    """Set the current limits on one router's users over a single connection
+
+    Each batch sends a `set` for every user with a cached item ID before reading
+    any reply, so a batch costs about one round trip. Users without a usable ID
+    fall back to a lookup by name.
+    """
+    router = frappe.get_doc("MikroTik Settings", router_name)
+    api = router.get_api_connection(priority=PRIORITY_BACKGROUND)
+    result = {"updated": 0, "missing": 0, "errors": 0}
+    compiled = set()
+
+    try:
+        for start in range(0, len(names), REPROFILE_BATCH_SIZE):
+            batch = names[start:start + REPROFILE_BATCH_SIZE]
+            pending = []
+            changes = {}
+            for name in batch:
+                subscription = frappe.get_doc("Customer Subscription", name)
+                conn_type = frappe.get_cached_doc("Connection Type", subscription.connection_type)
+                if conn_type.name not in compiled:
+                    # The shared queues and profile must match before users are moved onto them
+                    ensure_queue_objects(api, router, conn_type, force=True)
+                    compiled.add(conn_type.name)
+                params = conn_type.get_user_limit_params(clear=True)
+                item_id = subscription.get_cached_item_id(router)
+                if item_id:
+                    driver = get_driver(api, conn_type.service_name)
+                    changes.setdefault(driver, []).append((name, item_id, params))
+                pending.append((subscription, conn_type, params))
+
+            # One pipelined `set` per driver for every user with a cached ID
+            errors = {}
+            for driver, items in changes.items():
+                outcomes = driver.set_many([(item_id, params) for _name, item_id, params in items])
+                errors.update((name, error) for (name, _item_id, _params), error in zip(items, outcomes))
+
+            for subscription, conn_type, params in pending:
+                try:
+                    if subscription.name in errors:
+                        error = errors[subscription.name]
+                        if not error:
+                            result["updated"] += 1
+                            continue
+                        if not is_missing_item_error(error):
+                            raise error
+
+                    if subscription.call_router_item(api, conn_type, "set", router=router, **params) is None:
+                        result["missing"] += 1
+                    else:
+                        result["updated"] += 1
+                except Exception as e:
+                    frappe.log_error(
+                        f"Error updating limits for subscription {subscription.name}: {str(e)}",
+                        "Connection Type Update Error"
+                    )
+                    result["errors"] += 1
+
+            frappe.db.commit()
+            if report:
+                report(len(batch))
+    finally:
+        api.close()
+
+    return result
@@ -5,6 +5,8 @@
 from frappe.tests.utils import FrappeTestCase
 import frappe
 
+from mikrotik_integration.mikrotik_integration.doctype.connection_type.connection_type import get_connection_type_tree
+
 
 class TestConnectionType(FrappeTestCase):
 	def setUp(self):
@@ -34,5 +36,64 @@ class TestConnectionType(FrappeTestCase):
 			profile.insert()
 			self.assertTrue(frappe.db.exists("Connection Type", profile.name))
 
+	def test_inherited_limit_params(self):
+		"""Child profiles push the limits they inherit"""
+		child = frappe.get_doc({
+			"doctype": "Connection Type",
+			"connection_code": "TEST_CHILD",
+			"service_name": "hotspot",
+			"profile_name": "test-child",
+			"parent_profile": self.test_profile.name,
+			"speed_limit_tx": "256K"
+		}).insert()
+
+		self.assertEqual(child.get_user_limit_params(), {
+			"profile": "test-child",
+			"rate-limit": "1M/256K"
+		})
+
+	def test_cleared_limits_are_pushed_blank(self):
+		"""Removing a limit clears it on existing users instead of leaving the old one"""
+		self.test_profile.speed_limit_rx = None
+		self.test_profile.speed_limit_tx = None
+		self.test_profile.save()
+
+		self.assertEqual(self.test_profile.get_user_limit_params(), {"profile": "test-profile"})
+		self.assertEqual(self.test_profile.get_user_limit_params(clear=True), {
+			"profile": "test-profile",
+			"rate-limit": "",
+			"burst-limit": ""
+		})
+
+	def test_set_limits_are_kept_when_clearing(self):
+		self.assertEqual(self.test_profile.get_user_limit_params(clear=True), {
+			"profile": "test-profile",
+			"rate-limit": "1M/512K",
+			"burst-limit": ""
+		})
+
+	def test_connection_type_tree(self):
+		"""All descendants of a profile are affected by its change"""
+		child = frappe.get_doc({
+			"doctype": "Connection Type",
+			"connection_code": "TEST_CHILD",
+			"service_name": "hotspot",
+			"profile_name": "test-child",
+			"parent_profile": self.test_profile.name
+		}).insert()
+		grandchild = frappe.get_doc({
+			"doctype": "Connection Type",
+			"connection_code": "TEST_GRANDCHILD",
+			"service_name": "hotspot",
+			"profile_name": "test-grandchild",
+			"parent_profile": child.name
+		}).insert()
+
+		self.assertEqual(
+			set(get_connection_type_tree(self.test_profile.name)),
+			{self.test_profile.name, child.name, grandchild.name}
+		)
+		self.assertEqual(get_connection_type_tree(grandchild.name), [grandchild.name])
+
 	def tearDown(self):
 		frappe.db.rollback()
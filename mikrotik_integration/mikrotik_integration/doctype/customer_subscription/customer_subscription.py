@@ -4,10 +4,43 @@
 import frappe
 from frappe import _
 from frappe.model.document import Document
-from frappe.utils import add_days, now, random_string, today
-from rq.decorators import job
+from frappe.utils import add_days, cint, flt, now, random_string, today
+from mikrotik_integration.mikrotik_integration.analytics import record_usage_snapshot
+from mikrotik_integration.mikrotik_integration.api import ACTIVE_USER_SORT_FIELDS, is_router_unreachable
+from mikrotik_integration.mikrotik_integration.batching import (
+    CommitPolicy,
+    after_row,
+    get_chunk_size,
+    iter_chunks,
+    iter_rows,
+)
+from mikrotik_integration.mikrotik_integration.drivers import get_driver, is_missing_item_error
+from mikrotik_integration.mikrotik_integration.listener import get_listening_routers
+from mikrotik_integration.mikrotik_integration.log_volume import log_router_error, log_router_success
+from mikrotik_integration.mikrotik_integration.pcq import ensure_queue_objects
+from mikrotik_integration.mikrotik_integration.placement import pick_router
+from mikrotik_integration.mikrotik_integration.portal import record_daily_usage
+from mikrotik_integration.mikrotik_integration.rate_limit import PRIORITY_BACKGROUND
+from mikrotik_integration.mikrotik_integration.sharding import fan_out
+from mikrotik_integration.mikrotik_integration.doctype.mikrotik_router_counter.mikrotik_router_counter import (
+    COUNTER_FIELDS,
+    apply_row_change,
+)
+from mikrotik_integration.mikrotik_integration.doctype.mikrotik_router_operation.mikrotik_router_operation import (
+    enqueue_outbox_drain,
+    has_pending_operations,
+    queue_router_operation,
+)
+from mikrotik_integration.mikrotik_integration.doctype.mikrotik_settings.mikrotik_settings import RouterUnreachableError
+from mikrotik_integration.mikrotik_integration.doctype.subscription_payment_activation.subscription_payment_activation import (
+    queue_payment_activation,
+)
+import itertools
 import json
 
+# Narrow rows read by the usage sync; counter fields let it update counters without a save
+USAGE_SYNC_FIELDS = COUNTER_FIELDS + ["username_mikrotik", "connection_type", "internet_plan", "last_login"]
+
 class CustomerSubscription(Document):
     def validate_dates(self):
         """Validate and set dates"""
@@ -36,12 +69,18 @@ class CustomerSubscription(Document):
         if not self.password_mikrotik:
             self.password_mikrotik = random_string(10)
 
+    def set_router(self):
+        """Place a new subscription on the least loaded router if none was picked"""
+        if not self.mikrotik_settings and self.docstatus == 0:
+            self.mikrotik_settings = pick_router()
+
     def validate(self):
         """Validate subscription details"""
         self.validate_dates()
         self.validate_customer()
         self.set_subscription_id()
         self.set_credentials()
+        self.set_router()
 
     def before_submit(self):
         """Before activating subscription"""
@@ -57,47 +96,47 @@ class CustomerSubscription(Document):
         self.remove_mikrotik_user()
         self.status = "Expired"
 
-    def provision_mikrotik_user(self):
-        """Create user in MikroTik router"""
+    def provision_mikrotik_user(self, api=None):
+        """Create user in MikroTik router
+
+        Pass `api` to reuse an open connection, e.g. when activating a batch of
+        subscriptions on the same router.
+        """
+        if self.defer_router_operation("provision"):
+            return
+
+        shared_api = api is not None
         try:
             router = frappe.get_doc("MikroTik Settings", self.mikrotik_settings)
             conn_type = frappe.get_doc("Connection Type", self.connection_type)
             
             # Get API connection
-            api = router.get_api_connection()
-            
-            # Prepare command based on connection type
-            if conn_type.service_name == "hotspot":
-                cmd = "/ip hotspot user add"
-            elif conn_type.service_name in ["pppoe", "l2tp", "pptp"]:
-                cmd = "/ppp secret add"
-            elif conn_type.service_name == "openvpn":
-                cmd = "/interface ovpn-server user add"
-            else:
-                frappe.throw(_("Unsupported connection type: {0}").format(conn_type.service_name))
-
-            # Get bandwidth limits
-            limits = conn_type.get_bandwidth_limits()
+            api = api or router.get_api_connection()
             
-            # Build parameters
-            params = {
-                "name": self.username_mikrotik,
-                "password": self.password_mikrotik,
-                "profile": conn_type.profile_name
-            }
-            
-            if conn_type.service_name in ["pppoe", "l2tp", "pptp"]:
-                params["service"] = conn_type.service_name
-            
-            # Apply bandwidth limits if not using profile
-            if not conn_type.parent_profile:
-                if limits.get("speed_limit_rx"):
-                    params["rate-limit"] = f"{limits['speed_limit_rx']}/{limits['speed_limit_tx']}"
-                if limits.get("burst_limit_rx"):
-                    params["burst-limit"] = f"{limits['burst_limit_rx']}/{limits['burst_limit_tx']}"
+            # Resolve the service driver for the connection type
+            driver = get_driver(api, conn_type.service_name)
+
+            # Shared PCQ types need their queues and profile on the router first
+            ensure_queue_objects(api, router, conn_type)
+
+            # Build parameters, with the profile and limits resolved through parent profiles
+            params = driver.build_user(
+                conn_type.service_name,
+                self.username_mikrotik,
+                self.password_mikrotik,
+                **conn_type.get_user_limit_params()
+            )
 
             # Execute command
-            api.get_resource(cmd).add(**params)
+            item_id = driver.add_many([params])[0]
+            if isinstance(item_id, Exception):
+                # A retried activation may find the user it created last time
+                if "already have" not in str(item_id):
+                    raise item_id
+                item_id = self.lookup_item_id(driver)
+
+            # Remember the item so later set/remove calls skip the lookup
+            self.cache_item_id(item_id, router)
             
             # Log success
             self.create_api_log(
@@ -107,9 +146,14 @@ class CustomerSubscription(Document):
                 status="Success"
             )
             
-            api.close()
+            if not shared_api:
+                api.close()
             
         except Exception as e:
+            # Keep the change for the router outbox while the router is down
+            if self.defer_router_operation("provision", e):
+                return
+
             # Log failure with proper JSON
             error_details = {
                 "error": str(e),
@@ -121,69 +165,195 @@ class CustomerSubscription(Document):
                 router=self.mikrotik_settings,
                 operation="add_user_failed",
                 parameters=json.dumps(error_details),
-                status="Failed"
+                status="Failed",
+                error=e
             )
-            frappe.throw(_("Failed to provision MikroTik user: {0}").format(str(e)))
+            frappe.throw(_("Failed to provision MikroTik user: {0}").format(str(e)), get_router_exception(e))
 
-    def remove_mikrotik_user(self):
+    def remove_mikrotik_user(self, api=None):
         """Remove user from MikroTik router"""
+        if self.defer_router_operation("remove"):
+            return
+
+        shared_api = api is not None
         try:
             router = frappe.get_doc("MikroTik Settings", self.mikrotik_settings)
             conn_type = frappe.get_doc("Connection Type", self.connection_type)
             
             # Get API connection
-            api = router.get_api_connection()
+            api = api or router.get_api_connection()
             
-            # Prepare command based on connection type
-            if conn_type.service_name == "hotspot":
-                cmd = "/ip hotspot user remove"
-                filter_cmd = "/ip hotspot user print where name="
-            elif conn_type.service_name in ["pppoe", "l2tp", "pptp"]:
-                cmd = "/ppp secret remove"
-                filter_cmd = "/ppp secret print where name="
-            elif conn_type.service_name == "openvpn":
-                cmd = "/interface ovpn-server user remove"
-                filter_cmd = "/interface ovpn-server user print where name="
-            else:
-                frappe.throw(_("Unsupported connection type: {0}").format(conn_type.service_name))
-
-            # Find user
-            users = api.get_resource(filter_cmd).get(name=self.username_mikrotik)
-            if users:
-                # Remove user
-                api.get_resource(cmd).remove(id=users[0].get("id"))
-                
+            # Remove user by its cached item ID, looking it up only if needed
+            if self.call_router_item(api, conn_type, "remove", router=router) is not None:
                 # Log success
                 self.create_api_log(
                     router=self.mikrotik_settings,
                     operation=f"remove_user_{conn_type.service_name}",
-                    parameters=self.username_mikrotik,
+                    parameters=json.dumps({"username": self.username_mikrotik}),
                     status="Success"
                 )
+            self.cache_item_id(None)
             
-            api.close()
+            if not shared_api:
+                api.close()
             
         except Exception as e:
+            if self.defer_router_operation("remove", e):
+                return
+
             # Log failure
             self.create_api_log(
                 router=self.mikrotik_settings,
                 operation="remove_user_failed",
-                parameters=str(e),
-                status="Failed"
+                parameters=json.dumps({"error": str(e), "username": self.username_mikrotik}),
+                status="Failed",
+                error=e
+            )
+            frappe.throw(_("Failed to remove MikroTik user: {0}").format(str(e)), get_router_exception(e))
+
+    def set_mikrotik_user_disabled(self, disabled, api=None):
+        """Disable or enable the router user in place with a single `set`
+
+        Keeps the user and its counters on the router. Returns False if the user
+        does not exist there, e.g. it was suspended in Remove mode. A change
+        queued in the router outbox counts as done.
+        """
+        if self.defer_router_operation("disable" if disabled else "enable"):
+            return True
+
+        shared_api = api is not None
+        operation = "disable_user" if disabled else "enable_user"
+        try:
+            router = frappe.get_doc("MikroTik Settings", self.mikrotik_settings)
+            conn_type = frappe.get_cached_doc("Connection Type", self.connection_type)
+            api = api or router.get_api_connection()
+
+            found = self.call_router_item(
+                api, conn_type, "set", router=router, disabled="yes" if disabled else "no"
+            ) is not None
+            if found:
+                self.create_api_log(
+                    router=self.mikrotik_settings,
+                    operation=f"{operation}_{conn_type.service_name}",
+                    parameters=json.dumps({"username": self.username_mikrotik}),
+                    status="Success"
+                )
+
+            if not shared_api:
+                api.close()
+            return found
+
+        except Exception as e:
+            if self.defer_router_operation("disable" if disabled else "enable", e):
+                return True
+
+            self.create_api_log(
+                router=self.mikrotik_settings,
+                operation=f"{operation}_failed",
+                parameters=json.dumps({"error": str(e), "username": self.username_mikrotik}),
+                status="Failed",
+                error=e
             )
-            frappe.throw(_("Failed to remove MikroTik user: {0}").format(str(e)))
-
-    def create_api_log(self, router, operation, parameters, status):
-        """Create an API Log entry"""
-        log = frappe.get_doc({
-            "doctype": "MikroTik API Log",
-            "router": router,
-            "operation": operation,
-            "parameters": parameters,
-            "response": "",  # Can be updated if needed
-            "status": status
-        })
-        log.insert(ignore_permissions=True)
+            frappe.throw(_("Failed to update MikroTik user: {0}").format(str(e)), get_router_exception(e))
+
+    def defer_router_operation(self, operation, error=None):
+        """Queue a router change in the router outbox instead of running it now
+
+        Changes are queued when the router cannot be reached, and also while
+        earlier changes of this subscription are still queued, so they replay in
+        order. Returns True if the change was queued.
+        """
+        if self.flags.from_router_outbox or not self.mikrotik_settings:
+            return False
+
+        if error is not None:
+            if not is_router_unreachable(error):
+                return False
+        elif not self.flags.router_unreachable and not has_pending_operations(self.mikrotik_settings, self.name):
+            return False
+
+        # The connection error shown so far is not the outcome any more
+        frappe.clear_last_message()
+        queue_router_operation(self.mikrotik_settings, self.name, operation)
+        enqueue_outbox_drain(self.mikrotik_settings)
+        return True
+
+    def kick_active_sessions(self, api):
+        """Disconnect the user's active sessions so a suspension applies immediately"""
+        try:
+            service_name = frappe.get_cached_value("Connection Type", self.connection_type, "service_name")
+            get_driver(api, service_name).kick([self.username_mikrotik])
+        except Exception as e:
+            # The user is already disabled; the session just lasts until it drops
+            frappe.log_error(f"Error disconnecting sessions for subscription {self.name}: {str(e)}")
+
+    def get_cached_item_id(self, router=None):
+        """Return the stored RouterOS `.id` if it still belongs to the current router"""
+        if not self.mikrotik_item_id or self.mikrotik_item_router != self.mikrotik_settings:
+            return None
+
+        router = router or frappe.get_cached_doc("MikroTik Settings", self.mikrotik_settings)
+        if cint(self.mikrotik_item_generation) != cint(router.router_generation):
+            # The router was reset or replaced since the ID was stored
+            return None
+        return self.mikrotik_item_id
+
+    def cache_item_id(self, item_id, router=None):
+        """Store the RouterOS `.id` of this subscription's user, or clear it"""
+        generation = 0
+        if item_id:
+            router = router or frappe.get_cached_doc("MikroTik Settings", self.mikrotik_settings)
+            generation = cint(router.router_generation)
+
+        values = {
+            "mikrotik_item_id": item_id,
+            "mikrotik_item_router": self.mikrotik_settings if item_id else None,
+            "mikrotik_item_generation": generation
+        }
+        if self.is_new():
+            self.update(values)
+        else:
+            self.db_set(values, update_modified=False)
+
+    def lookup_item_id(self, driver):
+        """Find this subscription's user on the router by name"""
+        user = driver.list([self.username_mikrotik]).get(self.username_mikrotik)
+        return user.get("id") if user else None
+
+    def call_router_item(self, api, conn_type, command, router=None, **params):
+        """Run `set` or `remove` on this subscription's router user
+
+        Uses the cached `.id` directly. If the router no longer knows that ID, the
+        user is looked up by name and the cache refreshed. Returns the item ID
+        used, or None when the user does not exist on the router.
+        """
+        driver = get_driver(api, conn_type.service_name)
+
+        item_id = self.get_cached_item_id(router)
+        if item_id:
+            error = run_driver_command(driver, command, item_id, params)
+            if not error:
+                return item_id
+            if not is_missing_item_error(error):
+                raise error
+
+        item_id = self.lookup_item_id(driver)
+        if not item_id:
+            self.cache_item_id(None)
+            return None
+
+        error = run_driver_command(driver, command, item_id, params)
+        if error:
+            raise error
+        self.cache_item_id(None if command == "remove" else item_id, router)
+        return item_id
+
+    def create_api_log(self, router, operation, parameters, status, error=None):
+        """Create an API Log entry, sampling successes and counting repeated failures on one entry"""
+        if status == "Failed":
+            log_router_error(router, operation, error, parameters)
+        else:
+            log_router_success(router, operation, parameters)
 
     def get_valid_status(self):
         """Check if subscription is valid based on dates and quota"""
@@ -217,23 +387,60 @@ class CustomerSubscription(Document):
     @frappe.whitelist()
     def suspend(self):
         """Suspend subscription"""
+        self._suspend()
+
+    def _suspend(self, api=None, kick_sessions=True):
+        """Suspend over a shared connection if one is passed
+
+        Disables the router user, or removes it if the router is set to the
+        Remove suspension mode, and disconnects its active sessions. Batch
+        callers pass `kick_sessions=False` and disconnect everyone in one pass.
+        """
         if self.status != "Active":
             frappe.throw(_("Can only suspend active subscriptions"))
-            
-        self.remove_mikrotik_user()
+
+        router = frappe.get_doc("MikroTik Settings", self.mikrotik_settings)
+        operation = "remove" if router.suspension_mode == "Remove" else "disable"
+        shared_api = api is not None
+        if not shared_api and not self.defer_router_operation(operation):
+            try:
+                api = router.get_api_connection()
+            except Exception as e:
+                if not self.defer_router_operation(operation, e):
+                    raise
+
+        if api:
+            try:
+                if operation == "remove":
+                    self.remove_mikrotik_user(api=api)
+                else:
+                    self.set_mikrotik_user_disabled(True, api=api)
+
+                if cint(kick_sessions):
+                    self.kick_active_sessions(api)
+            finally:
+                if not shared_api:
+                    api.close()
+
         self.status = "Suspended"
         self.save()
 
     @frappe.whitelist()
     def reactivate(self):
         """Reactivate suspended subscription"""
+        self._reactivate()
+
+    def _reactivate(self, api=None):
+        """Reactivate over a shared connection if one is passed"""
         if self.status != "Suspended":
             frappe.throw(_("Can only reactivate suspended subscriptions"))
             
         if not self.get_valid_status():
             frappe.throw(_("Subscription has expired or exceeded quota"))
             
-        self.provision_mikrotik_user()
+        # A disabled user comes back with one `set`; a removed one is added again
+        if not self.set_mikrotik_user_disabled(False, api=api):
+            self.provision_mikrotik_user(api=api)
         self.status = "Active"
         self.save()
 
@@ -265,48 +472,58 @@ class CustomerSubscription(Document):
             frappe.log_error(f"M-Pesa payment error for subscription {self.name}: {str(e)}")
             return {"success": False, "message": str(e)}
 
-    def handle_payment_success(self, payment_reference=None, payment_type="M-Pesa"):
-        """Centralized payment success handler"""
-        try:
-            self.payment_status = "Completed"
-            self.payment_date = now()
-            
-            if payment_type == "M-Pesa":
-                self.mpesa_transaction_id = payment_reference
-            elif payment_type == "Invoice":
-                self.billing_invoice = payment_reference
-
-            if self.status == "Draft":
-                self.status = "Active"
-                self.provision_mikrotik_user()
-                self.broadcast_status_update("active", f"Service activated after {payment_type} payment")
-            elif self.status == "Suspended":
-                self.reactivate()
-                self.broadcast_status_update("reactivated", f"Service reactivated after {payment_type} payment")
-
-            self.save()
-            return True
+    def handle_payment_success(self, payment_reference=None, payment_type="M-Pesa", api=None):
+        """Centralized payment success handler
 
-        except Exception as e:
-            frappe.log_error(f"Error processing {payment_type} payment for subscription {self.name}: {str(e)}")
-            return False
+        Errors are raised to the caller, which rolls back and keeps them, so
+        nothing logged here is lost with the rollback.
+        """
+        self.payment_status = "Completed"
+        self.payment_date = now()
+
+        if payment_type == "M-Pesa":
+            self.mpesa_transaction_id = payment_reference
+        elif payment_type == "Invoice":
+            self.billing_invoice = payment_reference
+
+        if self.status == "Draft":
+            self.status = "Active"
+            self.provision_mikrotik_user(api=api)
+            self.broadcast_status_update("active", f"Service activated after {payment_type} payment")
+        elif self.status == "Suspended":
+            self._reactivate(api=api)
+            self.broadcast_status_update("reactivated", f"Service reactivated after {payment_type} payment")
+
+        self.save()
+        return True
 
     def on_payment_authorized(self, payment_doc):
-        """Called by frappe-mpsa-payments when payment is authorized"""
-        return self.handle_payment_success(payment_doc.trans_id, "M-Pesa")
+        """Called by frappe-mpsa-payments when payment is authorized
+
+        Only records the payment; provisioning happens in the activation worker.
+        """
+        return queue_payment_activation(self.name, payment_doc.trans_id, "M-Pesa")
 
     def broadcast_status_update(self, event_type, message):
-        """Broadcast real-time status update"""
-        try:
-            frappe.publish_realtime(f'subscription_{self.name}_update', {
-                'event': event_type,
-                'message': message,
-                'subscription_id': self.name,
-                'status': self.status,
-                'timestamp': now()
-            })
-        except Exception as e:
-            frappe.log_error(f"Error broadcasting status update: {str(e)}")
+        """Broadcast real-time status update once the change is committed
+
+        Inside a batch job's row nothing is sent unless the row succeeds.
+        """
+        update = {
+            'event': event_type,
+            'message': message,
+            'subscription_id': self.name,
+            'status': self.status,
+            'timestamp': now()
+        }
+
+        def publish():
+            try:
+                frappe.publish_realtime(f'subscription_{self.name}_update', update, after_commit=True)
+            except Exception as e:
+                frappe.log_error(f"Error broadcasting status update: {str(e)}")
+
+        after_row(publish)
 
     def on_update(self):
         """Handle subscription updates"""
@@ -325,110 +542,324 @@ class CustomerSubscription(Document):
 @frappe.whitelist()
 def sync_usage_data():
     """Sync usage data for active subscriptions"""
-    active = frappe.get_all(
-        "Customer Subscription",
-        filters={
-            "status": "Active"
-        },
-        fields=["name", "username_mikrotik", "connection_type", 
-                "mikrotik_settings", "internet_plan"]
+    return fan_out(
+        "sync_usage_data",
+        "mikrotik_integration.mikrotik_integration.doctype.customer_subscription.customer_subscription.sync_router_usage",
+        get_subscription_routers({"status": "Active"})
     )
-    
-    for sub in active:
-        try:
-            subscription = frappe.get_doc("Customer Subscription", sub.name)
-            router = frappe.get_doc("MikroTik Settings", subscription.mikrotik_settings)
-            conn_type = frappe.get_doc("Connection Type", subscription.connection_type)
-            
-            # Get API connection
-            api = router.get_api_connection()
-            
-            # Get usage data
-            usage = frappe.get_doc("mikrotik_integration.api.mikrotik_api").get_usage(
-                api, conn_type, subscription.username_mikrotik
-            )
-            
-            # Update subscription
-            if usage:
-                subscription.data_used_mb = usage.get("data_used_mb", 0)
-                if usage.get("last_login"):
-                    subscription.last_login = usage["last_login"]
-                
-                # Check quota
-                plan = frappe.get_doc("Internet Plan", subscription.internet_plan)
-                if (plan.data_quota_mb and 
-                    subscription.data_used_mb >= plan.data_quota_mb):
-                    subscription.suspend()
-                
-                subscription.save()
-                
-                # Update last sync time on router
-                router.last_sync = now()
-                router.save()
-            
-            api.close()
-            frappe.db.commit()
-            
-        except Exception as e:
-            frappe.log_error(
-                f"Error syncing usage for subscription {sub.name}: {str(e)}",
-                "Usage Sync Error"
-            )
-            frappe.db.rollback()
+
+def sync_router_usage(router_name):
+    """Sync usage data for the active subscriptions on one router
+
+    Subscriptions are read in chunks of narrow rows. Only rows whose usage
+    changed are written, in place, unless the change breaks the plan's quota.
+    """
+    filters = {"status": "Active", "mikrotik_settings": router_name}
+    result = {"scanned": 0, "changed": 0, "errors": 0}
+    if not frappe.db.exists("Customer Subscription", filters):
+        return result
+
+    router = frappe.get_doc("MikroTik Settings", router_name)
+    api = router.get_api_connection(priority=PRIORITY_BACKGROUND)
+    commits = CommitPolicy()
+    # Every reading of this run, kept for the fleet usage analytics
+    readings = {}
+    try:
+        for chunk in iter_chunks("Customer Subscription", filters, USAGE_SYNC_FIELDS):
+            # Usage of every user in one batch per service instead of a lookup per user
+            usages = get_router_users(api, chunk, usage=True)
+            result["scanned"] += len(chunk)
+
+            for sub in chunk:
+                try:
+                    with commits.row():
+                        service_name = get_service_name(sub.connection_type)
+                        usage = usages.get((service_name, sub.username_mikrotik))
+                        if usage:
+                            readings[sub.name] = flt(usage.get("data_used_mb"))
+                        if update_usage(sub, usage):
+                            result["changed"] += 1
+                except Exception as e:
+                    # A router going down fails every subscription alike, so repeats are only counted
+                    log_row_error(commits, router_name, "sync_usage", e, sub.name, "Usage Sync Error")
+                    result["errors"] += 1
+    finally:
+        api.close()
+
+    record_usage_snapshot(router_name, readings)
+    # Update last sync time on router
+    frappe.db.set_value("MikroTik Settings", router_name, "last_sync", now(), update_modified=False)
+    commits.commit()
+    return result
+
+def log_row_error(commits, router_name, operation, error, subscription, title):
+    """Log a failed row of a batch job, committing a new log entry at once
+
+    The entry is what a window of repeats is counted on; left in the batch's
+    transaction, a rollback would take it and the repeats would be lost.
+    """
+    if log_router_error(
+        router_name, operation, error,
+        {"subscription": subscription, "error": str(error)},
+        title=title
+    ):
+        commits.commit()
+
+def update_usage(sub, usage):
+    """Write a subscription's usage from the router, returning whether it changed"""
+    if not usage:
+        return False
+
+    values = {"data_used_mb": flt(usage.get("data_used_mb"))}
+    if usage.get("last_login"):
+        values["last_login"] = usage["last_login"]
+    # Compared at a precision the database keeps, so a stored value reads back equal
+    if (flt(values["data_used_mb"], 6) == flt(sub.data_used_mb, 6)
+            and values.get("last_login", sub.last_login) == sub.last_login):
+        return False
+
+    record_daily_usage(sub.name, values["data_used_mb"])
+    plan_quota = frappe.get_cached_value("Internet Plan", sub.internet_plan, "data_quota_mb")
+    if plan_quota and values["data_used_mb"] >= plan_quota:
+        # Over quota: suspend through the document so the router user is disabled too
+        subscription = frappe.get_doc("Customer Subscription", sub.name)
+        subscription.update(values)
+        subscription.suspend()
+        return True
+
+    frappe.db.set_value("Customer Subscription", sub.name, values, update_modified=False)
+    apply_row_change(sub, dict(sub, **values))
+    return True
 
 @frappe.whitelist()
 def process_expired_subscriptions():
     """Process expired subscriptions"""
-    expired = frappe.get_all(
+    return fan_out(
+        "process_expired_subscriptions",
+        "mikrotik_integration.mikrotik_integration.doctype.customer_subscription.customer_subscription.process_router_expired_subscriptions",
+        get_subscription_routers({"status": "Active", "expiry_date": ["<=", today()]})
+    )
+
+def process_router_expired_subscriptions(router_name):
+    """Suspend the expired subscriptions on one router"""
+    expired = iter_rows(
         "Customer Subscription",
         filters={
             "status": "Active",
-            "expiry_date": ["<=", today()]
+            "expiry_date": ["<=", today()],
+            "mikrotik_settings": router_name
+        }
+    )
+    return update_router_suspensions(
+        router_name, (row.name for row in expired), event=("expired", "Subscription expired")
+    )
+
+def update_router_suspensions(router_name, names, suspend=True, event=None):
+    """Suspend or reactivate subscriptions on one router over a single connection
+
+    `names` may be any iterable, e.g. a chunked query, and is consumed once.
+    Work is committed in batches. Sessions of the suspended users are
+    disconnected a chunk at a time with one pass over the router's active tables.
+    """
+    result = {"scanned": 0, "changed": 0, "errors": 0}
+    names = iter(names)
+    first = next(names, None)
+    if first is None:
+        return result
+
+    try:
+        api = frappe.get_doc("MikroTik Settings", router_name).get_api_connection(priority=PRIORITY_BACKGROUND)
+    except Exception as e:
+        if not is_router_unreachable(e):
+            raise
+        # Record the changes and leave the router work to the router outbox
+        frappe.clear_last_message()
+        api = None
+
+    commits = CommitPolicy()
+    to_kick = {}
+
+    def kick_suspended():
+        for service_name, usernames in to_kick.items():
+            try:
+                get_driver(api, service_name).kick(usernames)
+            except Exception as e:
+                frappe.log_error(f"Error disconnecting suspended users on router {router_name}: {str(e)}")
+        to_kick.clear()
+
+    try:
+        for name in itertools.chain((first,), names):
+            result["scanned"] += 1
+            try:
+                with commits.row():
+                    subscription = frappe.get_doc("Customer Subscription", name)
+                    subscription.flags.router_unreachable = api is None
+                    if suspend:
+                        subscription._suspend(api=api, kick_sessions=False)
+                        if api:
+                            service_name = get_service_name(subscription.connection_type)
+                            to_kick.setdefault(service_name, []).append(subscription.username_mikrotik)
+                    else:
+                        subscription._reactivate(api=api)
+                    if event:
+                        subscription.broadcast_status_update(*event)
+                result["changed"] += 1
+            except Exception as e:
+                log_row_error(
+                    commits, router_name, "suspend" if suspend else "reactivate", e, name,
+                    "Subscription Suspension Error"
+                )
+                result["errors"] += 1
+
+            if sum(len(usernames) for usernames in to_kick.values()) >= get_chunk_size():
+                kick_suspended()
+
+        commits.commit()
+        kick_suspended()
+    finally:
+        if api:
+            api.close()
+
+    return result
+
+@frappe.whitelist()
+def bulk_update_suspension(names, suspend=1):
+    """Suspend or reactivate a list of subscriptions, one connection per router"""
+    if isinstance(names, str):
+        names = frappe.parse_json(names)
+    suspend = cint(suspend)
+
+    for name in names:
+        frappe.has_permission("Customer Subscription", "write", name, throw=True)
+
+    subscriptions = frappe.get_all(
+        "Customer Subscription",
+        filters={
+            "name": ["in", names],
+            "docstatus": 1,
+            "status": "Active" if suspend else "Suspended",
+            "mikrotik_settings": ["is", "set"]
         },
-        fields=["name"]
+        fields=["name", "mikrotik_settings"]
     )
-    
-    for sub in expired:
-        try:
-            subscription = frappe.get_doc("Customer Subscription", sub.name)
-            subscription.suspend()
-            subscription.broadcast_status_update('expired', 'Subscription expired')
-            frappe.db.commit()
-        except Exception as e:
-            frappe.log_error(
-                f"Error processing expired subscription {sub.name}: {str(e)}",
-                "Subscription Expiry Error"
-            )
-            frappe.db.rollback()
+    by_router = {}
+    for sub in subscriptions:
+        by_router.setdefault(sub.mikrotik_settings, []).append(sub.name)
+
+    totals = {"scanned": 0, "changed": 0, "errors": 0}
+    event = ("suspended", "Service suspended") if suspend else ("reactivated", "Service reactivated")
+    for router_name, router_names in by_router.items():
+        result = update_router_suspensions(router_name, router_names, suspend=suspend, event=event)
+        for key, value in result.items():
+            totals[key] += value
+    return totals
 
-@job('short', timeout=1500)
 def sync_router_status():
-    """Sync router status for all active subscriptions"""
-    active_subs = frappe.get_all(
+    """Sync router status for all active subscriptions
+
+    Only dispatches per-router jobs; overlapping runs and per-router polling
+    intervals are handled by the sharding and scheduling layer.
+    """
+    filters = {"status": ["in", ["Active", "Suspended"]]}
+
+    # Routers with a live event listener already push status changes as they happen
+    listening = get_listening_routers()
+    if listening:
+        filters["mikrotik_settings"] = ["not in", list(listening)]
+
+    return fan_out(
+        "sync_router_status",
+        "mikrotik_integration.mikrotik_integration.doctype.customer_subscription.customer_subscription.sync_router_user_status",
+        get_subscription_routers(filters)
+    )
+
+def sync_router_user_status(router_name):
+    """Sync router status for the subscriptions on one router, a chunk at a time"""
+    filters = {
+        "status": ["in", ["Active", "Suspended"]],
+        "mikrotik_settings": router_name
+    }
+    result = {"scanned": 0, "changed": 0, "errors": 0}
+    if not frappe.db.exists("Customer Subscription", filters):
+        return result
+
+    router = frappe.get_doc("MikroTik Settings", router_name)
+    api = router.get_api_connection(priority=PRIORITY_BACKGROUND)
+    commits = CommitPolicy()
+    try:
+        fields = ["name", "mikrotik_settings", "username_mikrotik", "connection_type", "status"]
+        for chunk in iter_chunks("Customer Subscription", filters, fields):
+            # Every user's state in one batch per service instead of a lookup per user
+            router_users = get_router_users(api, chunk)
+            result["scanned"] += len(chunk)
+
+            for sub in chunk:
+                try:
+                    with commits.row():
+                        service_name = get_service_name(sub.connection_type)
+
+                        # Check actual status in router
+                        user = router_users.get((service_name, sub.username_mikrotik))
+                        router_status = "Not Found"
+                        if user:
+                            router_status = "Suspended" if user.get("disabled") == "true" else "Active"
+
+                        # Sync status if different
+                        if router_status in ("Active", "Suspended") and router_status != sub.status:
+                            subscription = frappe.get_doc("Customer Subscription", sub.name)
+                            subscription.status = router_status
+                            subscription.save()
+                            subscription.broadcast_status_update(
+                                'router_sync', f'Status synced from router: {router_status}'
+                            )
+                            result["changed"] += 1
+                except Exception as e:
+                    log_row_error(commits, router_name, "sync_status", e, sub.name, "Router Status Sync Error")
+                    result["errors"] += 1
+    finally:
+        api.close()
+
+    commits.commit()
+    return result
+
+def get_router_users(api, subscriptions, usage=False):
+    """Router users of subscriptions keyed by (service, username), with one batch per service
+
+    With `usage` the driver's usage snapshot is returned instead of the raw rows.
+    """
+    by_service = {}
+    for sub in subscriptions:
+        service_name = get_service_name(sub.connection_type)
+        by_service.setdefault(service_name, []).append(sub.username_mikrotik)
+
+    users = {}
+    for service_name, usernames in by_service.items():
+        driver = get_driver(api, service_name)
+        found = driver.usage_snapshot(usernames) if usage else driver.list(usernames)
+        users.update(((service_name, username), row) for username, row in found.items())
+    return users
+
+def get_service_name(connection_type):
+    return frappe.get_cached_value("Connection Type", connection_type, "service_name")
+
+def run_driver_command(driver, command, item_id, params):
+    """Run `set` or `remove` on one router user, returning the error if it failed"""
+    if command == "remove":
+        return driver.remove_many([item_id])[0]
+    return driver.set_many([(item_id, params)])[0]
+
+def get_router_exception(error):
+    """Exception class to re-raise a router error with, keeping unreachable routers recognisable"""
+    return RouterUnreachableError if is_router_unreachable(error) else frappe.ValidationError
+
+def get_subscription_routers(filters):
+    """Return the routers that hold at least one subscription matching filters"""
+    return frappe.get_all(
         "Customer Subscription",
-        filters={"status": ["in", ["Active", "Suspended"]]},
-        fields=["name", "mikrotik_settings", "username_mikrotik", "status"]
+        filters=filters,
+        pluck="mikrotik_settings",
+        distinct=True
     )
-    
-    for sub in active_subs:
-        try:
-            subscription = frappe.get_doc("Customer Subscription", sub.name)
-            router = frappe.get_doc("MikroTik Settings", subscription.mikrotik_settings)
-            
-            # Check actual status in router
-            router_status = router.check_user_status(subscription.username_mikrotik)
-            
-            # Sync status if different
-            if router_status != subscription.status:
-                subscription.status = router_status
-                subscription.save()
-                subscription.broadcast_status_update('router_sync', f'Status synced from router: {router_status}')
-                
-            frappe.db.commit()
-            
-        except Exception as e:
-            frappe.log_error(f"Error syncing router status for {sub.name}: {str(e)}")
-            frappe.db.rollback()
 
 @frappe.whitelist()
 def handle_invoice_submission(doc, method=None):
@@ -442,8 +873,7 @@ def handle_invoice_submission(doc, method=None):
             subscription = frappe.get_doc("Customer Subscription", subscription_id)
             
             if doc.docstatus == 1:  # On Submit
-                if not subscription.handle_payment_success(doc.name, "Invoice"):
-                    frappe.throw(_("Failed to process subscription payment"))
+                subscription.handle_payment_success(doc.name, "Invoice")
             elif doc.docstatus == 2:  # On Cancel
                 frappe.throw(_("Cannot cancel invoice linked to active subscription"))
             
@@ -454,6 +884,34 @@ def handle_invoice_submission(doc, method=None):
         )
         raise
 
+def on_payment_authorized(doc, method=None):
+    """Record an authorized M-Pesa payment and queue the subscription's activation
+
+    Called for Mpesa Express Request and Mpesa C2B Register documents. Duplicate
+    callbacks for the same transaction are ignored.
+    """
+    subscription = get_subscription_for_payment(doc)
+    if not subscription:
+        frappe.log_error(
+            f"No subscription found for M-Pesa transaction {doc.get('trans_id')} ({doc.doctype} {doc.name})",
+            "M-Pesa Payment Error"
+        )
+        return False
+
+    return queue_payment_activation(subscription, doc.get("trans_id"), "M-Pesa")
+
+def get_subscription_for_payment(payment_doc):
+    """Find the subscription an M-Pesa document pays for"""
+    if payment_doc.get("reference_doctype") == "Customer Subscription" and payment_doc.get("reference_name"):
+        return payment_doc.reference_name
+
+    if payment_doc.get("subscription"):
+        return payment_doc.subscription
+
+    bill_ref = payment_doc.get("bill_ref_number") or payment_doc.get("billrefnumber")
+    if bill_ref:
+        return frappe.db.get_value("Customer Subscription", {"subscription_id": bill_ref, "docstatus": ["<", 2]}, "name")
+
 def validate(doc, method=None):
     """Validate subscription details"""
     doc.validate()
@@ -466,3 +924,8 @@ def before_cancel(doc, method=None):
     """Before cancelling subscription"""
     doc.before_cancel()
 
+def on_doctype_update():
+    """Add composite indexes for the dashboard, the active users pages and per-router sync queries"""
+    frappe.db.add_index("Customer Subscription", ["status", "mikrotik_settings"])
+    for sort_field in ACTIVE_USER_SORT_FIELDS.values():
+        frappe.db.add_index("Customer Subscription", ["status", sort_field, "name"])
@@ -0,0 +1,110 @@
+# Copyright (c) 2026, ronoh and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import add_days, now_datetime
+
+from mikrotik_integration.mikrotik_integration.drivers import get_driver, is_missing_item_error
+
+# Usernames matched against vouchers per query
+ACTIVATION_CHUNK_SIZE = 1000
+
+
+class HotspotVoucher(Document):
+    pass
+
+
+def on_doctype_update():
+    frappe.db.add_index("Hotspot Voucher", ["mikrotik_settings", "status"])
+
+
+def has_open_vouchers(router_name):
+    return bool(frappe.db.exists(
+        "Hotspot Voucher",
+        {"mikrotik_settings": router_name, "status": ["in", ["Unused", "Active"]]}
+    ))
+
+
+def activate_vouchers(router_name, usernames):
+    """Start the validity of unused vouchers that have logged in on the router
+
+    One update per plan and chunk; usernames that are not vouchers match
+    nothing. Returns the number of vouchers activated.
+    """
+    usernames = list(dict.fromkeys(filter(None, usernames)))
+    voucher = frappe.qb.DocType("Hotspot Voucher")
+    activated_on = now_datetime()
+    activated = 0
+
+    for start in range(0, len(usernames), ACTIVATION_CHUNK_SIZE):
+        chunk = usernames[start:start + ACTIVATION_CHUNK_SIZE]
+        # Locked until the update, so a concurrent activation waits and the count is of rows changed here
+        rows = frappe.get_all(
+            "Hotspot Voucher",
+            filters={"name": ["in", chunk], "mikrotik_settings": router_name, "status": "Unused"},
+            fields=["name", "internet_plan"],
+            for_update=True
+        )
+        by_plan = {}
+        for row in rows:
+            by_plan.setdefault(row.internet_plan, []).append(row.name)
+
+        for plan, names in by_plan.items():
+            validity_days = frappe.get_cached_value("Internet Plan", plan, "validity_days")
+            (
+                frappe.qb.update(voucher)
+                .set(voucher.status, "Active")
+                .set(voucher.activated_on, activated_on)
+                .set(voucher.expires_on, add_days(activated_on, validity_days or 0))
+                .where(voucher.name.isin(names) & (voucher.status == "Unused"))
+            ).run()
+            activated += len(names)
+
+    return activated
+
+
+def expire_vouchers(api, router_name):
+    """Remove vouchers whose validity is over from the router and mark them expired"""
+    expired = frappe.get_all(
+        "Hotspot Voucher",
+        filters={"mikrotik_settings": router_name, "status": "Active", "expires_on": ["<=", now_datetime()]},
+        fields=["name", "mikrotik_item_id"]
+    )
+    if not expired:
+        return 0
+
+    driver = get_driver(api, "hotspot")
+    driver.kick([row.name for row in expired])
+    with_ids = [row for row in expired if row.mikrotik_item_id]
+    errors = driver.remove_many([row.mikrotik_item_id for row in with_ids])
+
+    updates = {}
+    for row, error in zip(with_ids, errors):
+        # A voucher removed on the router by hand is just as expired
+        if error and not is_missing_item_error(error):
+            continue
+        updates[row.name] = {"status": "Expired", "mikrotik_item_id": None}
+    for row in expired:
+        if not row.mikrotik_item_id:
+            updates[row.name] = {"status": "Expired"}
+
+    if updates:
+        frappe.db.bulk_update("Hotspot Voucher", updates, update_modified=False)
+    return len(updates)
+
+
+def sync_router_vouchers(api, router_name):
+    """Activate vouchers with a session on the router and expire the ones that ran out
+
+    Part of the router sync; routers without open vouchers cost one query.
+    """
+    if not has_open_vouchers(router_name):
+        return {"activated": 0, "expired": 0}
+
+    driver = get_driver(api, "hotspot")
+    online = [row.get(driver.session_user_field) for row in driver.list_sessions()]
+    return {
+        "activated": activate_vouchers(router_name, online),
+        "expired": expire_vouchers(api, router_name)
+    }
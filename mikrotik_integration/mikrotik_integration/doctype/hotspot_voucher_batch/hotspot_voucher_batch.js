@@ -0,0 +1,42 @@
+// Copyright (c) 2026, ronoh and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on("Hotspot Voucher Batch", {
+    refresh(frm) {
+        if (frm.is_new()) {
+            return;
+        }
+
+        if (!frm.doc.created_vouchers) {
+            frm.add_custom_button(__('Generate Vouchers'), function() {
+                frm.call({
+                    method: 'generate_vouchers',
+                    doc: frm.doc,
+                    freeze: true,
+                    freeze_message: __('Generating vouchers...')
+                }).then(() => {
+                    frappe.show_alert({message: __('Vouchers created, pushing them to the router'), indicator: 'blue'});
+                    frm.reload_doc();
+                });
+            }).addClass('btn-primary');
+            return;
+        }
+
+        if (frm.doc.status !== 'Pushing' && frm.doc.pushed_vouchers < frm.doc.created_vouchers) {
+            frm.add_custom_button(__('Push to Router'), function() {
+                frm.call('push_vouchers').then(() => frm.reload_doc());
+            });
+        }
+
+        if (frm.doc.pushed_vouchers) {
+            let url = '/api/method/mikrotik_integration.mikrotik_integration.doctype.hotspot_voucher_batch.hotspot_voucher_batch.export_vouchers'
+                + '?batch=' + encodeURIComponent(frm.doc.name);
+            frm.add_custom_button(__('Print Vouchers'), function() {
+                window.open(url);
+            }, __('Export'));
+            frm.add_custom_button(__('Download CSV'), function() {
+                window.open(url + '&format=csv');
+            }, __('Export'));
+        }
+    }
+});
@@ -0,0 +1,230 @@
+# Copyright (c) 2026, ronoh and contributors
+# For license information, please see license.txt
+
+import secrets
+
+import frappe
+from frappe import _
+from frappe.model.document import Document
+from frappe.utils import cint, flt, now
+from werkzeug.wrappers import Response
+
+from mikrotik_integration.mikrotik_integration.batching import iter_chunks
+from mikrotik_integration.mikrotik_integration.drivers import get_driver
+from mikrotik_integration.mikrotik_integration.pcq import ensure_queue_objects
+from mikrotik_integration.mikrotik_integration.rate_limit import PRIORITY_BACKGROUND
+
+MAX_BATCH_SIZE = 10000
+MIN_CODE_LENGTH = 4
+# Look-alike characters (0/O, 1/I/L) are left out so printed codes are typed correctly
+USERNAME_ALPHABET = "ABCDEFGHJKMNPQRSTUVWXYZ23456789"
+PASSWORD_ALPHABET = "abcdefghjkmnpqrstuvwxyz23456789"
+# Vouchers added to the router per pipelined batch and recorded per commit
+PUSH_CHUNK_SIZE = 1000
+PUSH_JOB_TIMEOUT = 1500
+VOUCHER_FIELDS = [
+    "name", "username", "password", "batch", "mikrotik_settings", "internet_plan", "status",
+    "creation", "modified", "owner", "modified_by", "docstatus"
+]
+
+
+class HotspotVoucherBatch(Document):
+    def validate(self):
+        if not 0 < cint(self.voucher_count) <= MAX_BATCH_SIZE:
+            frappe.throw(_("Number of Vouchers must be between 1 and {0}").format(MAX_BATCH_SIZE))
+        if cint(self.username_length) < MIN_CODE_LENGTH or cint(self.password_length) < MIN_CODE_LENGTH:
+            frappe.throw(_("Usernames and passwords need at least {0} characters").format(MIN_CODE_LENGTH))
+        if self.username_prefix and not self.username_prefix.isalnum():
+            frappe.throw(_("Username Prefix may only contain letters and digits"))
+
+        connection_type = frappe.get_cached_value("Internet Plan", self.internet_plan, "connection_type")
+        if frappe.get_cached_value("Connection Type", connection_type, "service_name") != "hotspot":
+            frappe.throw(_("Vouchers need an Internet Plan with a hotspot Connection Type"))
+
+    @frappe.whitelist()
+    def generate_vouchers(self):
+        """Create the batch's vouchers in bulk and queue their push to the router"""
+        frappe.has_permission(self.doctype, "write", self, throw=True)
+        if cint(self.created_vouchers):
+            frappe.throw(_("Vouchers of this batch have already been generated"))
+
+        codes = make_unique_usernames(self.username_prefix or "", cint(self.username_length), cint(self.voucher_count))
+        timestamp = now()
+        user = frappe.session.user
+        frappe.db.bulk_insert("Hotspot Voucher", VOUCHER_FIELDS, [
+            (
+                code, code, make_code(PASSWORD_ALPHABET, cint(self.password_length)), self.name,
+                self.mikrotik_settings, self.internet_plan, "Pending", timestamp, timestamp, user, user, 0
+            )
+            for code in codes
+        ])
+
+        self.db_set({"created_vouchers": len(codes), "status": "Pushing", "error": None})
+        enqueue_voucher_push(self.name)
+        return len(codes)
+
+    @frappe.whitelist()
+    def push_vouchers(self):
+        """Retry pushing the vouchers that are not on the router yet"""
+        frappe.has_permission(self.doctype, "write", self, throw=True)
+        self.db_set({"status": "Pushing", "error": None})
+        enqueue_voucher_push(self.name)
+
+
+def make_code(alphabet, length):
+    return "".join(secrets.choice(alphabet) for _i in range(length))
+
+
+def make_unique_usernames(prefix, length, count):
+    """Random usernames that no existing voucher uses"""
+    usernames = set()
+    while len(usernames) < count:
+        candidates = set()
+        while len(usernames) + len(candidates) < count:
+            candidates.add(prefix + make_code(USERNAME_ALPHABET, length))
+        candidates -= usernames
+
+        taken = set()
+        candidate_list = list(candidates)
+        for start in range(0, len(candidate_list), PUSH_CHUNK_SIZE):
+            taken.update(frappe.get_all(
+                "Hotspot Voucher",
+                filters={"name": ["in", candidate_list[start:start + PUSH_CHUNK_SIZE]]},
+                pluck="name"
+            ))
+        usernames |= candidates - taken
+    return sorted(usernames)
+
+
+def enqueue_voucher_push(batch):
+    frappe.enqueue(
+        "mikrotik_integration.mikrotik_integration.doctype.hotspot_voucher_batch.hotspot_voucher_batch.push_batch",
+        queue="long",
+        timeout=PUSH_JOB_TIMEOUT,
+        job_id=f"mikrotik_voucher_push::{batch}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        batch=batch
+    )
+
+
+def push_batch(batch):
+    """Add a batch's pending vouchers to the router, one pipelined chunk at a time"""
+    doc = frappe.get_doc("Hotspot Voucher Batch", batch)
+    try:
+        router = frappe.get_doc("MikroTik Settings", doc.mikrotik_settings)
+        conn_type = frappe.get_cached_doc(
+            "Connection Type", frappe.get_cached_value("Internet Plan", doc.internet_plan, "connection_type")
+        )
+        api = router.get_api_connection(priority=PRIORITY_BACKGROUND)
+    except Exception as e:
+        frappe.db.rollback()
+        doc.db_set({"status": "Failed", "error": str(e)}, notify=True)
+        frappe.db.commit()
+        return
+
+    try:
+        ensure_queue_objects(api, router, conn_type)
+        driver = get_driver(api, "hotspot")
+        params = get_voucher_params(conn_type, doc.internet_plan, doc.name)
+
+        for chunk in iter_chunks(
+            "Hotspot Voucher",
+            {"batch": doc.name, "status": ["in", ["Pending", "Failed"]]},
+            ["password"],
+            chunk_size=PUSH_CHUNK_SIZE
+        ):
+            results = driver.add_many([
+                driver.build_user("hotspot", row.name, row.password, **params) for row in chunk
+            ])
+            updates = {}
+            existing = []
+            for row, result in zip(chunk, results):
+                if isinstance(result, Exception):
+                    if "already have" in str(result):
+                        existing.append(row.name)
+                    updates[row.name] = {"status": "Failed", "error": str(result)}
+                else:
+                    updates[row.name] = {"status": "Unused", "mikrotik_item_id": result, "error": None}
+            # A retried push finds the vouchers it added before its records were committed. A user
+            # of the same name from elsewhere, e.g. a customer's, is left alone and the voucher Failed.
+            if existing:
+                for name, user in driver.list(existing).items():
+                    if user.get("comment") == params["comment"]:
+                        updates[name] = {"status": "Unused", "mikrotik_item_id": user.get("id"), "error": None}
+            frappe.db.bulk_update("Hotspot Voucher", updates, update_modified=False)
+            frappe.db.commit()
+    except Exception as e:
+        frappe.db.rollback()
+        doc.db_set("error", str(e))
+    finally:
+        api.close()
+
+    update_batch_status(doc)
+    frappe.db.commit()
+
+
+def get_voucher_params(conn_type, internet_plan, batch):
+    """Router user parameters shared by every voucher of a batch"""
+    params = dict(conn_type.get_user_limit_params(), comment=f"Voucher batch {batch}")
+    # The data quota is enforced by the router itself, as vouchers are not synced like subscriptions
+    quota = flt(frappe.get_cached_value("Internet Plan", internet_plan, "data_quota_mb"))
+    if quota:
+        params["limit-bytes-total"] = str(int(quota * 1024 * 1024))
+    return params
+
+
+def update_batch_status(doc):
+    counts = dict(frappe.get_all(
+        "Hotspot Voucher",
+        filters={"batch": doc.name},
+        fields=["status", "count(*) as count"],
+        group_by="status",
+        as_list=True
+    ))
+    failed = cint(counts.get("Failed"))
+    waiting = cint(counts.get("Pending"))
+    pushed = sum(cint(count) for status, count in counts.items() if status not in ("Pending", "Failed"))
+
+    if not failed and not waiting:
+        status = "Completed"
+    elif pushed:
+        status = "Partial"
+    else:
+        status = "Failed"
+    doc.db_set({
+        "status": status,
+        "pushed_vouchers": pushed,
+        "failed_vouchers": failed,
+        "pushed_at": now()
+    }, notify=True)
+
+
+@frappe.whitelist()
+def export_vouchers(batch, format="html"):
+    """Printable voucher cards (html) or a csv of a batch's vouchers on the router"""
+    doc = frappe.get_doc("Hotspot Voucher Batch", batch)
+    doc.check_permission("read")
+
+    vouchers = frappe.get_all(
+        "Hotspot Voucher",
+        filters={"batch": batch, "status": ["in", ["Unused", "Active"]]},
+        fields=["username", "password", "status"],
+        order_by="name asc"
+    )
+
+    if format == "csv":
+        frappe.response["type"] = "csv"
+        frappe.response["doctype"] = batch
+        frappe.response["result"] = [["Username", "Password", "Plan", "Validity (Days)", "Price"]] + [
+            [voucher.username, voucher.password, doc.internet_plan, doc.validity_days, doc.price]
+            for voucher in vouchers
+        ]
+        return
+
+    html = frappe.render_template("templates/hotspot_vouchers.html", {
+        "batch": doc,
+        "vouchers": vouchers,
+        "currency": frappe.get_cached_value("Internet Plan", doc.internet_plan, "currency")
+    })
+    return Response(html, mimetype="text/html")
@@ -4,8 +4,21 @@
 import frappe
 from frappe import _
 from frappe.model.document import Document
-from frappe.utils import add_days
+from frappe.utils import add_days, cint, get_datetime, now_datetime
+from mikrotik_integration.mikrotik_integration.doctype.mikrotik_sync_run.mikrotik_sync_run import record_sync_run
+from datetime import datetime
+import gzip
 import json
+import os
+
+DEFAULT_RETENTION_DAYS = 30
+DEFAULT_PURGE_CHUNK_SIZE = 1000
+ARCHIVE_FOLDER = "mikrotik_api_log_archive"
+ARCHIVE_FORMATS = ("jsonl", "parquet")
+ARCHIVE_FIELDS = [
+    "name", "timestamp", "router", "operation", "status", "error_class", "occurrences", "last_seen",
+    "parameters", "response"
+]
 
 
 class MikroTikAPILog(Document):
@@ -33,15 +46,9 @@ class MikroTikAPILog(Document):
                     frappe.throw(_("{0} must be valid JSON").format(field_label))
 
     @staticmethod
-    def clear_old_logs(days=30):
+    def clear_old_logs(days=DEFAULT_RETENTION_DAYS):
         """Delete logs older than specified days"""
-        frappe.db.delete(
-            "MikroTik API Log",
-            {
-                "timestamp": ("<=", frappe.utils.add_days(None, -days))
-            }
-        )
-        frappe.db.commit()
+        return purge_old_logs(days)
 
     @staticmethod
     def get_stats(router=None, status=None, operation=None):
@@ -61,26 +68,195 @@ class MikroTikAPILog(Document):
                 "status",
                 "operation",
                 "router",
-                "COUNT(*) as count",
-                "MAX(timestamp) as last_occurrence"
+                # Entries stand for several calls once failures are aggregated and successes sampled
+                "SUM(occurrences) as count",
+                "MAX(COALESCE(last_seen, timestamp)) as last_occurrence"
             ],
             group_by="status, operation, router"
         )
 
 
 @frappe.whitelist()
-def clear_old_logs(days=30):
+def clear_old_logs(days=None):
     """Delete logs older than specified days"""
-    try:
-        frappe.db.delete(
+    with record_sync_run("clear_old_logs") as run:
+        try:
+            run.result = {"changed": purge_old_logs(days)}
+        except Exception as e:
+            run.error = str(e)
+            frappe.log_error(
+                f"Error clearing old API logs: {str(e)}",
+                "API Log Cleanup Error"
+            )
+
+
+def purge_old_logs(days=None, chunk_size=None, archive_format=None):
+    """Delete expired logs in primary key order, committing after every chunk
+
+    Retention and archiving can be configured through the site config keys
+    `mikrotik_log_retention_days`, `mikrotik_log_purge_chunk_size` and
+    `mikrotik_log_archive_format` (jsonl or parquet). When an archive format is
+    set, every chunk is written to disk before it is deleted.
+    """
+    days = cint(days or frappe.conf.get("mikrotik_log_retention_days") or DEFAULT_RETENTION_DAYS)
+    chunk_size = cint(chunk_size or frappe.conf.get("mikrotik_log_purge_chunk_size") or DEFAULT_PURGE_CHUNK_SIZE)
+    if archive_format is None:
+        archive_format = frappe.conf.get("mikrotik_log_archive_format")
+    if archive_format and archive_format not in ARCHIVE_FORMATS:
+        frappe.throw(_("Unsupported API log archive format: {0}").format(archive_format))
+
+    cutoff = add_days(now_datetime(), -days)
+    last_name = 0
+    deleted = 0
+
+    while True:
+        # Keyset pagination on the autoincrement key keeps every chunk an index range scan
+        rows = frappe.get_all(
             "MikroTik API Log",
-            {
-                "timestamp": ("<=", add_days(None, -days))
-            }
+            filters={"timestamp": ("<=", cutoff), "name": (">", last_name)},
+            fields=ARCHIVE_FIELDS if archive_format else ["name"],
+            order_by="name asc",
+            limit_page_length=chunk_size
         )
+        if not rows:
+            break
+
+        if archive_format:
+            write_archive_chunk(rows, archive_format)
+
+        names = [row.name for row in rows]
+        frappe.db.delete("MikroTik API Log", {"name": ("in", names)})
         frappe.db.commit()
-    except Exception as e:
-        frappe.log_error(
-            f"Error clearing old API logs: {str(e)}",
-            "API Log Cleanup Error"
+
+        deleted += len(names)
+        last_name = names[-1]
+        if len(rows) < chunk_size:
+            break
+
+    return deleted
+
+
+def get_archive_path(*parts):
+    """Return a path inside the private API log archive folder"""
+    return frappe.get_site_path("private", ARCHIVE_FOLDER, *parts)
+
+
+def write_archive_chunk(rows, archive_format="jsonl"):
+    """Write one chunk of log rows to a compressed archive file
+
+    File names carry the timestamp and key range of the chunk so readers can skip
+    files without opening them, and so a retried chunk overwrites its own file
+    instead of duplicating rows.
+    """
+    timestamps = [get_datetime(row.timestamp) for row in rows]
+    filename = "api-log-{0}-{1}-{2}-{3}.{4}".format(
+        min(timestamps).strftime("%Y%m%d%H%M%S"),
+        max(timestamps).strftime("%Y%m%d%H%M%S"),
+        rows[0].name,
+        rows[-1].name,
+        "parquet" if archive_format == "parquet" else "jsonl.gz"
+    )
+    folder = get_archive_path()
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, filename)
+    tmp_path = path + ".tmp"
+
+    records = [{field: row.get(field) for field in ARCHIVE_FIELDS} for row in rows]
+    if archive_format == "parquet":
+        pa, pq = get_pyarrow()
+        table = pa.Table.from_pylist([
+            dict(record, timestamp=str(record["timestamp"])) for record in records
+        ])
+        pq.write_table(table, tmp_path, compression="zstd")
+    else:
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, default=str, separators=(",", ":")))
+                f.write("\n")
+
+    # Rename last so a crash never leaves a half written archive behind
+    os.replace(tmp_path, path)
+    return path
+
+
+def get_pyarrow():
+    """Import pyarrow, which is only needed for the parquet archive format"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        frappe.throw(_("The parquet archive format requires the pyarrow package. Please run: pip install pyarrow"))
+    return pyarrow, pyarrow.parquet
+
+
+def parse_archive_filename(filename):
+    """Return (from_datetime, to_datetime) encoded in an archive file name"""
+    try:
+        parts = filename.split(".", 1)[0].split("-")
+        return (
+            datetime.strptime(parts[2], "%Y%m%d%H%M%S"),
+            datetime.strptime(parts[3], "%Y%m%d%H%M%S")
         )
+    except (IndexError, ValueError):
+        return None
+
+
+def read_archive_file(path):
+    """Yield archived log rows from a jsonl.gz or parquet file"""
+    if path.endswith(".parquet"):
+        _pa, pq = get_pyarrow()
+        yield from pq.read_table(path).to_pylist()
+    else:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+@frappe.whitelist()
+def get_archived_logs(from_date=None, to_date=None, router=None, operation=None, status=None, limit=100):
+    """Search archived API logs, newest first"""
+    frappe.only_for("System Manager")
+
+    folder = get_archive_path()
+    if not os.path.isdir(folder):
+        return []
+
+    from_date = get_datetime(from_date) if from_date else None
+    to_date = get_datetime(to_date) if to_date else None
+    limit = cint(limit) or 100
+    results = []
+
+    for filename in sorted(os.listdir(folder), reverse=True):
+        if not filename.endswith((".jsonl.gz", ".parquet")):
+            continue
+
+        # Skip files whose time range cannot contain a match
+        time_range = parse_archive_filename(filename)
+        if time_range:
+            if from_date and time_range[1] < from_date:
+                continue
+            if to_date and time_range[0] > to_date:
+                continue
+
+        rows = []
+        for row in read_archive_file(os.path.join(folder, filename)):
+            if router and row.get("router") != router:
+                continue
+            if operation and row.get("operation") != operation:
+                continue
+            if status and row.get("status") != status:
+                continue
+            timestamp = get_datetime(row.get("timestamp"))
+            if from_date and timestamp < from_date:
+                continue
+            if to_date and timestamp > to_date:
+                continue
+            rows.append(row)
+
+        rows.sort(key=lambda row: cint(row.get("name")), reverse=True)
+        results.extend(rows)
+        if len(results) >= limit:
+            break
+
+    return results[:limit]
@@ -1,9 +1,53 @@
 # Copyright (c) 2025, ronoh and Contributors
 # See license.txt
 
-# import frappe
+import frappe
 from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, now_datetime
+
+from mikrotik_integration.mikrotik_integration.doctype.mikrotik_api_log.mikrotik_api_log import (
+	get_archived_logs,
+	purge_old_logs,
+)
 
 
 class TestMikrotikAPILog(FrappeTestCase):
-	pass
+	def setUp(self):
+		if not frappe.db.exists("MikroTik Settings", "_Test Log Router"):
+			frappe.get_doc({
+				"doctype": "MikroTik Settings",
+				"router_name": "_Test Log Router",
+				"api_host": "127.0.0.1",
+				"api_port": 8728,
+				"username": "admin"
+			}).insert()
+
+	def make_log(self, days_old, operation="add_user_hotspot"):
+		return frappe.get_doc({
+			"doctype": "MikroTik API Log",
+			"router": "_Test Log Router",
+			"operation": operation,
+			"status": "Success",
+			"timestamp": add_days(now_datetime(), -days_old)
+		}).insert(ignore_permissions=True)
+
+	def test_purge_in_chunks(self):
+		"""Expired logs are removed across several chunks, recent ones are kept"""
+		old = [self.make_log(40) for _i in range(5)]
+		recent = self.make_log(1)
+
+		deleted = purge_old_logs(days=30, chunk_size=2, archive_format="")
+
+		self.assertEqual(deleted, 5)
+		for log in old:
+			self.assertFalse(frappe.db.exists("MikroTik API Log", log.name))
+		self.assertTrue(frappe.db.exists("MikroTik API Log", recent.name))
+
+	def test_archive_before_purge(self):
+		"""Archived rows can be read back after they are deleted"""
+		log = self.make_log(45, operation="archive_test")
+
+		purge_old_logs(days=30, chunk_size=100, archive_format="jsonl")
+
+		archived = get_archived_logs(router="_Test Log Router", operation="archive_test")
+		self.assertIn(str(log.name), [str(row["name"]) for row in archived])
@@ -0,0 +1,13 @@
+// Copyright (c) 2026, ronoh and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on("MikroTik Job Profile", {
+    refresh(frm) {
+        frm.add_custom_button(__("Download Speedscope"), function() {
+            window.open(frappe.urllib.get_full_url(
+                "/api/method/mikrotik_integration.mikrotik_integration.doctype.mikrotik_job_profile.mikrotik_job_profile.download_speedscope?name="
+                + encodeURIComponent(frm.doc.name)
+            ));
+        });
+    },
+});
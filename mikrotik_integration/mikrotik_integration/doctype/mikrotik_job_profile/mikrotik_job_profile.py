@@ -0,0 +1,40 @@
+# Copyright (c) 2026, ronoh and contributors
+# For license information, please see license.txt
+
+import json
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import add_days, cint, flt, now
+
+from mikrotik_integration.mikrotik_integration.doctype.mikrotik_sync_run.mikrotik_sync_run import record_sync_run
+from mikrotik_integration.mikrotik_integration.profiler import to_speedscope
+
+DEFAULT_RETENTION_DAYS = 7
+
+
+class MikroTikJobProfile(Document):
+    pass
+
+
+@frappe.whitelist()
+def download_speedscope(name):
+    """Download a profile as a speedscope file"""
+    frappe.only_for("System Manager")
+    profile = frappe.get_doc("MikroTik Job Profile", name)
+    speedscope = to_speedscope(
+        f"{profile.job} {profile.router or ''} {profile.started_at}".strip(),
+        profile.collapsed_stacks,
+        flt(profile.wall_seconds)
+    )
+    frappe.response["filename"] = f"mikrotik-profile-{profile.name}.speedscope.json"
+    frappe.response["filecontent"] = json.dumps(speedscope)
+    frappe.response["type"] = "download"
+
+
+def clear_old_profiles():
+    """Delete profiles older than `mikrotik_profile_retention_days` (default 7)"""
+    days = cint(frappe.conf.get("mikrotik_profile_retention_days")) or DEFAULT_RETENTION_DAYS
+    with record_sync_run("clear_old_profiles"):
+        frappe.db.delete("MikroTik Job Profile", {"creation": ["<", add_days(now(), -days)]})
+        frappe.db.commit()
@@ -0,0 +1,266 @@
+# Copyright (c) 2026, ronoh and contributors
+# For license information, please see license.txt
+
+import json
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import add_days, flt, get_date_str, get_first_day, getdate, now, nowdate
+
+from mikrotik_integration.mikrotik_integration.doctype.mikrotik_sync_run.mikrotik_sync_run import record_sync_run
+
+USAGE_DAYS = 30
+COUNTER_FIELDS = [
+    "name", "mikrotik_settings", "docstatus", "status", "payment_status",
+    "payment_date", "price", "currency", "data_used_mb", "creation"
+]
+
+
+class MikroTikRouterCounter(Document):
+    pass
+
+
+def get_contribution(row):
+    """What one subscription adds to its router's counters"""
+    if not row or row.get("docstatus") != 1 or not row.get("mikrotik_settings"):
+        return None
+
+    active = row.get("status") == "Active"
+    contribution = {
+        "router": row.get("mikrotik_settings"),
+        "active_subscriptions": 1 if active else 0,
+        "pending_payments": 1 if row.get("payment_status") == "Pending" else 0,
+        "total_usage_mb": flt(row.get("data_used_mb")) if active else 0,
+        "revenue": {},
+        "usage_by_day": {}
+    }
+
+    payment_date = row.get("payment_date")
+    if (row.get("payment_status") == "Completed" and payment_date
+            and get_first_day(payment_date) == get_first_day(nowdate())):
+        currency = row.get("currency") or frappe.defaults.get_global_default("currency")
+        contribution["revenue"][currency] = flt(row.get("price"))
+
+    if active and row.get("creation"):
+        contribution["usage_by_day"][get_date_str(row.get("creation"))] = flt(row.get("data_used_mb"))
+
+    return contribution
+
+
+def remember_subscription_contribution(doc, method=None):
+    """Record what the counters hold for a subscription before a save changes them
+
+    The controller may save the document again from its own hooks, e.g. suspend
+    it from `on_update`, before the outer save's counter update runs. The nested
+    update then starts from this state instead of the row the outer save already
+    wrote, and the outer update finds nothing left to apply.
+    """
+    if "router_counter_contribution" not in doc.flags:
+        doc.flags.router_counter_contribution = get_contribution(doc.get_doc_before_save())
+
+
+def update_subscription_counters(doc, method=None):
+    """Apply a subscription's change to the router counters in the same transaction"""
+    if "router_counter_contribution" in doc.flags:
+        old = doc.flags.router_counter_contribution
+    else:
+        old = get_contribution(doc.get_doc_before_save())
+    new = get_contribution(doc)
+
+    apply_contribution_change(old, new)
+    # Later and nested saves of the same document start from what was applied
+    doc.flags.router_counter_contribution = new
+
+
+def apply_row_change(old_row, new_row):
+    """Apply a change made without a document save, e.g. a sync job's batch update
+
+    Both rows need the fields in COUNTER_FIELDS.
+    """
+    apply_contribution_change(get_contribution(old_row), get_contribution(new_row))
+
+
+def apply_contribution_change(old, new):
+    apply_contributions([(old, -1), (new, 1)])
+
+
+def apply_rows_added(rows):
+    """Count rows inserted in bulk, with one counter update per router
+
+    The rows need the fields in COUNTER_FIELDS.
+    """
+    apply_contributions([(get_contribution(row), 1) for row in rows])
+
+
+def apply_contributions(changes):
+    """Apply (contribution, sign) pairs, summed into one delta per router"""
+    deltas = {}
+    for contribution, sign in changes:
+        if not contribution:
+            continue
+        delta = deltas.setdefault(contribution["router"], {
+            "active_subscriptions": 0,
+            "pending_payments": 0,
+            "total_usage_mb": 0,
+            "revenue": {},
+            "usage_by_day": {}
+        })
+        for field in ("active_subscriptions", "pending_payments", "total_usage_mb"):
+            delta[field] += sign * contribution[field]
+        for field in ("revenue", "usage_by_day"):
+            for key, value in contribution[field].items():
+                delta[field][key] = delta[field].get(key, 0) + sign * value
+
+    for router, delta in deltas.items():
+        if any(delta[f] for f in ("active_subscriptions", "pending_payments", "total_usage_mb")) \
+                or any(delta["revenue"].values()) or any(delta["usage_by_day"].values()):
+            apply_delta(router, delta)
+
+
+def apply_delta(router, delta):
+    """Add a delta to one router's counters under a row lock"""
+    ensure_counter(router)
+    counter = frappe.db.get_value(
+        "MikroTik Router Counter",
+        router,
+        ["active_subscriptions", "pending_payments", "total_usage_mb", "revenue_month", "revenue", "usage_by_day"],
+        as_dict=True,
+        for_update=True
+    )
+
+    month = get_first_day(nowdate())
+    revenue = json.loads(counter.revenue or "{}") if counter.revenue_month and getdate(counter.revenue_month) == month else {}
+    for currency, amount in delta["revenue"].items():
+        revenue[currency] = flt(revenue.get(currency)) + amount
+
+    cutoff = get_date_str(add_days(nowdate(), -USAGE_DAYS))
+    usage_by_day = json.loads(counter.usage_by_day or "{}")
+    for day, usage in delta["usage_by_day"].items():
+        usage_by_day[day] = flt(usage_by_day.get(day)) + usage
+    usage_by_day = {day: usage for day, usage in usage_by_day.items() if day >= cutoff and usage}
+
+    frappe.db.set_value("MikroTik Router Counter", router, {
+        "active_subscriptions": counter.active_subscriptions + delta["active_subscriptions"],
+        "pending_payments": counter.pending_payments + delta["pending_payments"],
+        "total_usage_mb": flt(counter.total_usage_mb) + delta["total_usage_mb"],
+        "revenue_month": month,
+        "revenue": json.dumps(revenue),
+        "usage_by_day": json.dumps(usage_by_day)
+    }, update_modified=False)
+
+
+def ensure_counter(router):
+    if frappe.db.exists("MikroTik Router Counter", router):
+        return
+    try:
+        frappe.get_doc({
+            "doctype": "MikroTik Router Counter",
+            "router": router,
+            "revenue_month": get_first_day(nowdate())
+        }).insert(ignore_permissions=True)
+    except frappe.DuplicateEntryError:
+        # Created by a concurrent transaction
+        pass
+
+
+@frappe.whitelist()
+def rebuild_router_counters():
+    """Recompute every router's counters from Customer Subscription to fix drift"""
+    frappe.only_for("System Manager")
+    return rebuild_all_counters()
+
+
+def rebuild_all_counters():
+    """Daily job: rebuild every router's counters, recorded in the sync run ledger"""
+    with record_sync_run("rebuild_all_counters") as run:
+        rebuilt = rebuild_counters()
+        run.result = {"scanned": rebuilt, "changed": rebuilt}
+    return rebuilt
+
+
+def rebuild_counters():
+    month = get_first_day(nowdate())
+    cutoff = add_days(nowdate(), -USAGE_DAYS)
+    base = {"docstatus": 1, "mikrotik_settings": ["is", "set"]}
+
+    counters = {}
+
+    def counter(router):
+        return counters.setdefault(router, {
+            "active_subscriptions": 0,
+            "pending_payments": 0,
+            "total_usage_mb": 0,
+            "revenue": {},
+            "usage_by_day": {}
+        })
+
+    for row in frappe.get_all(
+        "Customer Subscription",
+        filters=dict(base, status="Active"),
+        fields=["mikrotik_settings as router", "count(*) as active", "sum(data_used_mb) as usage"],
+        group_by="mikrotik_settings"
+    ):
+        counter(row.router).update(active_subscriptions=row.active, total_usage_mb=flt(row.usage))
+
+    for row in frappe.get_all(
+        "Customer Subscription",
+        filters=dict(base, payment_status="Pending"),
+        fields=["mikrotik_settings as router", "count(*) as pending"],
+        group_by="mikrotik_settings"
+    ):
+        counter(row.router)["pending_payments"] = row.pending
+
+    default_currency = frappe.defaults.get_global_default("currency")
+    for row in frappe.get_all(
+        "Customer Subscription",
+        filters=dict(base, payment_status="Completed", payment_date=[">=", month]),
+        fields=["mikrotik_settings as router", "currency", "sum(price) as total"],
+        group_by="mikrotik_settings, currency"
+    ):
+        counter(row.router)["revenue"][row.currency or default_currency] = flt(row.total)
+
+    for row in frappe.get_all(
+        "Customer Subscription",
+        filters=dict(base, status="Active", creation=[">=", cutoff]),
+        fields=["mikrotik_settings as router", "DATE(creation) as date", "sum(data_used_mb) as usage"],
+        group_by="mikrotik_settings, DATE(creation)"
+    ):
+        if row.usage:
+            counter(row.router)["usage_by_day"][get_date_str(row.date)] = flt(row.usage)
+
+    for router in frappe.get_all("MikroTik Router Counter", pluck="name"):
+        if router not in counters:
+            frappe.delete_doc("MikroTik Router Counter", router, ignore_permissions=True)
+
+    for router, values in counters.items():
+        ensure_counter(router)
+        frappe.db.set_value("MikroTik Router Counter", router, {
+            "active_subscriptions": values["active_subscriptions"],
+            "pending_payments": values["pending_payments"],
+            "total_usage_mb": values["total_usage_mb"],
+            "revenue_month": month,
+            "revenue": json.dumps(values["revenue"]),
+            "usage_by_day": json.dumps(values["usage_by_day"]),
+            "last_rebuilt": now()
+        }, update_modified=False)
+
+    frappe.db.commit()
+    return len(counters)
+
+
+def get_router_counters(router=None):
+    """Read the counter rows for one router or for all of them in a single query"""
+    counters = frappe.get_all(
+        "MikroTik Router Counter",
+        filters={"name": router} if router else {},
+        fields=["name", "active_subscriptions", "pending_payments", "total_usage_mb",
+                "revenue_month", "revenue", "usage_by_day"]
+    )
+
+    month = get_first_day(nowdate())
+    for counter in counters:
+        # Revenue from an earlier month no longer counts until the row is next updated
+        current = counter.revenue_month and getdate(counter.revenue_month) == month
+        counter.revenue = json.loads(counter.revenue or "{}") if current else {}
+        counter.usage_by_day = json.loads(counter.usage_by_day or "{}")
+    return counters
@@ -0,0 +1,82 @@
+# Copyright (c) 2026, ronoh and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from mikrotik_integration.mikrotik_integration.doctype.mikrotik_router_counter.mikrotik_router_counter import (
+	rebuild_all_counters,
+)
+from mikrotik_integration.tests.utils import expired_values, make_router, make_subscription, offline_router
+
+
+class TestMikroTikRouterCounter(FrappeTestCase):
+	def setUp(self):
+		self.router = make_router(f"_Test Counter Router {frappe.generate_hash(length=6)}")
+
+	def get_counts(self):
+		return frappe.db.get_value(
+			"MikroTik Router Counter", self.router, ["active_subscriptions", "pending_payments"], as_dict=True
+		) or frappe._dict(active_subscriptions=0, pending_payments=0)
+
+	def assertCounts(self, active, pending):
+		counts = self.get_counts()
+		self.assertEqual((counts.active_subscriptions, counts.pending_payments), (active, pending))
+
+	def test_drafts_are_not_counted(self):
+		make_subscription(self.router, submit=False)
+
+		self.assertCounts(0, 0)
+
+	def test_submit_counts_the_subscription(self):
+		make_subscription(self.router)
+		make_subscription(self.router)
+
+		self.assertCounts(2, 2)
+
+	def test_cancel_removes_the_subscription(self):
+		subscription = make_subscription(self.router)
+		make_subscription(self.router)
+
+		with offline_router():
+			subscription.cancel()
+
+		self.assertCounts(1, 1)
+
+	def test_suspend_after_submit(self):
+		subscription = make_subscription(self.router)
+
+		with offline_router():
+			subscription.suspend()
+
+		self.assertEqual(subscription.status, "Suspended")
+		self.assertCounts(0, 1)
+
+	def test_suspend_nested_in_submit(self):
+		"""An expired subscription is suspended by its own on_update while it is being submitted"""
+		subscription = make_subscription(self.router, **expired_values())
+
+		self.assertEqual(frappe.db.get_value("Customer Subscription", subscription.name, "status"), "Suspended")
+		self.assertCounts(0, 1)
+
+		with offline_router():
+			subscription.reload()
+			subscription.cancel()
+		self.assertCounts(0, 0)
+
+	def test_rebuild_fixes_drift(self):
+		make_subscription(self.router)
+		make_subscription(self.router, **expired_values())
+		make_subscription(self.router, submit=False)
+		frappe.db.set_value(
+			"MikroTik Router Counter", self.router, {"active_subscriptions": -5, "pending_payments": 40}
+		)
+
+		# The rebuild commits its work; the test's changes are rolled back instead
+		with patch.object(frappe.db, "commit"):
+			rebuild_all_counters()
+
+		self.assertCounts(1, 2)
+		self.assertTrue(frappe.db.get_value("MikroTik Router Counter", self.router, "last_rebuilt"))
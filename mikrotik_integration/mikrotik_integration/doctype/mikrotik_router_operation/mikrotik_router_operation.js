@@ -0,0 +1,8 @@
+// Copyright (c) 2026, ronoh and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("MikroTik Router Operation", {
+// 	refresh(frm) {
+
+// 	},
+// });
@@ -0,0 +1,230 @@
+# Copyright (c) 2026, ronoh and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import add_to_date, cint, get_datetime, now, now_datetime
+
+from mikrotik_integration.mikrotik_integration.api import is_router_unreachable
+from mikrotik_integration.mikrotik_integration.doctype.mikrotik_sync_run.mikrotik_sync_run import record_sync_run
+from mikrotik_integration.mikrotik_integration.rate_limit import PRIORITY_BACKGROUND
+from mikrotik_integration.mikrotik_integration.sharding import acquire_lease, release_lease
+
+OUTBOX_BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+# Wait before the first retry, doubled after every further failure
+RETRY_DELAY_SECONDS = 60
+DRAIN_JOB_TIMEOUT = 900
+# Every operation sets the user's whole state for its kind, so a newer one makes
+# these earlier pending operations of the same subscription pointless
+SUPERSEDES = {
+    "provision": ("provision", "remove", "disable", "enable"),
+    "remove": ("provision", "remove", "disable", "enable"),
+    "disable": ("disable", "enable"),
+    "enable": ("disable", "enable"),
+}
+
+
+class MikroTikRouterOperation(Document):
+    pass
+
+
+def has_pending_operations(router, subscription):
+    return bool(frappe.db.exists(
+        "MikroTik Router Operation",
+        {"router": router, "subscription": subscription, "status": "Pending"}
+    ))
+
+
+def queue_router_operation(router, subscription, operation):
+    """Store a router operation to replay once the router is reachable
+
+    Pending operations of the subscription that the new one makes redundant are
+    dropped, so a long outage replays at most a couple of operations per user.
+    """
+    frappe.db.delete("MikroTik Router Operation", {
+        "router": router,
+        "subscription": subscription,
+        "status": "Pending",
+        "operation": ["in", SUPERSEDES[operation]]
+    })
+    frappe.get_doc({
+        "doctype": "MikroTik Router Operation",
+        "router": router,
+        "subscription": subscription,
+        "operation": operation,
+        "status": "Pending"
+    }).insert(ignore_permissions=True)
+
+
+def get_drain_job_id(router):
+    return f"mikrotik_outbox::{router}"
+
+
+def enqueue_outbox_drain(router):
+    frappe.enqueue(
+        "mikrotik_integration.mikrotik_integration.doctype.mikrotik_router_operation.mikrotik_router_operation.drain_router_outbox",
+        queue="short",
+        timeout=DRAIN_JOB_TIMEOUT,
+        job_id=get_drain_job_id(router),
+        deduplicate=True,
+        enqueue_after_commit=True,
+        router=router
+    )
+
+
+def enqueue_pending_outboxes():
+    """Scheduler entry point: probe every router with due operations and drain it"""
+    routers = frappe.get_all(
+        "MikroTik Router Operation",
+        filters={"status": "Pending"},
+        or_filters=get_due_or_filters(),
+        pluck="router",
+        distinct=True
+    )
+    for router in routers:
+        enqueue_outbox_drain(router)
+
+
+def get_due_or_filters():
+    """Operations never tried, or whose retry delay is over"""
+    return [["next_attempt_at", "is", "not set"], ["next_attempt_at", "<=", now()]]
+
+
+def get_retry_delay(attempts):
+    return RETRY_DELAY_SECONDS * 2 ** (max(attempts, 1) - 1)
+
+
+def is_due(operation):
+    return not operation.next_attempt_at or get_datetime(operation.next_attempt_at) <= now_datetime()
+
+
+def drain_router_outbox(router):
+    """Replay one router's pending operations in order over a single connection
+
+    Opening the connection is the health probe: while the router stays
+    unreachable the operations are left for the next run. A failing operation
+    is not tried again before its retry delay, and until then it holds back the
+    later operations of the same subscription, so their order is kept.
+    """
+    lease_key = get_drain_job_id(router)
+    token = acquire_lease(lease_key, ttl=DRAIN_JOB_TIMEOUT)
+    if not token:
+        return None
+
+    result = {"done": 0, "failed": 0, "pending": 0}
+    api = None
+    try:
+        with record_sync_run("drain_router_outbox", router) as run:
+            try:
+                api = frappe.get_doc("MikroTik Settings", router).get_api_connection(priority=PRIORITY_BACKGROUND)
+            except Exception as e:
+                if not is_router_unreachable(e):
+                    raise
+                frappe.clear_last_message()
+                result["pending"] = frappe.db.count("MikroTik Router Operation", {"router": router, "status": "Pending"})
+                run.result = {"skipped": 1}
+                return result
+
+            replay_operations(router, api, result)
+            run.result = {
+                "scanned": result["done"] + result["failed"] + result["pending"],
+                "changed": result["done"],
+                "errors": result["failed"]
+            }
+    finally:
+        if api:
+            api.close()
+        release_lease(lease_key, token)
+
+    return result
+
+
+def replay_operations(router, api, result):
+    last_name = 0
+    held_back = set()
+    while True:
+        operations = frappe.get_all(
+            "MikroTik Router Operation",
+            filters={"router": router, "status": "Pending", "name": [">", last_name]},
+            fields=["name", "subscription", "operation", "attempts", "next_attempt_at"],
+            order_by="name asc",
+            limit_page_length=OUTBOX_BATCH_SIZE
+        )
+        if not operations:
+            return
+
+        for operation in operations:
+            last_name = operation.name
+            if operation.subscription in held_back or not is_due(operation):
+                held_back.add(operation.subscription)
+                result["pending"] += 1
+                continue
+
+            status = apply_operation(operation, api)
+            if status == "Unreachable":
+                # The router went away again; keep the rest for the next probe
+                return
+            if status == "Pending":
+                held_back.add(operation.subscription)
+            result[status.lower()] += 1
+
+
+def apply_operation(operation, api):
+    """Replay one operation and record its outcome, returning the new status"""
+    try:
+        subscription = frappe.get_doc("Customer Subscription", operation.subscription)
+        # Replays run directly against the router instead of queueing again
+        subscription.flags.from_router_outbox = True
+
+        if operation.operation == "provision":
+            subscription.provision_mikrotik_user(api=api)
+        elif operation.operation == "remove":
+            subscription.remove_mikrotik_user(api=api)
+        elif operation.operation == "disable":
+            subscription.set_mikrotik_user_disabled(True, api=api)
+            subscription.kick_active_sessions(api)
+        elif operation.operation == "enable":
+            if not subscription.set_mikrotik_user_disabled(False, api=api):
+                subscription.provision_mikrotik_user(api=api)
+
+        frappe.db.set_value("MikroTik Router Operation", operation.name, {
+            "status": "Done",
+            "attempts": cint(operation.attempts) + 1,
+            "completed_at": now(),
+            "error": None
+        })
+        frappe.db.commit()
+        return "Done"
+
+    except Exception as e:
+        frappe.db.rollback()
+        frappe.clear_last_message()
+        if is_router_unreachable(e):
+            return "Unreachable"
+
+        attempts = cint(operation.attempts) + 1
+        status = "Failed" if attempts >= MAX_ATTEMPTS else "Pending"
+        frappe.db.set_value("MikroTik Router Operation", operation.name, {
+            "status": status,
+            "attempts": attempts,
+            "next_attempt_at": add_to_date(now_datetime(), seconds=get_retry_delay(attempts)),
+            "error": str(e)
+        })
+        frappe.db.commit()
+        return status
+
+
+@frappe.whitelist()
+def retry_operation(name):
+    """Put a failed operation back in its router's outbox"""
+    frappe.only_for("System Manager")
+    frappe.db.set_value(
+        "MikroTik Router Operation", name, {"status": "Pending", "attempts": 0, "next_attempt_at": None}
+    )
+    enqueue_outbox_drain(frappe.db.get_value("MikroTik Router Operation", name, "router"))
+
+
+def on_doctype_update():
+    frappe.db.add_index("MikroTik Router Operation", ["router", "status"])
+    frappe.db.add_index("MikroTik Router Operation", ["subscription", "status"])
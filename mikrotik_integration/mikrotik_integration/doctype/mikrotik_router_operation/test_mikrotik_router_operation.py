@@ -0,0 +1,163 @@
+# Copyright (c) 2026, ronoh and Contributors
+# See license.txt
+
+from unittest.mock import MagicMock, patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_to_date, now_datetime
+
+from mikrotik_integration.mikrotik_integration.doctype.mikrotik_router_operation import mikrotik_router_operation
+from mikrotik_integration.mikrotik_integration.doctype.mikrotik_router_operation.mikrotik_router_operation import (
+	enqueue_pending_outboxes,
+	get_retry_delay,
+	queue_router_operation,
+	replay_operations,
+)
+from mikrotik_integration.tests.utils import make_router, make_subscription
+
+TEST_ROUTER = "_Test Outbox Router"
+
+
+def make_operation(subscription, operation, router=TEST_ROUTER, **values):
+	return frappe.get_doc(dict({
+		"doctype": "MikroTik Router Operation",
+		"router": router,
+		"subscription": subscription,
+		"operation": operation,
+		"status": "Pending"
+	}, **values)).insert(ignore_permissions=True, ignore_links=True)
+
+
+def new_result():
+	return {"done": 0, "failed": 0, "pending": 0}
+
+
+class TestQueueRouterOperation(FrappeTestCase):
+	def setUp(self):
+		self.router = make_router(f"_Test Outbox Router {frappe.generate_hash(length=6)}")
+		self.subscription = make_subscription(self.router).name
+
+	def get_pending(self):
+		return frappe.get_all(
+			"MikroTik Router Operation",
+			filters={"router": self.router, "subscription": self.subscription, "status": "Pending"},
+			pluck="operation",
+			order_by="name asc"
+		)
+
+	def test_newer_operation_supersedes_pending_ones(self):
+		queue_router_operation(self.router, self.subscription, "disable")
+		queue_router_operation(self.router, self.subscription, "enable")
+
+		self.assertEqual(self.get_pending(), ["enable"])
+
+	def test_provision_is_kept_behind_a_suspension(self):
+		queue_router_operation(self.router, self.subscription, "provision")
+		queue_router_operation(self.router, self.subscription, "disable")
+
+		self.assertEqual(self.get_pending(), ["provision", "disable"])
+
+	def test_removal_replaces_everything(self):
+		queue_router_operation(self.router, self.subscription, "provision")
+		queue_router_operation(self.router, self.subscription, "disable")
+		queue_router_operation(self.router, self.subscription, "remove")
+
+		self.assertEqual(self.get_pending(), ["remove"])
+
+
+class TestReplayOperations(FrappeTestCase):
+	def replay(self, statuses):
+		"""Replay the test router's outbox, each operation ending in its status in `statuses`"""
+		applied = []
+
+		def apply_operation(operation, api):
+			applied.append(operation.name)
+			return statuses.get(operation.name, "Done")
+
+		result = new_result()
+		with patch.object(mikrotik_router_operation, "apply_operation", side_effect=apply_operation):
+			replay_operations(TEST_ROUTER, MagicMock(), result)
+		return applied, result
+
+	def test_failing_operation_holds_back_its_subscription(self):
+		first = make_operation("_Test Outbox A", "provision").name
+		held = make_operation("_Test Outbox A", "disable").name
+		other = make_operation("_Test Outbox B", "provision").name
+
+		applied, result = self.replay({first: "Pending"})
+
+		self.assertEqual(applied, [first, other])
+		self.assertNotIn(held, applied)
+		self.assertEqual(result, {"done": 1, "failed": 0, "pending": 2})
+
+	def test_unreachable_router_stops_the_replay(self):
+		first = make_operation("_Test Outbox A", "provision").name
+		make_operation("_Test Outbox B", "provision")
+
+		applied, result = self.replay({first: "Unreachable"})
+
+		self.assertEqual(applied, [first])
+		self.assertEqual(result, new_result())
+
+	def test_waiting_operation_is_not_retried(self):
+		waiting = make_operation(
+			"_Test Outbox A", "provision", attempts=1, next_attempt_at=add_to_date(now_datetime(), minutes=5)
+		).name
+		held = make_operation("_Test Outbox A", "disable").name
+		other = make_operation("_Test Outbox B", "provision").name
+
+		applied, result = self.replay({})
+
+		self.assertEqual(applied, [other])
+		self.assertNotIn(waiting, applied)
+		self.assertNotIn(held, applied)
+		self.assertEqual(result, {"done": 1, "failed": 0, "pending": 2})
+
+	def test_waiting_router_is_not_probed(self):
+		make_operation("_Test Outbox A", "provision", next_attempt_at=add_to_date(now_datetime(), minutes=5))
+		make_operation("_Test Outbox B", "provision", router="_Test Outbox Due Router")
+
+		with patch.object(mikrotik_router_operation, "enqueue_outbox_drain") as enqueue_outbox_drain:
+			enqueue_pending_outboxes()
+
+		routers = [call.args[0] for call in enqueue_outbox_drain.call_args_list]
+		self.assertIn("_Test Outbox Due Router", routers)
+		self.assertNotIn(TEST_ROUTER, routers)
+
+
+class TestApplyOperation(FrappeTestCase):
+	def setUp(self):
+		# A failing operation rolls back, so the rows must be committed first
+		self.operation = make_operation("_Test Outbox Missing Subscription", "provision")
+		frappe.db.commit()
+
+	def tearDown(self):
+		frappe.db.delete("MikroTik Router Operation", {"router": TEST_ROUTER})
+		frappe.db.commit()
+
+	def test_retry_delay_doubles(self):
+		self.assertEqual([get_retry_delay(n) for n in (1, 2, 3)], [60, 120, 240])
+
+	def test_failed_operation_waits_for_retry(self):
+		"""A failing operation is tried once per drain, not until it runs out of attempts"""
+		replay_operations(TEST_ROUTER, MagicMock(), new_result())
+		replay_operations(TEST_ROUTER, MagicMock(), new_result())
+
+		self.operation.reload()
+		self.assertEqual(self.operation.status, "Pending")
+		self.assertEqual(self.operation.attempts, 1)
+		self.assertGreater(self.operation.next_attempt_at, now_datetime())
+		self.assertIn("_Test Outbox Missing Subscription", self.operation.error)
+
+	def test_operation_fails_after_max_attempts(self):
+		frappe.db.set_value(
+			"MikroTik Router Operation", self.operation.name, "attempts", mikrotik_router_operation.MAX_ATTEMPTS - 1
+		)
+		frappe.db.commit()
+
+		result = new_result()
+		replay_operations(TEST_ROUTER, MagicMock(), result)
+
+		self.assertEqual(result, {"done": 0, "failed": 1, "pending": 0})
+		self.assertEqual(frappe.db.get_value("MikroTik Router Operation", self.operation.name, "status"), "Failed")
@@ -39,6 +39,35 @@ frappe.ui.form.on('MikroTik Settings', {
                 }
             });
         }, __('Actions'));
+
+        if (frm.doc.use_ssl && !frm.is_new()) {
+            frm.add_custom_button(__('TLS Handshake Stats'), function() {
+                frm.call('get_tls_metrics').then(r => {
+                    let m = r.message || {};
+                    let ms = value => value == null ? '-' : `${value.toFixed(1)} ms`;
+                    frappe.msgprint({
+                        title: __('TLS Handshakes'),
+                        indicator: 'blue',
+                        message: `<table class="table table-bordered">
+                            <tr><td>${__('Handshakes')}</td><td>${m.handshakes || 0}</td></tr>
+                            <tr><td>${__('Resumed')}</td><td>${m.resumed || 0} (${((m.resumption_rate || 0) * 100).toFixed(0)}%)</td></tr>
+                            <tr><td>${__('Average Full Handshake')}</td><td>${ms(m.avg_full_ms)}</td></tr>
+                            <tr><td>${__('Average Resumed Handshake')}</td><td>${ms(m.avg_resumed_ms)}</td></tr>
+                            <tr><td>${__('Last Handshake')}</td><td>${ms(m.last_ms)}</td></tr>
+                        </table>`
+                    });
+                });
+            }, __('Actions'));
+        }
+    },
+
+    use_ssl: function(frm) {
+        // api-ssl listens on 8729 by default
+        if (frm.doc.use_ssl && frm.doc.api_port == 8728) {
+            frm.set_value('api_port', 8729);
+        } else if (!frm.doc.use_ssl && frm.doc.api_port == 8729) {
+            frm.set_value('api_port', 8728);
+        }
     },
     
     api_host: function(frm) {
@@ -4,57 +4,137 @@
 import frappe
 from frappe.model.document import Document
 from frappe import _
+from frappe.utils import cint, flt
 import socket
 import routeros_api
+from mikrotik_integration.mikrotik_integration.placement import clear_router_scores
+from mikrotik_integration.mikrotik_integration.rate_limit import PRIORITY_INTERACTIVE, apply_rate_limit
+from mikrotik_integration.mikrotik_integration.tls import (
+    API_SSL_PORT,
+    close_pool,
+    get_handshake_metrics,
+    get_ssl_context,
+    normalize_fingerprint,
+)
+
+
+class RouterUnreachableError(frappe.ValidationError):
+    pass
+
 
 class MikroTikSettings(Document):
     def validate(self):
         """Validate MikroTik settings"""
-        pass
+        if self.command_rate_limit and self.command_rate_limit < 0:
+            frappe.throw(_("Command Rate Limit cannot be negative"))
+        if self.interactive_reserve and not 0 <= self.interactive_reserve < 100:
+            frappe.throw(_("Interactive Reserve must be between 0 and 100 percent"))
+        self.validate_command_burst()
+        self.validate_ssl()
+
+        if not self.is_new() and (self.has_value_changed("api_host") or self.has_value_changed("api_port")):
+            # A different address may be a different router, whose item IDs do not match
+            self.bump_generation()
+
+    def validate_command_burst(self):
+        """Make sure the reserve leaves background commands at least one token"""
+        if flt(self.command_rate_limit) <= 0:
+            return
+        burst = max(cint(self.command_burst or self.command_rate_limit), 1)
+        if burst * (1 - flt(self.interactive_reserve) / 100) < 1:
+            frappe.throw(_(
+                "A Command Burst of {0} with a {1}% Interactive Reserve leaves no commands for background"
+                " jobs. Raise the burst or lower the reserve."
+            ).format(burst, flt(self.interactive_reserve)))
+
+    def validate_ssl(self):
+        """Switch between the api and api-ssl default ports and check the TLS options"""
+        if self.has_value_changed("use_ssl"):
+            if self.use_ssl and self.api_port in (None, 0, 8728):
+                self.api_port = API_SSL_PORT
+            elif not self.use_ssl and self.api_port == API_SSL_PORT:
+                self.api_port = 8728
+
+        if self.ssl_certificate_fingerprint:
+            fingerprint = normalize_fingerprint(self.ssl_certificate_fingerprint)
+            if len(fingerprint) != 64:
+                frappe.throw(_("Certificate Fingerprint must be a SHA-256 fingerprint (64 hex digits)"))
+            self.ssl_certificate_fingerprint = fingerprint
+
+        if self.use_ssl and self.ssl_ca_certificate and "BEGIN CERTIFICATE" not in self.ssl_ca_certificate:
+            frappe.throw(_("CA Certificate must be in PEM format"))
+
+    def bump_generation(self):
+        """Invalidate the RouterOS item IDs cached on subscriptions for this router"""
+        self.router_generation = (self.router_generation or 0) + 1
+
+    def update_identity(self, identity):
+        """Record the name from /system/identity, treating a change as a new router"""
+        if identity and self.router_identity and identity != self.router_identity:
+            self.bump_generation()
+        self.router_identity = identity
     
-    def get_api_connection(self):
-        """Create and return a RouterOS API connection"""
+    def get_api_pool(self):
+        """Create a RouterOS API connection pool for this router"""
+        host = self.api_host.strip()
+        port = self.api_port or (API_SSL_PORT if self.use_ssl else 8728)  # Default API port
+        username = self.username
+        # Get the raw password value instead of the hashed version
+        password = self.password
+
+        # Log connection attempt (without password)
+        frappe.logger().debug(f"Attempting MikroTik connection to {host}:{port} with user {username}")
+
+        connection = routeros_api.RouterOsApiPool(
+            host=host,
+            username=username,
+            password=password,
+            port=port,
+            # RouterOS 6.43+ only accepts the plain login, which TLS keeps private on api-ssl
+            plaintext_login=True,
+            use_ssl=bool(self.use_ssl),
+            # Shared per worker so later connections resume the TLS session
+            ssl_context=get_ssl_context(self) if self.use_ssl else None
+        )
+        return connection
+
+    def get_api_connection(self, priority=PRIORITY_INTERACTIVE):
+        """Create and return a RouterOS API connection
+
+        Commands sent over it are paced by the router's token bucket in the given
+        priority lane; background jobs pass PRIORITY_BACKGROUND.
+        """
         try:
-            host = self.api_host.strip()
-            port = self.api_port or 8728  # Default API port
-            username = self.username
-            # Get the raw password value instead of the hashed version
-            password = self.password
-            
-            # Log connection attempt (without password)
-            frappe.logger().debug(f"Attempting MikroTik connection to {host}:{port} with user {username}")
-            
             # Create API connection pool
-            connection = routeros_api.RouterOsApiPool(
-                host=host,
-                username=username,
-                password=password,
-                port=port,
-                plaintext_login=not self.use_ssl  # Use encrypted login if SSL is enabled
-            )
+            connection = self.get_api_pool()
             
             # Get API connection
             api = connection.get_api()
+            # RouterOsApi has no close() of its own; callers close through the pool
+            api.close = lambda: close_pool(connection)
+            apply_rate_limit(api, self, priority)
             
-            # Test connection
-            api.get_resource('/system/resource').get()
+            # Test connection, keeping the answer for telemetry
+            api.system_resource = api.get_resource('/system/resource').get()
             return api
             
         except Exception as e:
             error_msg = str(e)
             if isinstance(e, routeros_api.exceptions.RouterOsApiConnectionClosedError):
-                frappe.throw(_('Connection was closed by the router. Please check if the API service is enabled and the port is correct.'))
+                frappe.throw(_('Connection was closed by the router. Please check if the API service is enabled and the port is correct.'), RouterUnreachableError)
             elif isinstance(e, routeros_api.exceptions.RouterOsApiConnectionError):
-                frappe.throw(_('Could not connect to router. Please check if the router is accessible and the IP/port are correct.'))
+                frappe.throw(_('Could not connect to router. Please check if the router is accessible and the IP/port are correct.'), RouterUnreachableError)
             elif isinstance(e, routeros_api.exceptions.RouterOsApiCommunicationError):
                 if "authentication failed" in error_msg.lower():
                     frappe.throw(_('Authentication failed. Please check the router username and password.'))
                 else:
                     frappe.throw(_('Communication error with router. Please check your connection settings.'))
             elif "connection refused" in error_msg.lower():
-                frappe.throw(_('Connection refused. Please check if the router is accessible and the API port is correct.'))
+                frappe.throw(_('Connection refused. Please check if the router is accessible and the API port is correct.'), RouterUnreachableError)
             elif "network unreachable" in error_msg.lower():
-                frappe.throw(_('Network unreachable. Please check if the router IP/hostname is correct.'))
+                frappe.throw(_('Network unreachable. Please check if the router IP/hostname is correct.'), RouterUnreachableError)
+            elif isinstance(e, OSError):
+                frappe.throw(_('Could not reach router: {0}').format(error_msg), RouterUnreachableError)
             else:
                 frappe.throw(_('Could not establish connection to router: {0}').format(error_msg))
 
@@ -75,19 +155,28 @@ class MikroTikSettings(Document):
         """Clear the cache after saving settings"""
         frappe.cache().delete_key('mikrotik_settings')
 
+    def on_update(self):
+        # Capacity, placement or disabled may have changed
+        clear_router_scores()
+
     @frappe.whitelist()
     def test_connection(self):
         """Endpoint for testing connection from the frontend"""
         self.validate_connection()
         return True
 
+    @frappe.whitelist()
+    def get_tls_metrics(self):
+        """TLS handshake counts, resumption rate and latency for this router"""
+        return get_handshake_metrics(self.name)
+
     @frappe.whitelist()
     def check_connection_status(self):
         """Simple ping test to router"""
         try:
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             sock.settimeout(2)  # Quick timeout for ping-like behavior
-            sock.connect((self.api_host.strip(), self.api_port or 8728))
+            sock.connect((self.api_host.strip(), self.api_port or (API_SSL_PORT if self.use_ssl else 8728)))
             sock.close()
             return True
         except:
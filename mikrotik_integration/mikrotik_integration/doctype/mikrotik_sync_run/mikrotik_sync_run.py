@@ -0,0 +1,108 @@
+# Copyright (c) 2026, ronoh and contributors
+# For license information, please see license.txt
+
+import time
+from contextlib import contextmanager
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import add_days, cint, now
+
+from mikrotik_integration.mikrotik_integration.rate_limit import get_router_call_count, reset_router_call_count
+
+DEFAULT_RETENTION_DAYS = 30
+WRITE_STATUS_VARIABLES = ("Com_insert", "Com_update", "Com_delete", "Com_replace")
+
+
+class MikroTikSyncRun(Document):
+    pass
+
+
+def get_db_write_count():
+    """Write statements issued on this connection so far, or None if unknown"""
+    if frappe.db.db_type != "mariadb":
+        return None
+    try:
+        rows = frappe.db.sql(
+            "show session status where Variable_name in %(names)s",
+            {"names": WRITE_STATUS_VARIABLES}
+        )
+    except Exception:
+        return None
+    return sum(cint(value) for _name, value in rows)
+
+
+@contextmanager
+def record_sync_run(job, router=None, run_id=None):
+    """Record one execution of a sync job in the ledger
+
+    The enclosed block fills `run.result` with its counters (`scanned`,
+    `changed`, `errors`, `skipped`). Router commands and DB writes are counted
+    around the block, and the run is stored with a single insert at the end.
+    """
+    run = frappe._dict(result=None, error=None)
+    reset_router_call_count()
+    writes_before = get_db_write_count()
+    started_at = now()
+    started = time.monotonic()
+    try:
+        yield run
+    except Exception as e:
+        run.error = str(e)
+        raise
+    finally:
+        duration = time.monotonic() - started
+        writes_after = get_db_write_count()
+        db_writes = None
+        if writes_before is not None and writes_after is not None:
+            db_writes = max(writes_after - writes_before, 0)
+        save_sync_run(job, router, run_id, run, started_at, duration, db_writes)
+
+
+def get_run_status(run):
+    result = run.result or {}
+    if run.error:
+        return "Failed"
+    if result.get("skipped"):
+        return "Skipped"
+    if cint(result.get("errors")):
+        return "Partial" if cint(result.get("changed")) or cint(result.get("scanned")) else "Failed"
+    return "Success"
+
+
+def save_sync_run(job, router, run_id, run, started_at, duration, db_writes):
+    result = run.result or {}
+    try:
+        frappe.get_doc({
+            "doctype": "MikroTik Sync Run",
+            "job": job,
+            "router": router,
+            "run_id": run_id,
+            "status": get_run_status(run),
+            "started_at": started_at,
+            "finished_at": now(),
+            "duration_seconds": duration,
+            "rows_scanned": cint(result.get("scanned")),
+            "rows_changed": cint(result.get("changed")),
+            "errors": cint(result.get("errors")) + (1 if run.error else 0),
+            "router_calls": get_router_call_count(),
+            "db_writes": db_writes,
+            "error": run.error
+        }).insert(ignore_permissions=True)
+        frappe.db.commit()
+    except Exception as e:
+        # The ledger must never break the job it records
+        frappe.db.rollback()
+        frappe.log_error(f"Could not record sync run of {job} for router {router}: {str(e)}")
+
+
+def clear_old_sync_runs():
+    """Delete sync runs older than `mikrotik_sync_run_retention_days` (default 30)"""
+    days = cint(frappe.conf.get("mikrotik_sync_run_retention_days")) or DEFAULT_RETENTION_DAYS
+    with record_sync_run("clear_old_sync_runs"):
+        frappe.db.delete("MikroTik Sync Run", {"creation": ["<", add_days(now(), -days)]})
+        frappe.db.commit()
+
+
+def on_doctype_update():
+    frappe.db.add_index("MikroTik Sync Run", ["job", "started_at"])
@@ -0,0 +1,89 @@
+# Copyright (c) 2026, ronoh and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from mikrotik_integration.mikrotik_integration import profiler, sharding
+from mikrotik_integration.mikrotik_integration.doctype.mikrotik_sync_run import mikrotik_sync_run
+from mikrotik_integration.mikrotik_integration.doctype.mikrotik_sync_run.mikrotik_sync_run import (
+	get_run_status,
+	record_sync_run,
+)
+
+
+def record_router_job(router, **kwargs):
+	return {"scanned": 2, "changed": 1}
+
+
+class TestGetRunStatus(FrappeTestCase):
+	def status(self, result=None, error=None):
+		return get_run_status(frappe._dict(result=result, error=error))
+
+	def test_statuses(self):
+		self.assertEqual(self.status({"scanned": 5, "changed": 2}), "Success")
+		self.assertEqual(self.status(None), "Success")
+		self.assertEqual(self.status({"skipped": 1}), "Skipped")
+		self.assertEqual(self.status({"scanned": 5, "errors": 1}), "Partial")
+		self.assertEqual(self.status({"errors": 1}), "Failed")
+
+	def test_error_fails_the_run(self):
+		self.assertEqual(self.status({"scanned": 5, "changed": 5}, error="boom"), "Failed")
+		self.assertEqual(self.status({"skipped": 1}, error="boom"), "Failed")
+
+
+class TestRecordSyncRun(FrappeTestCase):
+	def setUp(self):
+		self.run_id = f"_test_sync_run::{frappe.generate_hash(length=10)}"
+		# The ledger commits its row; the test's changes are rolled back instead
+		self.commit = patch.object(frappe.db, "commit")
+		self.commit.start()
+
+	def tearDown(self):
+		self.commit.stop()
+
+	def get_run(self):
+		return frappe.get_doc("MikroTik Sync Run", {"run_id": self.run_id})
+
+	def test_run_is_recorded(self):
+		with record_sync_run("_test_job", run_id=self.run_id) as run:
+			run.result = {"scanned": 3, "changed": 1}
+
+		recorded = self.get_run()
+		self.assertEqual(recorded.job, "_test_job")
+		self.assertEqual(recorded.status, "Success")
+		self.assertEqual((recorded.rows_scanned, recorded.rows_changed, recorded.errors), (3, 1, 0))
+		self.assertGreaterEqual(recorded.duration_seconds, 0)
+
+	def test_failed_run_is_recorded_and_raised(self):
+		with self.assertRaises(ValueError):
+			with record_sync_run("_test_job", run_id=self.run_id) as run:
+				run.result = {"scanned": 3}
+				raise ValueError("router went away")
+
+		recorded = self.get_run()
+		self.assertEqual(recorded.status, "Failed")
+		self.assertEqual(recorded.errors, 1)
+		self.assertEqual(recorded.error, "router went away")
+
+	def test_ledger_errors_do_not_break_the_job(self):
+		with patch.object(mikrotik_sync_run, "get_run_status", side_effect=ValueError("bad result")):
+			with record_sync_run("_test_job", run_id=self.run_id) as run:
+				run.result = {"scanned": 3}
+
+		self.assertFalse(frappe.db.exists("MikroTik Sync Run", {"run_id": self.run_id}))
+
+	def test_profile_is_saved_after_the_run(self):
+		"""The profile's insert happens outside the ledger block, so it is not counted as the job's write"""
+		saved = []
+		with patch.object(profiler, "is_profiling_enabled", return_value=True), \
+				patch.object(profiler, "save_profile", side_effect=lambda *args: saved.append("profile")), \
+				patch.object(mikrotik_sync_run, "save_sync_run", side_effect=lambda *args: saved.append("run")), \
+				patch.object(sharding, "record_router_result"):
+			sharding.run_router_job(
+				"_test_job", f"{__name__}.record_router_job", self.run_id, "_Test Sync Run Router"
+			)
+
+		self.assertEqual(saved, ["run", "profile"])
@@ -0,0 +1,36 @@
+// Copyright (c) 2026, ronoh and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on("MikroTik User Import", {
+    refresh(frm) {
+        if (frm.is_new() || ['Queued', 'Running'].includes(frm.doc.status)) {
+            return;
+        }
+
+        frm.add_custom_button(__('Scan Router'), function() {
+            frm.call({
+                method: 'scan_router',
+                doc: frm.doc,
+                freeze: true,
+                freeze_message: __('Reading users from the router...')
+            }).then(() => frm.reload_doc());
+        });
+
+        if (!(frm.doc.profiles || []).some(row => row.internet_plan)) {
+            return;
+        }
+
+        let label = __('Start Import');
+        if (frm.doc.status === 'Completed') {
+            label = __('Import Again');
+        } else if (frm.doc.last_imported) {
+            label = __('Resume Import');
+        }
+        frm.add_custom_button(label, function() {
+            frm.call('start_import').then(() => {
+                frappe.show_alert({message: __('Import queued'), indicator: 'blue'});
+                frm.reload_doc();
+            });
+        }).addClass('btn-primary');
+    }
+});
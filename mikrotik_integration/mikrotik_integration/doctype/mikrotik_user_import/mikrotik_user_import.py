@@ -0,0 +1,446 @@
+# Copyright (c) 2026, ronoh and contributors
+# For license information, please see license.txt
+
+import re
+
+import frappe
+from frappe import _
+from frappe.model.document import Document
+from frappe.model.naming import make_autoname
+from frappe.utils import add_days, cint, flt, now, today
+from frappe.utils.background_jobs import is_job_enqueued
+from frappe.utils.password import encrypt
+
+from mikrotik_integration.mikrotik_integration.batching import get_chunk_size
+from mikrotik_integration.mikrotik_integration.drivers import get_driver
+from mikrotik_integration.mikrotik_integration.rate_limit import PRIORITY_BACKGROUND
+from mikrotik_integration.mikrotik_integration.doctype.customer_subscription.customer_subscription import (
+    get_service_name,
+)
+from mikrotik_integration.mikrotik_integration.doctype.mikrotik_router_counter.mikrotik_router_counter import (
+    apply_rows_added,
+)
+
+IMPORT_JOB_TIMEOUT = 3600
+# Router user tables read by the import, by the service of their driver
+IMPORT_SERVICES = ("hotspot", "pppoe")
+# Secrets allowed on any PPP service are imported as PPPoE, the common case
+SERVICE_ALIASES = {"any": "pppoe"}
+# A phone number in a user's comment, the rest of the comment is taken as the customer's name
+PHONE_PATTERN = re.compile(r"\+?\d{9,15}")
+CUSTOMER_NAME_LENGTH = 100
+CUSTOMER_FIELDS = [
+    "name", "customer_name", "naming_series", "customer_type", "customer_group", "territory",
+    "creation", "modified", "owner", "modified_by", "docstatus"
+]
+SUBSCRIPTION_FIELDS = [
+    "name", "customer", "customer_name", "status", "subscription_id", "internet_plan", "connection_type",
+    "price", "currency", "payment_method", "phone_number", "payment_status", "payment_date",
+    "mikrotik_settings", "username_mikrotik", "password_mikrotik", "data_used_mb",
+    "start_date", "expiry_date",
+    "mikrotik_item_id", "mikrotik_item_router", "mikrotik_item_generation", "is_online",
+    "creation", "modified", "owner", "modified_by", "docstatus"
+]
+
+
+class MikroTikUserImport(Document):
+    def validate(self):
+        for row in self.profiles:
+            if not row.internet_plan:
+                continue
+            plan_type = frappe.get_cached_value("Internet Plan", row.internet_plan, "connection_type")
+            row.connection_type = row.connection_type or plan_type
+            if plan_type != row.connection_type:
+                frappe.throw(_("Row {0}: Internet Plan {1} is not a {2} plan").format(
+                    row.idx, row.internet_plan, row.connection_type
+                ))
+            if get_service_name(row.connection_type) != row.service_name:
+                frappe.throw(_("Row {0}: Connection Type {1} is not a {2} connection").format(
+                    row.idx, row.connection_type, row.service_name
+                ))
+
+    @frappe.whitelist()
+    def scan_router(self):
+        """List the router's profiles with their user counts and suggest a plan for each"""
+        frappe.has_permission(self.doctype, "write", self, throw=True)
+        self.check_not_running()
+
+        api = frappe.get_doc("MikroTik Settings", self.router).get_api_connection()
+        try:
+            users = get_router_users(api)
+        finally:
+            api.close()
+
+        counts = {}
+        for user in users:
+            key = (user.service_name, user.profile)
+            counts[key] = counts.get(key, 0) + 1
+
+        # A rescan keeps the plans already picked
+        picked = {(row.service_name, row.profile): row for row in self.profiles}
+        self.set("profiles", [])
+        for (service_name, profile), count in sorted(counts.items()):
+            row = picked.get((service_name, profile))
+            connection_type = (row and row.connection_type) or find_connection_type(service_name, profile)
+            internet_plan = (row and row.internet_plan) or find_internet_plan(connection_type)
+            self.append("profiles", {
+                "service_name": service_name,
+                "profile": profile,
+                "user_count": count,
+                "connection_type": connection_type,
+                "internet_plan": internet_plan
+            })
+
+        self.total_users = len(users)
+        self.save()
+        return self.total_users
+
+    @frappe.whitelist()
+    def start_import(self):
+        """Queue the import, continuing after the last imported user if an earlier run stopped"""
+        frappe.has_permission(self.doctype, "write", self, throw=True)
+        self.check_not_running()
+        if not any(row.internet_plan for row in self.profiles):
+            frappe.throw(_("Scan the router and pick an Internet Plan for at least one profile"))
+        if not self.default_phone_number:
+            # Subscriptions cannot be saved again, e.g. to suspend them, without a phone number
+            frappe.throw(_("Set the Phone Number for Users Without One"))
+
+        values = {"status": "Queued", "error": None}
+        if self.status == "Completed":
+            # Importing again picks up users added since; the ones imported before are recognised
+            values.update(last_imported=None, imported_users=0, existing_users=0, skipped_users=0)
+        self.db_set(values)
+        enqueue_user_import(self.name)
+
+    def check_not_running(self):
+        # A run whose worker died stays Running, so the queue decides
+        if self.status in ("Queued", "Running") and is_job_enqueued(get_import_job_id(self.name)):
+            frappe.throw(_("The import of router {0} is already running").format(self.router))
+
+
+def find_connection_type(service_name, profile):
+    return frappe.db.get_value("Connection Type", {"service_name": service_name, "profile_name": profile})
+
+
+def find_internet_plan(connection_type):
+    """The cheapest active plan of a connection type"""
+    if not connection_type:
+        return None
+    return frappe.db.get_value(
+        "Internet Plan",
+        {"connection_type": connection_type, "status": "Active"},
+        "name",
+        order_by="price asc"
+    )
+
+
+def get_router_users(api):
+    """Every static hotspot user and PPP secret of the router, sorted by import key
+
+    The key, `service/name`, orders the import so an interrupted run can
+    continue after the last user it committed.
+    """
+    users = []
+    for driver_service in IMPORT_SERVICES:
+        for name, row in get_driver(api, driver_service).list().items():
+            if not name or row.get("dynamic") == "true":
+                continue
+            service_name = driver_service
+            if driver_service != "hotspot":
+                service_name = row.get("service") or "any"
+                service_name = SERVICE_ALIASES.get(service_name, service_name)
+
+            comment = row.get("comment") or ""
+            phone = PHONE_PATTERN.search(comment)
+            customer_name = PHONE_PATTERN.sub("", comment).strip(" ,;-/")[:CUSTOMER_NAME_LENGTH].strip()
+            users.append(frappe._dict(
+                key=f"{service_name}/{name}",
+                service_name=service_name,
+                name=name,
+                password=row.get("password") or "",
+                profile=row.get("profile") or "default",
+                customer_name=customer_name or name,
+                phone_number=phone.group() if phone else None,
+                row=row
+            ))
+    return sorted(users, key=lambda user: user.key)
+
+
+def get_import_job_id(user_import):
+    return f"mikrotik_user_import::{user_import}"
+
+
+def enqueue_user_import(user_import):
+    frappe.enqueue(
+        "mikrotik_integration.mikrotik_integration.doctype.mikrotik_user_import.mikrotik_user_import.run_import",
+        queue="long",
+        timeout=IMPORT_JOB_TIMEOUT,
+        job_id=get_import_job_id(user_import),
+        deduplicate=True,
+        enqueue_after_commit=True,
+        user_import=user_import
+    )
+
+
+def run_import(user_import):
+    """Import a router's users one chunk per transaction
+
+    The resume point is saved in the same transaction as each chunk's
+    records, so a run that is interrupted, or fails, continues after the
+    last user it committed when started again.
+    """
+    doc = frappe.get_doc("MikroTik User Import", user_import)
+    doc.db_set({"status": "Running", "started_at": now(), "finished_at": None, "error": None}, notify=True)
+    frappe.db.commit()
+
+    try:
+        router = frappe.get_doc("MikroTik Settings", doc.router)
+        api = router.get_api_connection(priority=PRIORITY_BACKGROUND)
+        try:
+            users = get_router_users(api)
+        finally:
+            api.close()
+
+        settings = get_import_settings(doc)
+        pending = [user for user in users if not doc.last_imported or user.key > doc.last_imported]
+        chunk_size = get_chunk_size()
+        done = len(users) - len(pending)
+
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+            counts = import_chunk(router, chunk, settings)
+            doc.db_set({
+                "last_imported": chunk[-1].key,
+                "imported_users": cint(doc.imported_users) + counts["imported"],
+                "existing_users": cint(doc.existing_users) + counts["existing"],
+                "skipped_users": cint(doc.skipped_users) + counts["skipped"]
+            }, update_modified=False)
+            frappe.db.commit()
+
+            done += len(chunk)
+            frappe.publish_progress(
+                done * 100 / len(users),
+                title=_("Importing router users"),
+                doctype=doc.doctype,
+                docname=doc.name,
+                description=_("{0} of {1} users").format(done, len(users))
+            )
+
+        doc.db_set({"status": "Completed", "total_users": len(users), "finished_at": now()}, notify=True)
+    except Exception as e:
+        frappe.db.rollback()
+        frappe.log_error(
+            f"Error importing users of router {doc.router}: {str(e)}",
+            "MikroTik User Import Error"
+        )
+        doc.db_set({"status": "Failed", "error": str(e), "finished_at": now()}, notify=True)
+    frappe.db.commit()
+
+
+def get_import_settings(doc):
+    """What every chunk of an import needs, read once per run"""
+    plans = {}
+    for row in doc.profiles:
+        if not row.internet_plan:
+            continue
+        plan = frappe.get_cached_value(
+            "Internet Plan", row.internet_plan, ["price", "currency", "validity_days"], as_dict=True
+        )
+        plans[(row.service_name, row.profile)] = frappe._dict(
+            plan, internet_plan=row.internet_plan, connection_type=row.connection_type
+        )
+
+    naming_series = None
+    if frappe.db.get_single_value("Selling Settings", "cust_master_name") == "Naming Series":
+        naming_series = (frappe.get_meta("Customer").get_field("naming_series").options or "").split("\n")[0]
+        if "#" not in naming_series:
+            naming_series += ".#####"
+
+    return frappe._dict(
+        plans=plans,
+        naming_series=naming_series,
+        customer_group=doc.customer_group or frappe.db.get_single_value("Selling Settings", "customer_group"),
+        territory=doc.territory or frappe.db.get_single_value("Selling Settings", "territory"),
+        match_existing_customers=cint(doc.match_existing_customers),
+        default_phone_number=doc.default_phone_number
+    )
+
+
+def import_chunk(router, users, settings):
+    """Insert the Customers and submitted Customer Subscriptions of one chunk of users
+
+    Subscriptions are written as they are on the router, so none is
+    provisioned again; users without a plan, or already subscribed, are
+    left alone.
+    """
+    mapped = [user for user in users if (user.service_name, user.profile) in settings.plans]
+    existing = get_existing_users(router.name, mapped)
+    new_users = [user for user in mapped if user.key not in existing]
+
+    if new_users:
+        customers = get_customers(new_users, settings)
+        rows = insert_subscriptions(router, new_users, customers, settings)
+        # Bulk inserts skip the document hooks that keep the router counters
+        apply_rows_added(rows)
+
+    return {
+        "imported": len(new_users),
+        "existing": len(mapped) - len(new_users),
+        "skipped": len(users) - len(mapped)
+    }
+
+
+def get_existing_users(router_name, users):
+    """Import keys of the users that already have a subscription or voucher on the router"""
+    names = list({user.name for user in users})
+    if not names:
+        return set()
+
+    existing = {
+        f"{get_service_name(row.connection_type)}/{row.username_mikrotik}"
+        for row in frappe.get_all(
+            "Customer Subscription",
+            filters={
+                "mikrotik_settings": router_name,
+                "username_mikrotik": ["in", names],
+                "docstatus": ["<", 2]
+            },
+            fields=["username_mikrotik", "connection_type"]
+        )
+    }
+    existing.update(
+        f"hotspot/{name}"
+        for name in frappe.get_all(
+            "Hotspot Voucher",
+            filters={"name": ["in", names], "mikrotik_settings": router_name},
+            pluck="name"
+        )
+    )
+    return existing
+
+
+def get_customers(users, settings):
+    """The Customer of each user, inserted in bulk where none is matched by name
+
+    With matching, users with the same customer name share one Customer.
+    """
+    matched = {}
+    if settings.match_existing_customers:
+        for row in frappe.get_all(
+            "Customer",
+            filters={"customer_name": ["in", list({user.customer_name for user in users})], "disabled": 0},
+            fields=["name", "customer_name"],
+            order_by="creation asc"
+        ):
+            matched.setdefault(row.customer_name, row.name)
+
+        titles = list(dict.fromkeys(
+            user.customer_name for user in users if user.customer_name not in matched
+        ))
+        matched.update(zip(titles, insert_customers(titles, settings)))
+        return [matched[user.customer_name] for user in users]
+
+    return insert_customers([user.customer_name for user in users], settings)
+
+
+def insert_customers(titles, settings):
+    if not titles:
+        return []
+
+    names = make_customer_names(titles, settings)
+    timestamp = now()
+    owner = frappe.session.user
+    frappe.db.bulk_insert("Customer", CUSTOMER_FIELDS, [
+        (
+            name, title, settings.naming_series, "Individual", settings.customer_group, settings.territory,
+            timestamp, timestamp, owner, owner, 0
+        )
+        for name, title in zip(names, titles)
+    ])
+    return names
+
+
+def make_customer_names(titles, settings):
+    """Customer names as ERPNext would give them, by naming series or by customer name"""
+    if settings.naming_series:
+        return [make_autoname(settings.naming_series, "Customer") for _title in titles]
+
+    taken = set(frappe.get_all("Customer", filters={"name": ["in", list(set(titles))]}, pluck="name"))
+    names = []
+    for title in titles:
+        name, suffix = title, 0
+        while name in taken or (suffix and frappe.db.exists("Customer", name)):
+            suffix += 1
+            name = f"{title} - {suffix}"
+        taken.add(name)
+        names.append(name)
+    return names
+
+
+def insert_subscriptions(router, users, customers, settings):
+    """Insert submitted subscriptions for router users, returning the inserted rows"""
+    timestamp = now()
+    owner = frappe.session.user
+    start_date = today()
+    rows = []
+    for user, customer in zip(users, customers):
+        plan = settings.plans[(user.service_name, user.profile)]
+        data_used = flt(user.row.get("bytes-in")) + flt(user.row.get("bytes-out"))
+        rows.append(frappe._dict(
+            name=frappe.generate_hash(length=10),
+            customer=customer,
+            customer_name=user.customer_name,
+            status="Suspended" if user.row.get("disabled") == "true" else "Active",
+            subscription_id=f"SUB-{frappe.generate_hash(length=8)}",
+            internet_plan=plan.internet_plan,
+            connection_type=plan.connection_type,
+            price=plan.price,
+            currency=plan.currency,
+            payment_method="M-Pesa",
+            phone_number=user.phone_number or settings.default_phone_number,
+            # The users were paid up on the router; their next renewal is billed as usual
+            payment_status="Completed",
+            payment_date=None,
+            mikrotik_settings=router.name,
+            username_mikrotik=user.name,
+            # Password fields hold a mask, the password itself is kept encrypted in __Auth
+            password_mikrotik="*" * len(user.password),
+            data_used_mb=cint(data_used / (1024 * 1024)),
+            start_date=start_date,
+            expiry_date=add_days(start_date, cint(plan.validity_days)),
+            mikrotik_item_id=user.row.get("id"),
+            mikrotik_item_router=router.name,
+            mikrotik_item_generation=cint(router.router_generation),
+            is_online=0,
+            creation=timestamp,
+            modified=timestamp,
+            owner=owner,
+            modified_by=owner,
+            docstatus=1
+        ))
+
+    frappe.db.bulk_insert(
+        "Customer Subscription",
+        SUBSCRIPTION_FIELDS,
+        [tuple(row[field] for field in SUBSCRIPTION_FIELDS) for row in rows]
+    )
+    insert_passwords([
+        (row.name, user.password) for row, user in zip(rows, users) if user.password
+    ])
+    return rows
+
+
+def insert_passwords(passwords):
+    """Store (subscription, password) pairs the way a saved Password field does"""
+    if not passwords:
+        return
+    auth = frappe.qb.Table("__Auth")
+    (
+        frappe.qb.into(auth)
+        .columns(auth.doctype, auth.name, auth.fieldname, auth.password, auth.encrypted)
+        .insert(*[
+            ("Customer Subscription", name, "password_mikrotik", encrypt(password), 1)
+            for name, password in passwords
+        ])
+    ).run()
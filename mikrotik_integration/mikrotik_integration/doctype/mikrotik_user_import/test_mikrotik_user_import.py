@@ -0,0 +1,93 @@
+# Copyright (c) 2026, ronoh and Contributors
+# See license.txt
+
+from unittest.mock import MagicMock, patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from mikrotik_integration.mikrotik_integration.doctype.mikrotik_user_import import mikrotik_user_import
+from mikrotik_integration.mikrotik_integration.doctype.mikrotik_user_import.mikrotik_user_import import (
+	get_import_settings,
+	get_router_users,
+	import_chunk,
+)
+from mikrotik_integration.tests.utils import make_internet_plan, make_router, offline_router
+
+
+def make_api(hotspot_users):
+	"""An api whose hotspot driver lists the given rows and whose PPP driver lists none"""
+	drivers = {"hotspot": MagicMock(), "pppoe": MagicMock()}
+	drivers["hotspot"].list.return_value = {row["name"]: row for row in hotspot_users}
+	drivers["pppoe"].list.return_value = {}
+	return patch.object(mikrotik_user_import, "get_driver", side_effect=lambda api, service: drivers[service])
+
+
+class TestMikroTikUserImport(FrappeTestCase):
+	def setUp(self):
+		self.router = frappe.get_doc("MikroTik Settings", make_router(
+			f"_Test Import Router {frappe.generate_hash(length=6)}"
+		))
+		self.plan = make_internet_plan()
+		self.doc = frappe.get_doc({
+			"doctype": "MikroTik User Import",
+			"router": self.router.name,
+			"customer_group": frappe.db.get_value("Customer Group", {"is_group": 0}),
+			"territory": frappe.db.get_value("Territory", {"is_group": 0}),
+			"default_phone_number": "254711111111",
+			"profiles": [{
+				"service_name": "hotspot",
+				"profile": "default",
+				"connection_type": frappe.db.get_value("Internet Plan", self.plan, "connection_type"),
+				"internet_plan": self.plan
+			}]
+		}).insert()
+
+	def import_users(self, rows):
+		with make_api(rows):
+			users = get_router_users(MagicMock())
+		return import_chunk(self.router, users, get_import_settings(self.doc))
+
+	def get_subscription(self, username):
+		name = frappe.db.get_value(
+			"Customer Subscription", {"mikrotik_settings": self.router.name, "username_mikrotik": username}
+		)
+		return frappe.get_doc("Customer Subscription", name)
+
+	def test_phone_number_from_comment_or_default(self):
+		counts = self.import_users([
+			{"id": "*1", "name": "alice", "password": "secret", "comment": "Alice Wanjiru 254722222222"},
+			{"id": "*2", "name": "bob", "password": "secret", "comment": "Bob"},
+		])
+
+		self.assertEqual(counts, {"imported": 2, "existing": 0, "skipped": 0})
+		self.assertEqual(self.get_subscription("alice").phone_number, "254722222222")
+		self.assertEqual(self.get_subscription("bob").phone_number, "254711111111")
+		self.assertEqual(self.get_subscription("bob").customer_name, "Bob")
+
+	def test_imported_user_can_be_suspended(self):
+		self.import_users([{"id": "*1", "name": "carol", "password": "secret"}])
+		subscription = self.get_subscription("carol")
+		self.assertEqual(subscription.status, "Active")
+
+		with offline_router():
+			subscription.suspend()
+
+		self.assertEqual(frappe.db.get_value("Customer Subscription", subscription.name, "status"), "Suspended")
+		self.assertEqual(
+			frappe.db.get_value("MikroTik Router Counter", self.router.name, "active_subscriptions"), 0
+		)
+
+	def test_users_are_imported_once(self):
+		self.import_users([{"id": "*1", "name": "dave", "password": "secret"}])
+
+		counts = self.import_users([
+			{"id": "*1", "name": "dave", "password": "secret"},
+			{"id": "*2", "name": "erin", "password": "secret", "profile": "unmapped"},
+		])
+
+		self.assertEqual(counts, {"imported": 0, "existing": 1, "skipped": 1})
+
+	def test_import_needs_a_fallback_phone_number(self):
+		self.doc.default_phone_number = None
+		self.assertRaises(frappe.MandatoryError, self.doc.save)
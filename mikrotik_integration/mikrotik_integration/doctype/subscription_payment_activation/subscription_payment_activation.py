@@ -0,0 +1,252 @@
+# Copyright (c) 2026, ronoh and contributors
+# For license information, please see license.txt
+
+import time
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import add_to_date, cint, get_datetime, now, now_datetime, time_diff_in_seconds
+
+from mikrotik_integration.mikrotik_integration.doctype.mikrotik_sync_run.mikrotik_sync_run import record_sync_run
+from mikrotik_integration.mikrotik_integration.sharding import acquire_lease, release_lease
+
+ACTIVATION_BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+# Wait before the first retry, doubled after every further failure
+RETRY_DELAY_SECONDS = 30
+ACTIVATION_JOB_TIMEOUT = 600
+
+
+class SubscriptionPaymentActivation(Document):
+    pass
+
+
+def queue_payment_activation(subscription, trans_id, payment_type="M-Pesa"):
+    """Record a payment and queue its activation, once per transaction ID
+
+    This runs inside the payment callback, so it only does one insert and an
+    enqueue. Returns False for a duplicate callback.
+    """
+    if not trans_id:
+        frappe.throw(frappe._("Payment transaction ID is required"))
+
+    router = frappe.db.get_value("Customer Subscription", subscription, "mikrotik_settings")
+    try:
+        frappe.get_doc({
+            "doctype": "Subscription Payment Activation",
+            "trans_id": trans_id,
+            "subscription": subscription,
+            "router": router,
+            "payment_type": payment_type,
+            "status": "Queued",
+            "received_at": now()
+        }).insert(ignore_permissions=True)
+    except frappe.DuplicateEntryError:
+        # The payment provider delivered the same callback again
+        frappe.clear_last_message()
+        return False
+
+    enqueue_activation(router)
+    return True
+
+
+def get_activation_job_id(router):
+    return f"mikrotik_payment_activation::{router or 'none'}"
+
+
+def enqueue_activation(router):
+    frappe.enqueue(
+        "mikrotik_integration.mikrotik_integration.doctype.subscription_payment_activation.subscription_payment_activation.process_activations",
+        queue="short",
+        timeout=ACTIVATION_JOB_TIMEOUT,
+        job_id=get_activation_job_id(router),
+        deduplicate=True,
+        enqueue_after_commit=True,
+        router=router
+    )
+
+
+def enqueue_pending_activations():
+    """Scheduler safety net: restart draining for any router with queued payments"""
+    routers = frappe.get_all(
+        "Subscription Payment Activation",
+        filters={"status": "Queued"},
+        or_filters=get_due_or_filters(),
+        pluck="router",
+        distinct=True
+    )
+    for router in routers:
+        enqueue_activation(router)
+
+
+def process_activations(router=None):
+    """Activate queued payments for one router, a batch at a time over one connection
+
+    A lease makes sure only one worker drains a router, and each activation is
+    marked done in the same transaction as the subscription update, so every
+    payment is activated exactly once.
+    """
+    lease_key = get_activation_job_id(router)
+    token = acquire_lease(lease_key, ttl=ACTIVATION_JOB_TIMEOUT)
+    if not token:
+        return
+
+    api = None
+    result = {"scanned": 0, "changed": 0, "errors": 0}
+    try:
+        with record_sync_run("process_activations", router) as run:
+            run.result = result
+            if router:
+                api = frappe.get_doc("MikroTik Settings", router).get_api_connection()
+            drain_activations(router, api, result)
+    finally:
+        if api:
+            api.close()
+        release_lease(lease_key, token)
+
+
+def get_due_or_filters():
+    """Activations never tried, or whose retry delay is over"""
+    return [["next_attempt_at", "is", "not set"], ["next_attempt_at", "<=", now()]]
+
+
+def get_retry_delay(attempts):
+    return RETRY_DELAY_SECONDS * 2 ** (max(attempts, 1) - 1)
+
+
+def drain_activations(router, api, result):
+    """Activate due payments until none is left
+
+    A failed activation is not due again before its retry delay, so a router
+    that is briefly down does not use up its attempts within one drain.
+    """
+    while True:
+        pending = frappe.get_all(
+            "Subscription Payment Activation",
+            filters={"status": "Queued", "router": router or ["is", "not set"]},
+            or_filters=get_due_or_filters(),
+            fields=["name", "subscription", "payment_type", "received_at", "attempts"],
+            order_by="creation asc",
+            limit_page_length=ACTIVATION_BATCH_SIZE
+        )
+        if not pending:
+            break
+
+        for activation in pending:
+            result["scanned"] += 1
+            if activate_payment(activation, api):
+                result["changed"] += 1
+            else:
+                result["errors"] += 1
+
+        if len(pending) < ACTIVATION_BATCH_SIZE:
+            break
+
+
+def activate_payment(activation, api=None):
+    try:
+        subscription = frappe.get_doc("Customer Subscription", activation.subscription)
+        subscription.handle_payment_success(activation.name, activation.payment_type, api=api)
+
+        frappe.db.set_value("Subscription Payment Activation", activation.name, {
+            "status": "Activated",
+            "attempts": cint(activation.attempts) + 1,
+            "activated_at": now(),
+            "activation_seconds": time_diff_in_seconds(now_datetime(), get_datetime(activation.received_at)),
+            "error": None
+        })
+        frappe.db.commit()
+        return True
+    except Exception as e:
+        frappe.db.rollback()
+        # Written after the rollback, so it is committed with the attempt below
+        frappe.log_error(
+            title=f"Payment activation failed for subscription {activation.subscription}",
+            reference_doctype="Subscription Payment Activation",
+            reference_name=activation.name
+        )
+        attempts = cint(activation.attempts) + 1
+        frappe.db.set_value("Subscription Payment Activation", activation.name, {
+            "status": "Failed" if attempts >= MAX_ATTEMPTS else "Queued",
+            "attempts": attempts,
+            "next_attempt_at": add_to_date(now_datetime(), seconds=get_retry_delay(attempts)),
+            "error": str(e)
+        })
+        frappe.db.commit()
+        return False
+
+
+@frappe.whitelist()
+def retry_activation(name):
+    """Put a failed activation back in the queue"""
+    frappe.only_for("System Manager")
+    frappe.db.set_value(
+        "Subscription Payment Activation", name, {"status": "Queued", "attempts": 0, "next_attempt_at": None}
+    )
+    enqueue_activation(frappe.db.get_value("Subscription Payment Activation", name, "router"))
+
+
+def get_latency_stats(from_datetime=None, names=None):
+    """Percentiles of callback-to-online time for activated payments"""
+    filters = {"status": "Activated"}
+    if from_datetime:
+        filters["received_at"] = [">=", from_datetime]
+    if names:
+        filters["name"] = ["in", names]
+
+    values = sorted(frappe.get_all("Subscription Payment Activation", filters=filters, pluck="activation_seconds"))
+    if not values:
+        return {"count": 0}
+
+    def percentile(p):
+        return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+    return {
+        "count": len(values),
+        "p50": percentile(50),
+        "p95": percentile(95),
+        "p99": percentile(99),
+        "max": values[-1]
+    }
+
+
+def benchmark_burst(subscriptions, timeout=300):
+    """Measure callback and callback-to-online latency for a burst of payments
+
+    Meant for a lab router, e.g.:
+
+        bench --site lab execute mikrotik_integration.mikrotik_integration.doctype.subscription_payment_activation.subscription_payment_activation.benchmark_burst --kwargs "{'subscriptions': ['SUB-0001', 'SUB-0002']}"
+
+    Queues one synthetic payment per subscription through the same path as the
+    M-Pesa callback, then waits for the workers to activate them all.
+    """
+    if isinstance(subscriptions, str):
+        subscriptions = frappe.parse_json(subscriptions)
+
+    run = frappe.generate_hash(length=6).upper()
+    callback_times = []
+
+    for i, subscription in enumerate(subscriptions):
+        callback_started = time.perf_counter()
+        queue_payment_activation(subscription, f"BENCH-{run}-{i}", "M-Pesa")
+        frappe.db.commit()
+        callback_times.append(time.perf_counter() - callback_started)
+
+    names = [f"BENCH-{run}-{i}" for i in range(len(subscriptions))]
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        pending = frappe.db.count("Subscription Payment Activation", {"name": ["in", names], "status": "Queued"})
+        if not pending:
+            break
+        time.sleep(1)
+        frappe.db.rollback()  # Start a fresh snapshot to see the workers' commits
+
+    callback_times.sort()
+    return {
+        "payments": len(names),
+        "callback_p50_ms": callback_times[len(callback_times) // 2] * 1000 if callback_times else 0,
+        "callback_max_ms": callback_times[-1] * 1000 if callback_times else 0,
+        "activation": get_latency_stats(names=names),
+        "failed": frappe.db.count("Subscription Payment Activation", {"name": ["in", names], "status": "Failed"}),
+        "still_queued": frappe.db.count("Subscription Payment Activation", {"name": ["in", names], "status": "Queued"})
+    }
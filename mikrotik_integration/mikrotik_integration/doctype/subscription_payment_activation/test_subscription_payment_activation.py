@@ -0,0 +1,68 @@
+# Copyright (c) 2026, ronoh and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_to_date, now, now_datetime
+
+from mikrotik_integration.mikrotik_integration.doctype.subscription_payment_activation.subscription_payment_activation import (
+	drain_activations,
+	get_retry_delay,
+)
+
+
+class TestSubscriptionPaymentActivation(FrappeTestCase):
+	def make_activation(self, trans_id, **values):
+		activation = frappe.get_doc(dict({
+			"doctype": "Subscription Payment Activation",
+			"trans_id": trans_id,
+			"subscription": "_Test Missing Subscription",
+			"status": "Queued",
+			"received_at": now()
+		}, **values)).insert(ignore_permissions=True, ignore_links=True)
+		# A failing activation rolls back, so the rows must be committed first
+		frappe.db.commit()
+		return activation
+
+	def test_retry_delay_doubles(self):
+		self.assertEqual([get_retry_delay(n) for n in (1, 2, 3)], [30, 60, 120])
+
+	def test_failed_activation_waits_for_retry(self):
+		"""A failing activation is tried once per drain, not until it runs out of attempts"""
+		activation = self.make_activation("_TEST-BACKOFF-1")
+		result = {"scanned": 0, "changed": 0, "errors": 0}
+
+		drain_activations(None, None, result)
+
+		self.assertEqual(result["scanned"], 1)
+		activation.reload()
+		self.assertEqual(activation.status, "Queued")
+		self.assertEqual(activation.attempts, 1)
+		self.assertGreater(activation.next_attempt_at, now_datetime())
+
+	def test_failure_is_logged_after_the_rollback(self):
+		"""The Error Log of a failed attempt is kept, not rolled back with the attempt"""
+		activation = self.make_activation("_TEST-BACKOFF-3")
+
+		drain_activations(None, None, {"scanned": 0, "changed": 0, "errors": 0})
+
+		self.assertTrue(frappe.db.exists(
+			"Error Log", {"reference_doctype": "Subscription Payment Activation", "reference_name": activation.name}
+		))
+		activation.reload()
+		self.assertIn("_Test Missing Subscription", activation.error)
+
+	def test_waiting_activation_is_skipped(self):
+		self.make_activation("_TEST-BACKOFF-2", next_attempt_at=add_to_date(now_datetime(), minutes=5))
+		result = {"scanned": 0, "changed": 0, "errors": 0}
+
+		drain_activations(None, None, result)
+
+		self.assertEqual(result["scanned"], 0)
+
+	def tearDown(self):
+		frappe.db.delete("Error Log", {
+			"reference_doctype": "Subscription Payment Activation", "reference_name": ["like", "_TEST-BACKOFF-%"]
+		})
+		frappe.db.delete("Subscription Payment Activation", {"trans_id": ["like", "_TEST-BACKOFF-%"]})
+		frappe.db.commit()
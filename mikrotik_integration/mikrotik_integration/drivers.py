@@ -0,0 +1,218 @@
+import frappe
+import routeros_api
+from frappe import _
+from frappe.utils import flt
+
+from mikrotik_integration.utils import parse_mikrotik_date
+
+# Commands sent before the first reply is read; bounds the replies held in memory
+PIPELINE_SIZE = 100
+# Up to this many users are looked up with filtered prints, more share one full print
+FILTERED_LIST_LIMIT = 20
+
+DRIVERS = {}
+
+
+def register_driver(driver_class):
+    """Register a driver class for each service it handles"""
+    for service in driver_class.services:
+        DRIVERS[service] = driver_class
+    return driver_class
+
+
+def is_missing_item_error(error):
+    """Check if a RouterOS error says the addressed `.id` does not exist"""
+    return "no such item" in str(error).lower()
+
+
+def get_driver(api, service_name):
+    """Return the driver for a service on one connection
+
+    Drivers are kept on the connection, so services sharing a RouterOS menu
+    (PPPoE, L2TP, PPTP) share one driver and its table snapshot.
+    """
+    driver_class = DRIVERS.get(service_name)
+    if not driver_class:
+        frappe.throw(_("Unsupported connection type: {0}").format(service_name))
+
+    drivers = getattr(api, "mikrotik_drivers", None)
+    if drivers is None:
+        drivers = api.mikrotik_drivers = {}
+    if driver_class not in drivers:
+        drivers[driver_class] = driver_class(api)
+    return drivers[driver_class]
+
+
+def get_driver_classes():
+    """Every registered driver class, once"""
+    return list(dict.fromkeys(DRIVERS.values()))
+
+
+def pipeline(resource, command, items):
+    """Send `command` for each (arguments, queries) pair before reading the replies
+
+    Returns each reply, or the exception RouterOS answered with, in order. A
+    batch costs about one round trip instead of one per item.
+    """
+    results = []
+    for start in range(0, len(items), PIPELINE_SIZE):
+        promises = [
+            resource.call_async(command, arguments, queries)
+            for arguments, queries in items[start:start + PIPELINE_SIZE]
+        ]
+        for promise in promises:
+            try:
+                results.append(promise.get())
+            except routeros_api.exceptions.RouterOsApiCommunicationError as e:
+                results.append(e)
+    return results
+
+
+class ServiceDriver:
+    """User and session operations of one service on one router connection
+
+    Bulk operations are pipelined, and a full print of the user table is kept
+    for the driver's lifetime until the driver itself changes it.
+    """
+
+    services = ()
+    user_path = None
+    session_path = None
+    session_user_field = "name"
+    profile_path = None
+    # Whether the user and session menus support `listen`
+    streamable = True
+
+    def __init__(self, api):
+        self.api = api
+        self.snapshot = None
+
+    def users(self):
+        return self.api.get_resource(self.user_path)
+
+    def sessions(self):
+        return self.api.get_resource(self.session_path)
+
+    def profiles(self):
+        return self.api.get_resource(self.profile_path)
+
+    def build_user(self, service_name, username, password, **params):
+        """Parameters of a new router user"""
+        return dict(params, name=username, password=password)
+
+    def list(self, names=None):
+        """Users on the router keyed by name, optionally only the given names"""
+        if names is not None:
+            names = list(dict.fromkeys(filter(None, names)))
+            if self.snapshot is None and len(names) <= FILTERED_LIST_LIMIT:
+                rows = pipeline(self.users(), "print", [({}, {"name": name}) for name in names])
+                return {
+                    row.get("name"): row
+                    for result in rows if not isinstance(result, Exception)
+                    for row in result
+                }
+
+        if self.snapshot is None:
+            self.snapshot = {row.get("name"): row for row in self.users().get()}
+        if names is None:
+            return dict(self.snapshot)
+        return {name: self.snapshot[name] for name in names if name in self.snapshot}
+
+    def invalidate(self):
+        self.snapshot = None
+
+    def add_many(self, users):
+        """Add users, returning each new `.id` or the error it failed with"""
+        results = pipeline(self.users(), "add", [(user, {}) for user in users])
+        self.invalidate()
+        return [result if isinstance(result, Exception) else result.done_message.get("ret") for result in results]
+
+    def set_many(self, changes):
+        """Apply (item ID, parameters) pairs, returning None or the error of each"""
+        results = pipeline(self.users(), "set", [(dict(params, id=item_id), {}) for item_id, params in changes])
+        self.invalidate()
+        return [result if isinstance(result, Exception) else None for result in results]
+
+    def remove_many(self, item_ids):
+        """Remove users by item ID, returning None or the error of each"""
+        results = pipeline(self.users(), "remove", [({"id": item_id}, {}) for item_id in item_ids])
+        self.invalidate()
+        return [result if isinstance(result, Exception) else None for result in results]
+
+    def list_sessions(self, names=None):
+        """Active sessions, optionally only those of the given users"""
+        names = set(filter(None, names)) if names is not None else None
+        if names is not None and len(names) == 1:
+            return self.sessions().get(**{self.session_user_field: next(iter(names))})
+        return [
+            row for row in self.sessions().get()
+            if names is None or row.get(self.session_user_field) in names
+        ]
+
+    def kick(self, names):
+        """Disconnect the active sessions of the given users and return how many were closed"""
+        names = set(filter(None, names))
+        if not names:
+            return 0
+
+        sessions = self.list_sessions(names)
+        results = pipeline(self.sessions(), "remove", [({"id": row.get("id")}, {}) for row in sessions])
+        kicked = 0
+        for result in results:
+            if not isinstance(result, Exception):
+                kicked += 1
+            # A session that ended on its own in the meantime is fine
+            elif not is_missing_item_error(result):
+                raise result
+        return kicked
+
+    def usage_snapshot(self, names=None):
+        """Data used, last login and online state of each user found on the router"""
+        users = self.list(names)
+        if not users:
+            return {}
+
+        sessions = {}
+        for row in self.list_sessions(users.keys() if names is not None else None):
+            sessions.setdefault(row.get(self.session_user_field), row)
+
+        usage = {}
+        for name, user in users.items():
+            session = sessions.get(name)
+            usage[name] = {
+                "data_used_mb": (flt(user.get("bytes-in")) + flt(user.get("bytes-out"))) / (1024 * 1024),
+                "last_login": parse_mikrotik_date(session.get("last-logged")) if session else None,
+                "online": bool(session),
+                "status": "Suspended" if user.get("disabled") == "true" else "Active"
+            }
+        return usage
+
+
+@register_driver
+class HotspotDriver(ServiceDriver):
+    services = ("hotspot",)
+    user_path = "/ip/hotspot/user"
+    session_path = "/ip/hotspot/active"
+    session_user_field = "user"
+    profile_path = "/ip/hotspot/user/profile"
+
+
+@register_driver
+class PPPDriver(ServiceDriver):
+    services = ("pppoe", "l2tp", "pptp")
+    user_path = "/ppp/secret"
+    session_path = "/ppp/active"
+    profile_path = "/ppp/profile"
+
+    def build_user(self, service_name, username, password, **params):
+        # One secret table serves every PPP service, so each secret names its own
+        return dict(params, name=username, password=password, service=service_name)
+
+
+@register_driver
+class OpenVPNDriver(ServiceDriver):
+    services = ("openvpn",)
+    user_path = "/interface/ovpn-server/user"
+    session_path = "/ppp/active"
+    profile_path = "/ppp/profile"
+    streamable = False
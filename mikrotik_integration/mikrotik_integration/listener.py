@@ -0,0 +1,259 @@
+import queue
+import threading
+import time
+
+import frappe
+from frappe.utils import now, now_datetime
+
+from mikrotik_integration.mikrotik_integration.doctype.mikrotik_router_counter.mikrotik_router_counter import (
+    COUNTER_FIELDS,
+    apply_row_change,
+)
+from mikrotik_integration.mikrotik_integration.doctype.hotspot_voucher.hotspot_voucher import activate_vouchers
+from mikrotik_integration.mikrotik_integration.drivers import get_driver_classes
+from mikrotik_integration.mikrotik_integration.log_volume import publish_debounced
+
+LISTENER_LIFETIME = 50 * 60  # Restarted by ensure_listeners before the long queue timeout
+LISTENER_TIMEOUT = 60 * 60
+HEARTBEAT_INTERVAL = 30
+HEARTBEAT_TTL = 3 * HEARTBEAT_INTERVAL
+
+# RouterOS menus streamed with `listen`, and the field holding the username
+SESSION_TABLES = {
+    driver.session_path: driver.session_user_field
+    for driver in get_driver_classes() if driver.streamable
+}
+USER_TABLES = {driver.user_path: "name" for driver in get_driver_classes() if driver.streamable}
+
+
+def get_listener_job_id(router):
+    return f"mikrotik_listener::{router}"
+
+
+def get_heartbeat_key(router):
+    return f"mikrotik_listener_heartbeat::{router}"
+
+
+def is_listener_alive(router):
+    """Check if a listener has reported in for this router recently"""
+    return bool(frappe.cache().get_value(get_heartbeat_key(router)))
+
+
+def get_listening_routers():
+    """Return the routers currently covered by a live listener"""
+    routers = frappe.get_all(
+        "MikroTik Settings",
+        filters={"enable_event_listener": 1, "disabled": 0},
+        pluck="name"
+    )
+    return {router for router in routers if is_listener_alive(router)}
+
+
+def ensure_listeners():
+    """Start a listener job for every router that has one enabled
+
+    Runs from the scheduler; jobs are deduplicated on their job id so routers with
+    a listener already running are left alone.
+    """
+    routers = frappe.get_all(
+        "MikroTik Settings",
+        filters={"enable_event_listener": 1, "disabled": 0},
+        pluck="name"
+    )
+    for router in routers:
+        frappe.enqueue(
+            "mikrotik_integration.mikrotik_integration.listener.run_listener",
+            queue="long",
+            timeout=LISTENER_TIMEOUT,
+            job_id=get_listener_job_id(router),
+            deduplicate=True,
+            router=router
+        )
+
+
+def run_listener(router):
+    """Stream session and user table changes from one router into the database"""
+    router_doc = frappe.get_doc("MikroTik Settings", router)
+    listener = RouterEventListener(router_doc)
+    try:
+        listener.start()
+        listener.process_events(LISTENER_LIFETIME)
+    except Exception as e:
+        frappe.log_error(
+            f"Event listener for router {router} stopped: {str(e)}",
+            "MikroTik Listener Error"
+        )
+    finally:
+        listener.stop()
+        frappe.cache().delete_value(get_heartbeat_key(router))
+
+
+class RouterEventListener:
+    """Keep one `listen` command open per watched table and apply the changes
+
+    Each table gets its own connection and reader thread, because a `listen`
+    command never completes and RouterOS interleaves replies on a shared socket.
+    Reader threads only push rows onto a queue; all database work happens on the
+    job's own thread.
+    """
+
+    def __init__(self, router_doc):
+        self.router = router_doc.name
+        self.router_doc = router_doc
+        self.events = queue.Queue()
+        self.pools = []
+        self.threads = []
+        # RouterOS only sends `.id` and `.dead` when a session ends
+        self.sessions = {}
+
+    def start(self):
+        for path, user_field in SESSION_TABLES.items():
+            api = self.connect()
+            for row in api.get_resource(path).get():
+                self.sessions[(path, row.get("id"))] = row.get(user_field)
+            self.start_reader(api, path)
+
+        for path in USER_TABLES:
+            self.start_reader(self.connect(), path)
+
+    def connect(self):
+        pool = self.router_doc.get_api_pool()
+        # `listen` blocks until something changes, so the socket must not time out
+        pool.set_timeout(None)
+        self.pools.append(pool)
+        return pool.get_api()
+
+    def start_reader(self, api, path):
+        thread = threading.Thread(
+            target=self.read_events,
+            args=(api, path),
+            name=f"mikrotik-listen-{self.router}-{path}",
+            daemon=True
+        )
+        thread.start()
+        self.threads.append(thread)
+
+    def read_events(self, api, path):
+        try:
+            for row in api.get_resource(path).call_async("listen"):
+                self.events.put((path, row))
+        except Exception as e:
+            self.events.put((path, e))
+
+    def stop(self):
+        # Closing the sockets unblocks the reader threads
+        for pool in self.pools:
+            try:
+                pool.disconnect()
+            except Exception:
+                pass
+        self.pools = []
+
+    def process_events(self, lifetime):
+        deadline = time.monotonic() + lifetime
+        self.heartbeat()
+
+        while time.monotonic() < deadline:
+            try:
+                path, row = self.events.get(timeout=HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                self.heartbeat()
+                continue
+
+            if isinstance(row, Exception):
+                raise row
+
+            if path in SESSION_TABLES:
+                self.handle_session_event(path, row)
+            else:
+                self.handle_user_event(path, row)
+
+            frappe.db.commit()
+            self.heartbeat()
+
+    def heartbeat(self):
+        frappe.cache().set_value(get_heartbeat_key(self.router), now(), expires_in_sec=HEARTBEAT_TTL)
+
+    def handle_session_event(self, path, row):
+        key = (path, row.get("id"))
+        if is_dead(row):
+            username = self.sessions.pop(key, None)
+            if username:
+                self.update_subscription(username, {"is_online": 0}, "logout", "User logged out")
+            return
+
+        if key in self.sessions:
+            # Counter updates on a session we already know about
+            return
+
+        username = row.get(SESSION_TABLES[path])
+        self.sessions[key] = username
+        self.update_subscription(
+            username,
+            {"is_online": 1, "last_login": now_datetime()},
+            "login",
+            "User logged in"
+        )
+
+    def handle_user_event(self, path, row):
+        if is_dead(row) or "disabled" not in row:
+            return
+
+        username = row.get(USER_TABLES[path])
+        router_status = "Suspended" if row.get("disabled") in ("true", "yes") else "Active"
+        subscription = get_subscription(self.router, username)
+        if not subscription or subscription.status not in ("Active", "Suspended"):
+            return
+
+        if subscription.status != router_status:
+            self.update_subscription(
+                username,
+                {"status": router_status},
+                "router_sync",
+                f"Status synced from router: {router_status}",
+                subscription=subscription
+            )
+
+    def update_subscription(self, username, values, event_type, message, subscription=None):
+        subscription = subscription or get_subscription(self.router, username)
+        if not subscription:
+            if event_type == "login":
+                # Vouchers have no subscription; their first login starts their validity
+                activate_vouchers(self.router, [username])
+            return
+
+        if "status" in values:
+            # Status changes move the subscription between dashboard counters
+            old_row = frappe.db.get_value("Customer Subscription", subscription.name, COUNTER_FIELDS, as_dict=True)
+            apply_row_change(old_row, dict(old_row, **values))
+
+        frappe.db.set_value("Customer Subscription", subscription.name, values, update_modified=False)
+        frappe.publish_realtime(f"subscription_{subscription.name}_update", {
+            "event": event_type,
+            "message": message,
+            "subscription_id": subscription.name,
+            "status": values.get("status", subscription.status),
+            "timestamp": now()
+        }, after_commit=True)
+        # A reconnecting router replays many sessions at once; dashboards only need to refresh
+        publish_debounced("mikrotik_session_update", {
+            "event": event_type,
+            "router": self.router,
+            "subscription": subscription.name,
+            "username": username
+        }, key=self.router)
+
+
+def get_subscription(router, username):
+    if not username:
+        return None
+    return frappe.db.get_value(
+        "Customer Subscription",
+        {"mikrotik_settings": router, "username_mikrotik": username, "docstatus": 1},
+        ["name", "status"],
+        as_dict=True
+    )
+
+
+def is_dead(row):
+    return row.get(".dead") == "true" or row.get("dead") == "true"
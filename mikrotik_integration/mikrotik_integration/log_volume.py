@@ -0,0 +1,273 @@
+import json
+import random
+
+import frappe
+from frappe.utils import cint, flt, now
+
+DEFAULT_ERROR_WINDOW_SECONDS = 5 * 60
+DEFAULT_SUCCESS_SAMPLE_RATE = 0.1
+DEFAULT_DEBOUNCE_SECONDS = 5
+ERROR_WINDOWS_KEY = "mikrotik_error_windows"
+PENDING_EVENTS_KEY = "mikrotik_pending_events"
+# Longest a debounced event waits for the next flush before it is dropped
+PENDING_EVENT_TTL = 60 * 60
+
+# Count one occurrence of an error, opening a new window when the current one
+# is over. Windows are timed by the Redis clock so every worker agrees on them.
+# Returns the count so far and, when a window was opened, its start and the log
+# entry, count, flushed count and last seen time of the window it replaced.
+ERROR_WINDOW_SCRIPT = """
+local window = tonumber(ARGV[1])
+local clock = redis.call("TIME")
+local current = tonumber(clock[1])
+
+local started = tonumber(redis.call("HGET", KEYS[1], "started"))
+if started and current - started < window then
+    local count = redis.call("HINCRBY", KEYS[1], "count", 1)
+    redis.call("HSET", KEYS[1], "last_seen", ARGV[2])
+    return {count}
+end
+
+local previous = redis.call("HMGET", KEYS[1], "log", "count", "flushed", "last_seen")
+redis.call("DEL", KEYS[1])
+redis.call("HSET", KEYS[1], "started", current, "count", 1, "flushed", 1, "last_seen", ARGV[2])
+redis.call("EXPIRE", KEYS[1], window * 2 + 120)
+return {1, current, previous[1] or "", previous[2] or "0", previous[3] or "0", previous[4] or ""}
+"""
+
+# Remember the log entry of the window opened at ARGV[1]
+SET_WINDOW_LOG_SCRIPT = """
+if redis.call("HGET", KEYS[1], "started") == ARGV[1] then
+    redis.call("HSET", KEYS[1], "log", ARGV[2])
+end
+"""
+
+# Read a window for flushing; nothing if it expired
+READ_WINDOW_SCRIPT = """
+return redis.call("HMGET", KEYS[1], "started", "log", "count", "flushed", "last_seen")
+"""
+
+# Mark a window's count as written, unless a new window replaced it meanwhile
+MARK_WINDOW_FLUSHED_SCRIPT = """
+if redis.call("HGET", KEYS[1], "started") == ARGV[1] then
+    redis.call("HSET", KEYS[1], "flushed", ARGV[2])
+end
+"""
+
+# Publish now if the event's gate is open, closing it for the interval and
+# returning how many events were held back since the last publish. Otherwise
+# keep the latest message for the flush and return -1.
+DEBOUNCE_SCRIPT = """
+if redis.call("SET", KEYS[1], "1", "NX", "PX", ARGV[1]) then
+    local held = tonumber(redis.call("HGET", KEYS[2], "count")) or 0
+    redis.call("DEL", KEYS[2])
+    return held
+end
+redis.call("HINCRBY", KEYS[2], "count", 1)
+redis.call("HSET", KEYS[2], "event", ARGV[2], "message", ARGV[3])
+redis.call("EXPIRE", KEYS[2], ARGV[4])
+return -1
+"""
+
+# Take the held back message of an event whose gate has opened again. Returns
+# nothing while the gate is closed and an empty list if nothing is held.
+TAKE_PENDING_SCRIPT = """
+if redis.call("EXISTS", KEYS[1]) == 1 then
+    return false
+end
+local pending = redis.call("HMGET", KEYS[2], "count", "event", "message")
+redis.call("DEL", KEYS[2])
+if not pending[1] then
+    return {}
+end
+redis.call("SET", KEYS[1], "1", "PX", ARGV[1])
+return pending
+"""
+
+
+def get_window_key(name):
+    return f"mikrotik_error_window::{name}"
+
+
+def get_gate_key(name):
+    return f"mikrotik_event_gate::{name}"
+
+
+def get_pending_key(name):
+    return f"mikrotik_event_pending::{name}"
+
+
+def decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def get_error_window():
+    """Seconds within which repeats of an error are counted on its first entry"""
+    return cint(frappe.conf.get("mikrotik_error_window_seconds")) or DEFAULT_ERROR_WINDOW_SECONDS
+
+
+def get_success_sample_rate():
+    """Share of successful router calls written to the MikroTik API Log"""
+    rate = frappe.conf.get("mikrotik_api_log_success_rate")
+    return min(flt(DEFAULT_SUCCESS_SAMPLE_RATE if rate is None else rate), 1)
+
+
+def get_debounce_interval():
+    """Milliseconds between two realtime events of one kind for one router"""
+    seconds = frappe.conf.get("mikrotik_realtime_debounce_seconds")
+    return int(flt(DEFAULT_DEBOUNCE_SECONDS if seconds is None else seconds) * 1000)
+
+
+def get_error_class(error):
+    if isinstance(error, BaseException):
+        return type(error).__name__
+    return "Error"
+
+
+def insert_api_log(router, operation, parameters, status, **values):
+    log = frappe.get_doc(dict(
+        values,
+        doctype="MikroTik API Log",
+        router=router,
+        operation=operation,
+        parameters=parameters if isinstance(parameters, str) else json.dumps(parameters, default=str),
+        response="",
+        status=status
+    ))
+    # Low level callers log by router host rather than MikroTik Settings name
+    log.flags.ignore_links = True
+    log.insert(ignore_permissions=True)
+    return log.name
+
+
+def log_router_success(router, operation, parameters):
+    """Write a successful router call to the API log, sampled at the configured rate
+
+    A sampled entry counts as `1 / rate` calls, so summed occurrences still
+    estimate the real number of calls.
+    """
+    rate = get_success_sample_rate()
+    if rate <= 0 or random.random() >= rate:
+        return None
+    return insert_api_log(router, operation, parameters, "Success", occurrences=max(cint(round(1 / rate)), 1))
+
+
+def log_router_error(router, operation, error, parameters=None, title=None):
+    """Log a router error once per window and count its repeats
+
+    Errors are grouped by router, operation and error class. The first one of a
+    window gets a failed MikroTik API Log entry, an Error Log when `title` is
+    given, and a debounced `mikrotik_api_error` event. Repeats only count up in
+    Redis; `flush_log_windows` writes the count to the entry's occurrences.
+    """
+    error_class = get_error_class(error)
+    name = f"{router}::{operation}::{error_class}"
+    key = frappe.cache().make_key(get_window_key(name))
+    last_seen = now()
+
+    reply = frappe.cache().eval(ERROR_WINDOW_SCRIPT, 1, key, get_error_window(), last_seen)
+    if cint(reply[0]) > 1:
+        return None
+
+    _count, started, previous_log, previous_count, previous_flushed, previous_seen = [
+        decode(value) for value in reply
+    ]
+    if previous_log and cint(previous_count) > cint(previous_flushed):
+        write_occurrences(previous_log, previous_count, previous_seen)
+
+    if parameters is None:
+        parameters = {"error": str(error)}
+    log_name = insert_api_log(
+        router, operation, parameters, "Failed",
+        error_class=error_class, occurrences=1, last_seen=last_seen
+    )
+    frappe.cache().eval(SET_WINDOW_LOG_SCRIPT, 1, key, started, log_name)
+    frappe.cache().sadd(ERROR_WINDOWS_KEY, name)
+    # A rollback takes the entry with it, so let the next repeat log again
+    frappe.db.after_rollback.add(lambda: frappe.cache().delete_value(get_window_key(name)))
+
+    if title:
+        frappe.log_error(
+            message=(
+                f"{title}\nRouter: {router}\nOperation: {operation}\n"
+                f"Parameters: {parameters}\nError: {error}\n"
+                f"Repeats within {get_error_window()} seconds are counted on MikroTik API Log {log_name}"
+            ),
+            title=title
+        )
+
+    publish_debounced("mikrotik_api_error", {
+        "name": log_name,
+        "creation": last_seen,
+        "operation": operation,
+        "router": router,
+        "error_class": error_class
+    }, key=router)
+    return log_name
+
+
+def write_occurrences(log_name, count, last_seen):
+    frappe.db.set_value(
+        "MikroTik API Log", log_name,
+        {"occurrences": cint(count), "last_seen": last_seen or None},
+        update_modified=False
+    )
+
+
+def publish_debounced(event, message, key=None):
+    """Publish a realtime event at most once per debounce interval per key
+
+    Events inside the interval are held back; only the latest one is published,
+    by the next event after the interval or by `flush_log_windows`, with the
+    number it stands in for as `held_back`.
+    """
+    interval = get_debounce_interval()
+    if interval <= 0:
+        frappe.publish_realtime(event, message)
+        return True
+
+    name = f"{event}::{key or ''}"
+    cache = frappe.cache()
+    held = cint(cache.eval(
+        DEBOUNCE_SCRIPT, 2, cache.make_key(get_gate_key(name)), cache.make_key(get_pending_key(name)),
+        interval, event, frappe.as_json(message), PENDING_EVENT_TTL
+    ))
+    if held < 0:
+        cache.sadd(PENDING_EVENTS_KEY, name)
+        return False
+
+    frappe.publish_realtime(event, dict(message, held_back=held) if held else message)
+    return True
+
+
+def flush_log_windows():
+    """Write counted error repeats to their log entries and publish held back events"""
+    cache = frappe.cache()
+
+    for name in cache.smembers(ERROR_WINDOWS_KEY) or ():
+        name = decode(name)
+        key = cache.make_key(get_window_key(name))
+        window = cache.eval(READ_WINDOW_SCRIPT, 1, key)
+        started, log_name, count, flushed, last_seen = [decode(value) for value in window]
+        if not started:
+            cache.srem(ERROR_WINDOWS_KEY, name)
+            continue
+        if log_name and cint(count) > cint(flushed):
+            write_occurrences(log_name, count, last_seen)
+            cache.eval(MARK_WINDOW_FLUSHED_SCRIPT, 1, key, started, count)
+    frappe.db.commit()
+
+    interval = get_debounce_interval()
+    for name in cache.smembers(PENDING_EVENTS_KEY) or ():
+        name = decode(name)
+        pending = cache.eval(
+            TAKE_PENDING_SCRIPT, 2, cache.make_key(get_gate_key(name)), cache.make_key(get_pending_key(name)),
+            max(interval, 1)
+        )
+        if pending is None:
+            continue
+        cache.srem(PENDING_EVENTS_KEY, name)
+        if pending:
+            held, event, message = [decode(value) for value in pending]
+            # The published event stands in for itself and the ones held back before it
+            frappe.publish_realtime(event, dict(json.loads(message), held_back=cint(held) - 1))
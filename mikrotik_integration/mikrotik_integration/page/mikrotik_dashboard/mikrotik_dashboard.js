@@ -61,6 +61,7 @@ frappe.MikroTikDashboard = class MikroTikDashboard {
         this.make_stats_section();
         this.make_active_users_section();
         this.make_api_logs_section();
+        this.make_router_health_section();
         this.make_usage_chart_section();
     }
 
@@ -101,43 +102,146 @@ frappe.MikroTikDashboard = class MikroTikDashboard {
     }
 
     make_active_users_section() {
+        let me = this;
         this.active_users_section = $('<div class="dashboard-section">').appendTo(this.page.main);
         
         // Add section header
         let header = $('<div class="section-header">').appendTo(this.active_users_section);
-        $('<h2 class="section-title">' + __('Currently Active Users') + '</h2>').appendTo(header);
+        let title_wrapper = $('<div class="d-flex align-items-center">').appendTo(header);
+        $('<h2 class="section-title">' + __('Currently Active Users') + '</h2>').appendTo(title_wrapper);
+        this.active_users_count = $('<span class="badge bg-primary ms-2">0</span>').appendTo(title_wrapper);
         
-        // Add search field
-        let search = $('<div class="search-box">').appendTo(header);
+        // Add search and sort fields
+        let search = $('<div class="search-box d-flex">').appendTo(header);
         this.user_filter = frappe.ui.form.make_control({
             parent: search,
             df: {
                 fieldtype: 'Data',
                 placeholder: __('Search users...'),
+                onchange: frappe.utils.debounce(() => this.filter_users(), 300)
+            },
+            render_input: true
+        });
+        this.user_sort = frappe.ui.form.make_control({
+            parent: search,
+            df: {
+                fieldtype: 'Select',
+                options: [
+                    {value: 'customer_name', label: __('Customer')},
+                    {value: 'username', label: __('Username')},
+                    {value: 'data_used', label: __('Data Used')},
+                    {value: 'last_login', label: __('Last Login')},
+                    {value: 'expiry', label: __('Expiry')}
+                ],
+                default: 'customer_name',
                 onchange: () => this.filter_users()
             },
             render_input: true
         });
+        this.user_sort.set_value('customer_name');
         
         // Create datatable wrapper
-        let table_wrapper = $('<div class="data-table-wrapper">').appendTo(this.active_users_section);
+        let table_wrapper = $('<div class="data-table-wrapper active-users-table">').appendTo(this.active_users_section);
         
-        // Create datatable
+        // Rows are fetched page by page from the server and formatted here
         this.active_users_table = new frappe.DataTable(
-            this.active_users_section[0],
+            table_wrapper[0],
             {
                 columns: [
-                    {name: 'customer', width: 200},
-                    {name: 'username', width: 150},
-                    {name: 'connection_type', width: 120},
-                    {name: 'data_used', width: 120},
-                    {name: 'uptime', width: 120},
-                    {name: 'payment_status', width: 120},
-                    {name: 'expiry', width: 120}
+                    {
+                        id: 'customer', name: __('Customer'), width: 200,
+                        format: (value, row, column, data) => `${data.customer_name || ''} (${data.customer})`
+                    },
+                    {id: 'username', name: __('Username'), width: 150},
+                    {id: 'connection_type', name: __('Connection Type'), width: 120},
+                    {
+                        id: 'data_used', name: __('Data Used'), width: 120,
+                        format: (value) => format_number(value || 0, null, 0) + ' MB'
+                    },
+                    {
+                        id: 'last_login', name: __('Last Login'), width: 140,
+                        format: (value, row, column, data) => {
+                            let login = value ? frappe.datetime.str_to_user(value) : __('Never');
+                            return data.is_online ? `<span class="indicator-pill green">${login}</span>` : login;
+                        }
+                    },
+                    {id: 'payment_status', name: __('Payment Status'), width: 120},
+                    {
+                        id: 'expiry', name: __('Expiry'), width: 120,
+                        format: (value) => value ? frappe.datetime.str_to_user(value) : ''
+                    }
                 ],
-                data: []
+                data: [],
+                layout: 'fixed',
+                inlineFilters: false,
+                sortIndicator: false
             }
         );
+
+        // Fetch the next page as the user scrolls close to the end of the loaded rows
+        $(this.active_users_table.bodyScrollable).on('scroll', frappe.utils.throttle(function() {
+            if (this.scrollTop + this.clientHeight >= this.scrollHeight - 200) {
+                me.load_active_users();
+            }
+        }, 100));
+    }
+
+    filter_users() {
+        this.reset_active_users();
+        return this.load_active_users();
+    }
+
+    reset_active_users() {
+        this.active_users_cursor = null;
+        this.active_users_done = false;
+        this.active_users_loaded = 0;
+        this.active_users_request = (this.active_users_request || 0) + 1;
+        this.active_users_loading = false;
+        this.active_users_table.refresh([]);
+    }
+
+    load_active_users() {
+        let me = this;
+        if (this.active_users_loading || this.active_users_done) {
+            return Promise.resolve();
+        }
+
+        this.active_users_loading = true;
+        let request = this.active_users_request;
+        let sort_by = this.user_sort.get_value() || 'customer_name';
+
+        return frappe.call({
+            method: 'mikrotik_integration.mikrotik_integration.api.get_active_users',
+            args: {
+                router: this.page.fields_dict.router.get_value(),
+                search: this.user_filter.get_value(),
+                sort_by: sort_by,
+                sort_order: ['data_used', 'last_login'].includes(sort_by) ? 'desc' : 'asc',
+                cursor: this.active_users_cursor,
+                page_length: 100
+            }
+        }).then((r) => {
+            // Ignore pages from a search or router that is no longer selected
+            if (request !== me.active_users_request || !r.message) {
+                return;
+            }
+            let page = r.message;
+            if (page.total !== null && page.total !== undefined) {
+                me.active_users_count.text(page.total);
+            }
+            if (me.active_users_loaded) {
+                me.active_users_table.appendRows(page.users);
+            } else {
+                me.active_users_table.refresh(page.users);
+            }
+            me.active_users_loaded += page.users.length;
+            me.active_users_cursor = page.next_cursor;
+            me.active_users_done = !page.next_cursor;
+        }).finally(() => {
+            if (request === me.active_users_request) {
+                me.active_users_loading = false;
+            }
+        });
     }
 
     make_api_logs_section() {
@@ -157,13 +261,71 @@ frappe.MikroTikDashboard = class MikroTikDashboard {
                     {name: 'timestamp', width: 150},
                     {name: 'operation', width: 150},
                     {name: 'router', width: 150},
-                    {name: 'status', width: 100}
+                    {name: 'status', width: 100},
+                    {name: 'error_class', width: 150},
+                    {name: 'occurrences', width: 100}
                 ],
                 data: []
             }
         );
     }
 
+    make_router_health_section() {
+        this.router_health_section = $('<div class="dashboard-section">').appendTo(this.page.main);
+
+        let header = $('<div class="section-header">').appendTo(this.router_health_section);
+        $('<h2 class="section-title">' + __('Router Health') + '</h2>').appendTo(header);
+
+        let format_rate = (value) => format_number((value || 0) / 1000000, null, 2) + ' Mbps';
+        let format_percent = (value) => value == null ? '' : format_number(value, null, 0) + '%';
+        let format_uptime = (seconds) => {
+            if (!seconds) return '';
+            let days = Math.floor(seconds / 86400);
+            let hours = Math.floor(seconds % 86400 / 3600);
+            return days ? `${days}d ${hours}h` : `${hours}h ${Math.floor(seconds % 3600 / 60)}m`;
+        };
+
+        // Samples come from the router sync, so this table costs no router calls
+        this.router_health_table = new frappe.DataTable(
+            $('<div class="data-table-wrapper">').appendTo(this.router_health_section)[0],
+            {
+                columns: [
+                    {id: 'router', name: __('Router'), width: 150},
+                    {id: 'cpu', name: __('CPU'), width: 80, format: format_percent},
+                    {id: 'memory', name: __('Memory'), width: 90, format: format_percent},
+                    {id: 'uptime', name: __('Uptime'), width: 110, format: format_uptime},
+                    {id: 'rx_bps', name: __('Download'), width: 120, format: format_rate},
+                    {id: 'tx_bps', name: __('Upload'), width: 120, format: format_rate},
+                    {
+                        id: 'sampled_at', name: __('Sampled'), width: 150,
+                        format: (value) => value ? moment(value * 1000).fromNow() : __('Never')
+                    }
+                ],
+                data: [],
+                layout: 'fixed',
+                inlineFilters: false,
+                sortIndicator: false
+            }
+        );
+
+        this.router_health_chart_wrapper = $('<div class="router-health-chart">').appendTo(this.router_health_section);
+        this.router_health_chart = new frappe.Chart(
+            this.router_health_chart_wrapper[0],
+            {
+                data: {
+                    labels: [],
+                    datasets: [
+                        {name: __('CPU %'), values: []},
+                        {name: __('Memory %'), values: []}
+                    ]
+                },
+                type: 'line',
+                height: 240,
+                colors: ['#ff5858', '#5e64ff']
+            }
+        );
+    }
+
     make_usage_chart_section() {
         this.usage_chart_section = $('<div class="dashboard-section bg-white dark:bg-gray-800 rounded-lg shadow-sm">').appendTo(this.page.main);
         
@@ -203,8 +365,12 @@ frappe.MikroTikDashboard = class MikroTikDashboard {
         // Clear existing data
         this.clear_data();
         
+        // Active users are paged separately from the summary data
+        this.reset_active_users();
+        let active_users = this.load_active_users();
+
         // Fetch all data
-        return frappe.call({
+        let dashboard = frappe.call({
             method: 'mikrotik_integration.mikrotik_integration.api.get_dashboard_data',
             args: { router: router },
             callback: function(r) {
@@ -224,6 +390,7 @@ frappe.MikroTikDashboard = class MikroTikDashboard {
                 });
             }
         });
+        return Promise.all([dashboard, active_users]);
     }
 
     clear_data() {
@@ -234,8 +401,9 @@ frappe.MikroTikDashboard = class MikroTikDashboard {
         this.pending_payments_card.find('.stat-value').text('...');
         
         // Clear tables
-        this.active_users_table.refresh([]);
         this.api_logs_table.refresh([]);
+        this.error_count.text('0');
+        this.router_health_table.refresh([]);
         
         // Clear chart
         this.usage_chart.update({
@@ -257,12 +425,22 @@ frappe.MikroTikDashboard = class MikroTikDashboard {
         );
         this.pending_payments_card.find('.stat-value').text(data.stats.pending_payments);
         
-        // Update active users table
-        this.active_users_table.refresh(data.active_users);
-        
         // Update API logs table
         this.api_logs_table.refresh(data.failed_api_calls);
+        // Repeats of an error are counted on one entry, summed over the whole day by the server
+        this.error_count.text(data.error_count);
         
+        // Update router health, collected by the router sync
+        this.router_health_table.refresh(data.router_health.routers);
+        let chart = data.router_health.chart;
+        this.router_health_chart_wrapper.toggle(chart.at.length > 0);
+        if (chart.at.length) {
+            this.router_health_chart.update({
+                labels: chart.at.map((at) => moment(at * 1000).format('HH:mm')),
+                datasets: [{values: chart.cpu}, {values: chart.memory}]
+            });
+        }
+
         // Update usage chart
         this.usage_chart.update({
             labels: data.usage_chart.labels,
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import re
+
+import frappe
+from frappe.utils import cint
+
+from mikrotik_integration.mikrotik_integration.drivers import get_driver
+
+SHARED_PCQ = "Shared PCQ"
+# Mangle rules have no name, so they are found by this comment prefix
+COMMENT_PREFIX = "mikrotik_integration"
+PCQ_BURST_TIME = "10s"
+
+
+def get_object_base(conn_type):
+    """Name shared by the router objects of one connection type"""
+    return "mi-" + re.sub(r"[^a-z0-9]+", "-", conn_type.name.lower()).strip("-")
+
+
+def get_objects_key(router):
+    return f"mikrotik_queue_objects::{router}"
+
+
+def compile_connection_type(conn_type):
+    """Describe the router objects that shape a connection type's traffic
+
+    Users of the type are put on one address list by their profile. Mangle rules
+    mark that list's traffic, and a queue tree entry per direction shapes it with
+    a PCQ queue type, which gives every address its own rate inside one queue.
+    Queue processing cost then grows with the number of plans, not users.
+    """
+    limits = conn_type.get_bandwidth_limits()
+    base = get_object_base(conn_type)
+
+    queue_types = []
+    for direction, classifier, rate, burst in (
+        ("down", "dst-address", limits.get("speed_limit_rx"), limits.get("burst_limit_rx")),
+        ("up", "src-address", limits.get("speed_limit_tx"), limits.get("burst_limit_tx")),
+    ):
+        queue_type = {
+            "name": f"{base}-{direction}",
+            "kind": "pcq",
+            "pcq-rate": rate or "0",
+            "pcq-classifier": classifier
+        }
+        if burst:
+            queue_type.update({
+                "pcq-burst-rate": burst,
+                "pcq-burst-threshold": rate or "0",
+                "pcq-burst-time": PCQ_BURST_TIME
+            })
+        queue_types.append(queue_type)
+
+    return {
+        "queue_types": queue_types,
+        "mangle": [
+            {
+                "comment": f"{COMMENT_PREFIX}:{base}:down",
+                "chain": "forward",
+                "dst-address-list": base,
+                "action": "mark-packet",
+                "new-packet-mark": f"{base}-down",
+                "passthrough": "false"
+            },
+            {
+                "comment": f"{COMMENT_PREFIX}:{base}:up",
+                "chain": "forward",
+                "src-address-list": base,
+                "action": "mark-packet",
+                "new-packet-mark": f"{base}-up",
+                "passthrough": "false"
+            }
+        ],
+        "queue_tree": [
+            {
+                "name": f"{base}-{direction}",
+                "parent": "global",
+                "packet-mark": f"{base}-{direction}",
+                "queue": f"{base}-{direction}"
+            }
+            for direction in ("down", "up")
+        ],
+        "profile": {
+            "name": conn_type.profile_name,
+            "address-list": base,
+            # No per-user rate limit, so the router creates no dynamic queue per session
+            "rate-limit": ""
+        }
+    }
+
+
+def apply_object(api, path, key_field, values):
+    """Add a router object, or set the values that differ on the existing one"""
+    resource = api.get_resource(path)
+    existing = resource.get(**{key_field: values[key_field]})
+    if not existing:
+        resource.add(**{key: value for key, value in values.items() if value != ""})
+        return True
+
+    changed = {key: value for key, value in values.items() if existing[0].get(key, "") != value}
+    if changed:
+        resource.set(id=existing[0].get("id"), **changed)
+    return bool(changed)
+
+
+def ensure_queue_objects(api, router_doc, conn_type, force=False):
+    """Create or update a connection type's shared queue objects on one router
+
+    A digest of what was last applied is kept per router, so calling this
+    before every provisioning costs no router commands unless the limits, the
+    type or the router changed.
+    """
+    if conn_type.get("bandwidth_mode") != SHARED_PCQ:
+        return False
+
+    spec = compile_connection_type(conn_type)
+    digest = hashlib.md5(
+        json.dumps([spec, cint(router_doc.router_generation)], sort_keys=True).encode()
+    ).hexdigest()
+
+    cache = frappe.cache()
+    key = get_objects_key(router_doc.name)
+    if not force and cache.hget(key, conn_type.name) == digest:
+        return False
+
+    for queue_type in spec["queue_types"]:
+        apply_object(api, "/queue/type", "name", queue_type)
+    for rule in spec["mangle"]:
+        apply_object(api, "/ip/firewall/mangle", "comment", rule)
+    for queue in spec["queue_tree"]:
+        apply_object(api, "/queue/tree", "name", queue)
+    apply_object(api, get_driver(api, conn_type.service_name).profile_path, "name", spec["profile"])
+
+    cache.hset(key, conn_type.name, digest)
+    return True
+
+
+def ensure_router_queue_objects(api, router_doc):
+    """Bring every shared PCQ connection type up to date on one router"""
+    applied = 0
+    for name in frappe.get_all("Connection Type", filters={"bandwidth_mode": SHARED_PCQ}, pluck="name"):
+        try:
+            if ensure_queue_objects(api, router_doc, frappe.get_cached_doc("Connection Type", name)):
+                applied += 1
+        except Exception as e:
+            frappe.log_error(
+                f"Error updating queue objects of {name} on router {router_doc.name}: {str(e)}",
+                "MikroTik Queue Sync Error"
+            )
+    return applied
@@ -0,0 +1,249 @@
+import time
+
+import frappe
+from frappe import _
+from frappe.utils import cint, flt
+
+from mikrotik_integration.mikrotik_integration.drivers import get_driver_classes
+
+# How much each part of a router's load counts towards its score
+OCCUPANCY_WEIGHT = 0.6
+CPU_WEIGHT = 0.25
+MEMORY_WEIGHT = 0.15
+# CPU and memory older than this are ignored, e.g. while a router is unreachable
+LOAD_STALE_SECONDS = 30 * 60
+LOAD_KEY = "mikrotik_router_load"
+SCORES_KEY = "mikrotik_router_scores"
+# Subscriptions placed on each router since its score was computed, as plain
+# Redis counters so concurrent sign-ups all count
+PLACED_KEY = "mikrotik_router_placed"
+MAX_REBALANCING_MOVES = 200
+
+
+def count_items(api, path):
+    """Count a menu's items on the router without transferring them"""
+    response = api.get_resource(path).call("print", {"count-only": ""})
+    return cint(response.done_message.get("ret"))
+
+
+def collect_router_load(api, router_name, sample):
+    """Count a router's sessions and keep them with its telemetry sample for placement
+
+    Called by the router sync, so placement itself never talks to a router.
+    """
+    sessions = 0
+    for path in dict.fromkeys(driver.session_path for driver in get_driver_classes()):
+        try:
+            sessions += count_items(api, path)
+        except Exception:
+            # The service's package is not installed on this router
+            pass
+
+    load = {
+        "sessions": sessions,
+        "cpu": flt(sample["cpu"]) / 100,
+        "memory": flt(sample["memory"]) / 100 if sample["memory"] is not None else None,
+        "collected_at": sample["at"]
+    }
+    frappe.cache().hset(LOAD_KEY, router_name, load)
+    clear_router_scores()
+    return load
+
+
+def clear_router_scores():
+    cache = frappe.cache()
+    cache.delete_value(SCORES_KEY)
+    cache.delete(cache.make_key(PLACED_KEY))
+
+
+def get_router_scores():
+    """Placement scores of every router open to placement, lowest (least loaded) first
+
+    Scores are cached until the next router sync records fresh load, or a
+    router's settings change.
+    """
+    scores = frappe.cache().get_value(SCORES_KEY)
+    if scores is None:
+        scores = compute_router_scores()
+        frappe.cache().set_value(SCORES_KEY, scores)
+    return scores
+
+
+def compute_router_scores():
+    routers = frappe.get_all(
+        "MikroTik Settings",
+        filters={"disabled": 0, "exclude_from_placement": 0},
+        fields=["name", "max_subscriptions"]
+    )
+    if not routers:
+        return []
+
+    subscriptions = dict(frappe.get_all(
+        "MikroTik Router Counter",
+        filters={"router": ["in", [router.name for router in routers]]},
+        fields=["router", "active_subscriptions"],
+        as_list=True
+    ))
+    # Redis returns the hash's field names as bytes
+    loads = {
+        frappe.safe_decode(router): load
+        for router, load in (frappe.cache().hgetall(LOAD_KEY) or {}).items()
+    }
+
+    entries = []
+    for router in routers:
+        load = loads.get(router.name) or {}
+        fresh = time.time() - flt(load.get("collected_at")) < LOAD_STALE_SECONDS
+        entries.append({
+            "router": router.name,
+            "capacity": cint(router.max_subscriptions),
+            "subscriptions": cint(subscriptions.get(router.name)),
+            "sessions": cint(load.get("sessions")),
+            "cpu": load.get("cpu") if fresh else None,
+            "memory": load.get("memory") if fresh else None
+        })
+
+    # Routers without a capacity are compared with the busiest router instead
+    busiest = max([get_users(entry) for entry in entries] + [1])
+    for entry in entries:
+        entry["reference"] = entry["capacity"] or busiest
+        score_entry(entry)
+
+    return sorted(entries, key=lambda entry: entry["score"])
+
+
+def get_users(entry):
+    # Sessions also count guests and users not created by this app
+    return max(entry["subscriptions"], entry["sessions"])
+
+
+def score_entry(entry):
+    """Weigh occupancy, CPU and memory into one score between 0 and about 1
+
+    Parts that are unknown are left out and the rest reweighted.
+    """
+    parts = [(OCCUPANCY_WEIGHT, get_users(entry) / entry["reference"])]
+    if entry["cpu"] is not None:
+        parts.append((CPU_WEIGHT, flt(entry["cpu"])))
+    if entry["memory"] is not None:
+        parts.append((MEMORY_WEIGHT, flt(entry["memory"])))
+
+    entry["occupancy"] = parts[0][1]
+    entry["score"] = sum(weight * value for weight, value in parts) / sum(weight for weight, _value in parts)
+    entry["full"] = bool(entry["capacity"]) and entry["subscriptions"] >= entry["capacity"]
+    return entry
+
+
+def get_placed_counts(routers):
+    """Subscriptions placed on each router since the scores were computed"""
+    if not routers:
+        return {}
+    cache = frappe.cache()
+    return dict(zip(routers, (cint(count) for count in cache.hmget(cache.make_key(PLACED_KEY), routers))))
+
+
+def pick_router():
+    """Return the least loaded router that has room for another subscription
+
+    The new subscription is counted at once with an atomic increment, so a
+    burst of sign-ups on several workers is spread out rather than all landing
+    on the router that was least loaded when the scores were computed.
+    """
+    scores = get_router_scores()
+    placed = get_placed_counts([entry["router"] for entry in scores])
+    entries = sorted(
+        (score_entry(dict(entry, subscriptions=entry["subscriptions"] + placed[entry["router"]]))
+         for entry in scores),
+        key=lambda entry: entry["score"]
+    )
+    for entry in entries:
+        if not entry["full"]:
+            cache = frappe.cache()
+            cache.hincrby(cache.make_key(PLACED_KEY), entry["router"], 1)
+            return entry["router"]
+
+    frappe.throw(_("No MikroTik router has room for a new subscription. Raise a router's capacity or pick one by hand."))
+
+
+def move_user(source, target):
+    """Shift one user and their share of CPU and memory between two score entries"""
+    users = get_users(source) or 1
+    for field in ("cpu", "memory"):
+        if source[field] is not None:
+            share = flt(source[field]) / users
+            source[field] = flt(source[field]) - share
+            if target[field] is not None:
+                target[field] = flt(target[field]) + share
+    for entry, delta in ((source, -1), (target, 1)):
+        entry["subscriptions"] = max(entry["subscriptions"] + delta, 0)
+        entry["sessions"] = max(entry["sessions"] + delta, 0)
+        score_entry(entry)
+
+
+@frappe.whitelist()
+def get_placement_scores():
+    """Current load score of every router open to placement"""
+    frappe.only_for("System Manager")
+    return get_router_scores()
+
+
+@frappe.whitelist()
+def get_rebalancing_moves(max_moves=20, tolerance=0.1):
+    """Propose subscriptions to move from the most to the least loaded routers
+
+    Moves are simulated one at a time, each taking one user's share of CPU and
+    memory along, until the scores of the busiest and the idlest router are
+    within `tolerance`. Offline and light users are proposed first, as moving
+    them disturbs the fewest sessions. Nothing is changed on the routers.
+    """
+    frappe.only_for("System Manager")
+    max_moves = min(cint(max_moves) or 20, MAX_REBALANCING_MOVES)
+    tolerance = flt(tolerance)
+    entries = [dict(entry) for entry in compute_router_scores()]
+    candidates = {}
+    moves = []
+
+    while len(moves) < max_moves and len(entries) > 1:
+        source = max(entries, key=lambda entry: entry["score"])
+        targets = [entry for entry in entries if entry is not source and not entry["full"]]
+        if not targets:
+            break
+        target = min(targets, key=lambda entry: entry["score"])
+        if source["score"] - target["score"] <= tolerance:
+            break
+
+        if source["router"] not in candidates:
+            candidates[source["router"]] = frappe.get_all(
+                "Customer Subscription",
+                filters={"docstatus": 1, "status": "Active", "mikrotik_settings": source["router"]},
+                fields=["name", "customer", "customer_name", "username_mikrotik", "is_online", "data_used_mb"],
+                order_by="is_online asc, data_used_mb asc",
+                limit_page_length=max_moves
+            )
+        if not candidates[source["router"]]:
+            # Only unmanaged sessions are left on this router
+            entries.remove(source)
+            continue
+
+        before = (source["score"], target["score"])
+        moved_source, moved_target = dict(source), dict(target)
+        move_user(moved_source, moved_target)
+        if moved_target["score"] >= before[0]:
+            # The move would only make the target the busiest router
+            break
+        source.update(moved_source)
+        target.update(moved_target)
+
+        subscription = candidates[source["router"]].pop(0)
+        moves.append({
+            "subscription": subscription.name,
+            "customer": subscription.customer,
+            "customer_name": subscription.customer_name,
+            "username": subscription.username_mikrotik,
+            "from_router": source["router"],
+            "to_router": target["router"],
+            "from_score": before[0],
+            "to_score": before[1]
+        })
+
+    return {"moves": moves, "scores": sorted(entries, key=lambda entry: entry["score"])}
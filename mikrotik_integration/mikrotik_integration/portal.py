@@ -0,0 +1,141 @@
+import hashlib
+
+import frappe
+from frappe import _
+from frappe.utils import add_days, date_diff, flt, get_date_str, getdate, nowdate
+from werkzeug.wrappers import Response
+
+# Page data per user is rebuilt at most this often, however often it is loaded
+PORTAL_TTL = 60
+# Which customers a user speaks for changes rarely
+CUSTOMERS_TTL = 10 * 60
+USAGE_HISTORY_DAYS = 14
+PORTAL_FIELDS = [
+    "name", "customer", "customer_name", "internet_plan", "status", "start_date",
+    "expiry_date", "data_used_mb", "last_login", "is_online"
+]
+
+
+def get_portal_key(user):
+    return f"mikrotik_portal::{user}"
+
+
+def get_history_key(subscription):
+    return f"mikrotik_usage_history::{subscription}"
+
+
+def record_daily_usage(subscription, data_used_mb):
+    """Keep a subscription's latest usage reading of each day for the portal
+
+    Called by the usage sync, so the portal never asks a router for history.
+    """
+    cache = frappe.cache()
+    key = get_history_key(subscription)
+    cache.hset(key, nowdate(), flt(data_used_mb))
+    # Subscriptions that stop syncing take their history with them
+    cache.expire(cache.make_key(key), (USAGE_HISTORY_DAYS + 1) * 24 * 60 * 60)
+
+    oldest = get_date_str(add_days(nowdate(), -USAGE_HISTORY_DAYS))
+    stale = [day for day in cache.hkeys(key) if frappe.safe_decode(day) < oldest]
+    if stale:
+        cache.hdel(key, stale)
+
+
+def get_daily_usage(subscription):
+    """MB used on each of the recorded days, oldest first
+
+    Readings are running totals of the router counters; a total that went
+    down (user re-created or router rebooted) starts counting again from zero.
+    """
+    readings = sorted((frappe.cache().hgetall(get_history_key(subscription)) or {}).items())
+    usage = []
+    previous = None
+    for day, total in readings:
+        used = total if previous is None or total < previous else total - previous
+        usage.append({"date": frappe.safe_decode(day), "used_mb": flt(used, 2) if previous is not None else None})
+        previous = total
+    return usage
+
+
+def get_portal_customers(user):
+    """Customers whose contact is linked to the user"""
+    cache_key = f"mikrotik_portal_customers::{user}"
+    customers = frappe.cache().get_value(cache_key)
+    if customers is None:
+        contact = frappe.qb.DocType("Contact")
+        link = frappe.qb.DocType("Dynamic Link")
+        customers = (
+            frappe.qb.from_(link)
+            .join(contact).on(link.parent == contact.name)
+            .select(link.link_name)
+            .distinct()
+            .where(
+                (contact.user == user)
+                & (link.parenttype == "Contact")
+                & (link.link_doctype == "Customer")
+            )
+        ).run(pluck=True)
+        frappe.cache().set_value(cache_key, customers, expires_in_sec=CUSTOMERS_TTL)
+    return customers
+
+
+def build_portal_data(user):
+    customers = get_portal_customers(user)
+    subscriptions = []
+    if customers:
+        subscriptions = frappe.get_all(
+            "Customer Subscription",
+            filters={"customer": ["in", customers], "docstatus": 1},
+            fields=PORTAL_FIELDS,
+            order_by="expiry_date desc"
+        )
+
+    today = getdate(nowdate())
+    for sub in subscriptions:
+        quota = flt(frappe.get_cached_value("Internet Plan", sub.internet_plan, "data_quota_mb"))
+        sub.data_quota_mb = quota or None
+        sub.remaining_mb = max(quota - flt(sub.data_used_mb), 0) if quota else None
+        sub.days_left = max(date_diff(sub.expiry_date, today), 0) if sub.expiry_date else None
+        sub.recent_usage = get_daily_usage(sub.name)
+
+    # The tag only changes with the content, so a rebuilt but unchanged page still answers 304
+    payload = frappe.as_json(subscriptions, indent=None)
+    return {
+        "subscriptions": subscriptions,
+        "generated_at": frappe.utils.now(),
+        "etag": hashlib.md5(payload.encode()).hexdigest()
+    }
+
+
+def get_portal_data(user=None):
+    """Subscriptions, quota and recent usage of the user's customers, cached briefly
+
+    A cache hit costs one Redis read and no database or router queries. A
+    miss costs a query for the subscriptions, plus one for the user's
+    customers every few minutes.
+    """
+    user = user or frappe.session.user
+    data = frappe.cache().get_value(get_portal_key(user))
+    if data is None:
+        data = build_portal_data(user)
+        frappe.cache().set_value(get_portal_key(user), data, expires_in_sec=PORTAL_TTL)
+    return data
+
+
+@frappe.whitelist()
+def get_my_usage():
+    """Portal data of the logged in user, answering 304 when the client's copy is current"""
+    if frappe.session.user == "Guest":
+        frappe.throw(_("You need to be logged in to see your usage"), frappe.PermissionError)
+
+    data = get_portal_data()
+    etag = f'"{data["etag"]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=0, must-revalidate"}
+
+    if frappe.get_request_header("If-None-Match") == etag:
+        return Response(status=304, headers=headers)
+    return Response(
+        frappe.as_json({"message": data}, indent=None),
+        mimetype="application/json",
+        headers=headers
+    )
@@ -0,0 +1,178 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import cint, now
+
+DEFAULT_INTERVAL_MS = 10
+# Modules whose frames mean the job is waiting on a router or on a data store.
+# Socket and ssl frames are charged to whichever of these called them. Redis
+# counts as DB: both are storage round trips rather than Python work.
+ROUTER_IO_MODULES = ("routeros_api",)
+DB_MODULES = ("pymysql", "MySQLdb", "psycopg2", "frappe.database", "redis")
+CATEGORIES = ("router_io", "db", "cpu")
+
+
+def is_profiling_enabled(job_name, router=None):
+    """Check the site config switch, then the router's own switch
+
+    `mikrotik_profile_jobs` in site config is either true for every job or a
+    list of job names.
+    """
+    jobs = frappe.conf.get("mikrotik_profile_jobs")
+    if jobs is True or (isinstance(jobs, (list, tuple)) and job_name in jobs) or jobs == job_name:
+        return True
+    if router:
+        return bool(cint(frappe.get_cached_value("MikroTik Settings", router, "profile_sync_jobs")))
+    return False
+
+
+class SamplingProfiler:
+    """Sample one thread's stack from a background thread
+
+    Every sample is charged the wall time since the previous one, so the
+    breakdown adds up to the run time even if the sampler falls behind. The
+    job being profiled pays no per-call cost.
+    """
+
+    def __init__(self, interval_ms=DEFAULT_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.thread_id = threading.get_ident()
+        self.stacks = {}
+        self.seconds = dict.fromkeys(CATEGORIES, 0.0)
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self._thread = threading.Thread(target=self.run, name="mikrotik-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.wall_seconds = time.perf_counter() - self.started
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            current = time.perf_counter()
+            elapsed, self._last = current - self._last, current
+            if frame is not None:
+                self.record(frame, elapsed)
+
+    def record(self, frame, elapsed):
+        names = []
+        category = None
+        while frame is not None:
+            module = frame.f_globals.get("__name__", "?")
+            if category is None:
+                category = classify(module)
+            names.append(f"{module}:{frame.f_code.co_name}")
+            frame = frame.f_back
+
+        stack = ";".join(reversed(names))
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+        self.seconds[category or "cpu"] += elapsed
+        self.samples += 1
+
+    def get_collapsed_stacks(self):
+        """Stacks in the collapsed format read by flamegraph.pl and speedscope"""
+        return "\n".join(
+            f"{stack} {count}" for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1])
+        )
+
+
+def classify(module):
+    """Category of a frame's module, or None for plain Python work"""
+    for prefix in ROUTER_IO_MODULES:
+        if module == prefix or module.startswith(prefix + "."):
+            return "router_io"
+    for prefix in DB_MODULES:
+        if module == prefix or module.startswith(prefix + "."):
+            return "db"
+    return None
+
+
+@contextmanager
+def profile_job(job_name, router=None, run_id=None):
+    """Profile the enclosed block if profiling is switched on for the job or router"""
+    if not is_profiling_enabled(job_name, router):
+        yield None
+        return
+
+    profiler = SamplingProfiler(cint(frappe.conf.get("mikrotik_profile_interval_ms")) or DEFAULT_INTERVAL_MS)
+    started_at = now()
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        save_profile(profiler, job_name, router, run_id, started_at)
+
+
+def save_profile(profiler, job_name, router, run_id, started_at):
+    try:
+        frappe.get_doc({
+            "doctype": "MikroTik Job Profile",
+            "job": job_name,
+            "router": router,
+            "run_id": run_id,
+            "started_at": started_at,
+            "wall_seconds": profiler.wall_seconds,
+            "samples": profiler.samples,
+            "router_io_seconds": profiler.seconds["router_io"],
+            "db_seconds": profiler.seconds["db"],
+            "cpu_seconds": profiler.seconds["cpu"],
+            "collapsed_stacks": profiler.get_collapsed_stacks()
+        }).insert(ignore_permissions=True)
+        frappe.db.commit()
+    except Exception as e:
+        # Profiling must never break the job it watches
+        frappe.db.rollback()
+        frappe.log_error(f"Could not save profile of {job_name} for router {router}: {str(e)}")
+
+
+def to_speedscope(name, collapsed_stacks, wall_seconds):
+    """Convert collapsed stacks into a speedscope sampled profile"""
+    frames = []
+    frame_index = {}
+    samples = []
+    weights = []
+    total = 0
+
+    for line in (collapsed_stacks or "").splitlines():
+        stack, _, count = line.rpartition(" ")
+        if not stack:
+            continue
+        indexes = []
+        for frame_name in stack.split(";"):
+            if frame_name not in frame_index:
+                frame_index[frame_name] = len(frames)
+                frames.append({"name": frame_name})
+            indexes.append(frame_index[frame_name])
+        samples.append(indexes)
+        weights.append(cint(count))
+        total += cint(count)
+
+    # Weight samples in seconds so the flame graph shows wall time
+    scale = (wall_seconds / total) if total else 0
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": wall_seconds,
+            "samples": samples,
+            "weights": [weight * scale for weight in weights]
+        }],
+        "exporter": "mikrotik_integration"
+    }
@@ -0,0 +1,134 @@
+import math
+import time
+
+import frappe
+from frappe.utils import cint, flt
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BACKGROUND = "background"
+# Longest single sleep while waiting for a token, so a changed budget is picked up quickly
+MAX_WAIT = 1.0
+
+# Refill the router's bucket and take one token if the lane is allowed to.
+# Background commands may not dip into the reserve kept for interactive ones.
+# Runs in Redis so every worker process shares the same bucket, timed by the
+# Redis clock. Returns 0 when a token was taken, otherwise the wait in ms.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local floor = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+-- Tokens never exceed the burst, so a higher floor would starve the lane for good
+floor = math.min(floor, burst - 1)
+
+local clock = redis.call("TIME")
+local current = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local state = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or current
+tokens = math.min(burst, tokens + math.max(0, current - updated) * rate)
+
+local wait = 0
+if tokens - 1 >= floor then
+    tokens = tokens - 1
+else
+    wait = math.ceil((floor + 1 - tokens) / rate * 1000)
+end
+
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated", tostring(current))
+redis.call("EXPIRE", KEYS[1], ttl)
+return wait
+"""
+
+
+def get_bucket_key(router):
+    return f"mikrotik_command_bucket::{router}"
+
+
+class TokenBucket:
+    """Per-router command budget shared by all workers through Redis
+
+    `rate` is the sustained number of commands per second and `burst` how many
+    may go out back to back. `reserve` is the share of the burst kept for the
+    interactive lane, so provisioning a paying customer never queues behind a
+    background sync.
+    """
+
+    def __init__(self, router, rate, burst, reserve=0):
+        self.key = get_bucket_key(router)
+        self.rate = flt(rate)
+        self.burst = max(cint(burst), 1)
+        # At least one token must stay reachable for background commands
+        self.reserve = min(min(flt(reserve), 100) / 100 * self.burst, self.burst - 1)
+        self.ttl = max(int(math.ceil(self.burst / self.rate)), 1) + 60
+
+    def try_acquire(self, priority=PRIORITY_INTERACTIVE):
+        """Take a token if the lane may, returning 0 or the milliseconds to wait"""
+        cache = frappe.cache()
+        floor = 0 if priority == PRIORITY_INTERACTIVE else self.reserve
+        return cint(cache.eval(
+            TOKEN_BUCKET_SCRIPT, 1, cache.make_key(self.key),
+            self.rate, self.burst, floor, self.ttl
+        ))
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE):
+        """Block until the lane may send one command"""
+        while True:
+            wait = self.try_acquire(priority)
+            if not wait:
+                return
+            time.sleep(min(wait / 1000, MAX_WAIT))
+
+
+class RateLimitedCommunicator:
+    """Take a token from the router's bucket before every command sent
+
+    Wraps the communicator of a RouterOsApi, which all resources send through.
+    Commands are also counted for the sync run ledger, with or without a bucket.
+    """
+
+    def __init__(self, inner, bucket, priority):
+        self.inner = inner
+        self.bucket = bucket
+        self.priority = priority
+
+    def call(self, *args, **kwargs):
+        if self.bucket:
+            self.bucket.acquire(self.priority)
+        count_router_call()
+        return self.inner.call(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+
+def count_router_call():
+    frappe.local.mikrotik_router_calls = get_router_call_count() + 1
+
+
+def get_router_call_count():
+    """RouterOS commands sent by this thread since the count was last reset"""
+    return getattr(frappe.local, "mikrotik_router_calls", 0)
+
+
+def reset_router_call_count():
+    frappe.local.mikrotik_router_calls = 0
+
+
+def get_token_bucket(router_doc):
+    """Return the router's command budget, or None if it is not rate limited"""
+    if flt(router_doc.get("command_rate_limit")) <= 0:
+        return None
+    return TokenBucket(
+        router_doc.name,
+        router_doc.command_rate_limit,
+        router_doc.command_burst or router_doc.command_rate_limit,
+        router_doc.interactive_reserve
+    )
+
+
+def apply_rate_limit(api, router_doc, priority=PRIORITY_INTERACTIVE):
+    """Route an API connection's commands through the router's token bucket"""
+    api.communicator = RateLimitedCommunicator(api.communicator, get_token_bucket(router_doc), priority)
+    return api
@@ -0,0 +1,39 @@
+// Copyright (c) 2026, ronoh and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["MikroTik Sync Throughput"] = {
+    filters: [
+        {
+            fieldname: "from_date",
+            label: __("From Date"),
+            fieldtype: "Date",
+            default: frappe.datetime.add_days(frappe.datetime.get_today(), -7),
+            reqd: 1
+        },
+        {
+            fieldname: "to_date",
+            label: __("To Date"),
+            fieldtype: "Date",
+            default: frappe.datetime.get_today(),
+            reqd: 1
+        },
+        {
+            fieldname: "job",
+            label: __("Job"),
+            fieldtype: "Data"
+        },
+        {
+            fieldname: "router",
+            label: __("Router"),
+            fieldtype: "Link",
+            options: "MikroTik Settings"
+        },
+        {
+            fieldname: "granularity",
+            label: __("Granularity"),
+            fieldtype: "Select",
+            options: "Daily\nHourly",
+            default: "Daily"
+        }
+    ]
+};
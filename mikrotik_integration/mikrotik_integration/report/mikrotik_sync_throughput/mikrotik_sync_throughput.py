@@ -0,0 +1,103 @@
+# Copyright (c) 2026, ronoh and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.query_builder.functions import Count, Date, Extract, Sum
+from frappe.utils import add_days, flt, getdate
+
+SECONDS_PER_PERIOD = {"Daily": 24 * 60 * 60, "Hourly": 60 * 60}
+
+
+def execute(filters=None):
+    filters = frappe._dict(filters or {})
+    data = get_data(filters)
+    return get_columns(), data, None, get_chart(data)
+
+
+def get_columns():
+    return [
+        {"fieldname": "period", "label": _("Period"), "fieldtype": "Data", "width": 140},
+        {"fieldname": "runs", "label": _("Runs"), "fieldtype": "Int", "width": 80},
+        {"fieldname": "rows_scanned", "label": _("Rows Scanned"), "fieldtype": "Int", "width": 120},
+        {"fieldname": "rows_changed", "label": _("Rows Changed"), "fieldtype": "Int", "width": 120},
+        {"fieldname": "router_calls", "label": _("Router Calls"), "fieldtype": "Int", "width": 120},
+        {"fieldname": "db_writes", "label": _("DB Writes"), "fieldtype": "Int", "width": 100},
+        {"fieldname": "errors", "label": _("Errors"), "fieldtype": "Int", "width": 80},
+        {"fieldname": "busy_seconds", "label": _("Busy Seconds"), "fieldtype": "Float", "width": 120},
+        {"fieldname": "rows_per_second", "label": _("Rows / Busy Second"), "fieldtype": "Float", "width": 150},
+        {"fieldname": "avg_busy_workers", "label": _("Avg Busy Workers"), "fieldtype": "Float", "width": 140},
+    ]
+
+
+def get_data(filters):
+    """Sum the ledger per day or hour
+
+    Throughput is rows scanned per second a worker spent in the job, and the
+    average busy workers is the job time divided by the length of the period,
+    i.e. how many workers the jobs kept occupied on average.
+    """
+    granularity = filters.granularity if filters.granularity in SECONDS_PER_PERIOD else "Daily"
+    run = frappe.qb.DocType("MikroTik Sync Run")
+    day = Date(run.started_at)
+    group_by = [day]
+    if granularity == "Hourly":
+        group_by.append(Extract("hour", run.started_at))
+
+    query = (
+        frappe.qb.from_(run)
+        .select(
+            *group_by,
+            Count("*"),
+            Sum(run.rows_scanned),
+            Sum(run.rows_changed),
+            Sum(run.router_calls),
+            Sum(run.db_writes),
+            Sum(run.errors),
+            Sum(run.duration_seconds)
+        )
+        .where(run.started_at >= getdate(filters.from_date))
+        .where(run.started_at < add_days(getdate(filters.to_date), 1))
+        .groupby(*group_by)
+        .orderby(*group_by)
+    )
+    if filters.job:
+        query = query.where(run.job == filters.job)
+    if filters.router:
+        query = query.where(run.router == filters.router)
+
+    period_seconds = SECONDS_PER_PERIOD[granularity]
+    data = []
+    for row in query.run():
+        hour = row[1] if granularity == "Hourly" else None
+        runs, scanned, changed, router_calls, db_writes, errors, busy = row[len(group_by):]
+        busy = flt(busy)
+        data.append({
+            "period": str(row[0]) if hour is None else f"{row[0]} {int(hour):02d}:00",
+            "runs": runs,
+            "rows_scanned": scanned or 0,
+            "rows_changed": changed or 0,
+            "router_calls": router_calls or 0,
+            "db_writes": db_writes or 0,
+            "errors": errors or 0,
+            "busy_seconds": busy,
+            "rows_per_second": flt(scanned) / busy if busy else 0,
+            "avg_busy_workers": busy / period_seconds
+        })
+    return data
+
+
+def get_chart(data):
+    if not data:
+        return None
+    return {
+        "data": {
+            "labels": [row["period"] for row in data],
+            "datasets": [
+                {"name": _("Rows / Busy Second"), "values": [row["rows_per_second"] for row in data]},
+                {"name": _("Avg Busy Workers"), "values": [row["avg_busy_workers"] for row in data]},
+            ]
+        },
+        "type": "line",
+        "axisOptions": {"xIsSeries": 1}
+    }
@@ -0,0 +1,27 @@
+// Copyright (c) 2026, ronoh and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["MikroTik Usage Analytics"] = {
+    filters: [
+        {
+            fieldname: "router",
+            label: __("Router"),
+            fieldtype: "Link",
+            options: "MikroTik Settings"
+        },
+        {
+            fieldname: "view",
+            label: __("Show"),
+            fieldtype: "Select",
+            options: "Top Talkers\nFlagged",
+            default: "Top Talkers"
+        },
+        {
+            fieldname: "top",
+            label: __("Top Talkers"),
+            fieldtype: "Int",
+            default: 50,
+            depends_on: "eval:doc.view == 'Top Talkers'"
+        }
+    ]
+};
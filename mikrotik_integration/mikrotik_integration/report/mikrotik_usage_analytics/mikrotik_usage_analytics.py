@@ -0,0 +1,85 @@
+# Copyright (c) 2026, ronoh and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.utils import cint
+
+from mikrotik_integration.mikrotik_integration.analytics import get_analytics
+
+
+def execute(filters=None):
+    filters = frappe._dict(filters or {})
+    analytics = get_analytics([filters.router] if filters.router else None, cint(filters.top) or 50)
+    data = get_data(analytics, filters)
+    return get_columns(), data, None, get_chart(analytics), get_summary(analytics)
+
+
+def get_columns():
+    return [
+        {"fieldname": "subscription", "label": _("Subscription"), "fieldtype": "Link",
+         "options": "Customer Subscription", "width": 130},
+        {"fieldname": "customer_name", "label": _("Customer"), "fieldtype": "Data", "width": 160},
+        {"fieldname": "internet_plan", "label": _("Plan"), "fieldtype": "Link",
+         "options": "Internet Plan", "width": 120},
+        {"fieldname": "router", "label": _("Router"), "fieldtype": "Link",
+         "options": "MikroTik Settings", "width": 120},
+        {"fieldname": "rate_mbps", "label": _("Rate (Mbps)"), "fieldtype": "Float",
+         "precision": 2, "width": 110},
+        {"fieldname": "delta_mb", "label": _("Used in Interval (MB)"), "fieldtype": "Float",
+         "precision": 1, "width": 150},
+        {"fieldname": "interval_seconds", "label": _("Interval (s)"), "fieldtype": "Int", "width": 100},
+        {"fieldname": "used_mb", "label": _("Counter (MB)"), "fieldtype": "Float",
+         "precision": 1, "width": 120},
+        {"fieldname": "score", "label": _("Score"), "fieldtype": "Float", "precision": 1, "width": 80},
+        {"fieldname": "flags", "label": _("Flags"), "fieldtype": "Data", "width": 120},
+    ]
+
+
+def get_data(analytics, filters):
+    """Rows of the selected view, with the customer and plan of each subscription in one query"""
+    rows = analytics["flagged"] if filters.view == "Flagged" else analytics["top_talkers"]
+    details = {
+        sub.name: sub
+        for sub in frappe.get_all(
+            "Customer Subscription",
+            filters={"name": ["in", [row["subscription"] for row in rows]]},
+            fields=["name", "customer_name", "internet_plan"]
+        )
+    } if rows else {}
+
+    data = []
+    for row in rows:
+        sub = details.get(row["subscription"]) or {}
+        data.append(dict(
+            row,
+            customer_name=sub.get("customer_name"),
+            internet_plan=sub.get("internet_plan"),
+            flags=", ".join(_(flag.title()) for flag in row["flags"])
+        ))
+    return data
+
+
+def get_chart(analytics):
+    if not analytics["percentiles"]:
+        return None
+    return {
+        "data": {
+            "labels": [f"P{percentile}" for percentile in analytics["percentiles"]],
+            "datasets": [{"name": _("Rate (Mbps)"), "values": list(analytics["percentiles"].values())}]
+        },
+        "type": "bar"
+    }
+
+
+def get_summary(analytics):
+    percentiles = analytics["percentiles"]
+    return [
+        {"label": _("Users"), "value": analytics["users"], "datatype": "Int"},
+        {"label": _("Fleet Rate (Mbps)"), "value": analytics["total_mbps"], "datatype": "Float"},
+        {"label": _("Median Rate (Mbps)"), "value": percentiles.get(50, 0), "datatype": "Float"},
+        {"label": _("P99 Rate (Mbps)"), "value": percentiles.get(99, 0), "datatype": "Float"},
+        {"label": _("Flagged"), "value": analytics["flagged_count"], "datatype": "Int",
+         "indicator": "Red" if analytics["flagged_count"] else "Green"},
+        {"label": _("Computed In (ms)"), "value": analytics["elapsed_ms"], "datatype": "Float"},
+    ]
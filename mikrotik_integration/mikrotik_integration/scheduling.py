@@ -0,0 +1,122 @@
+import time
+
+import frappe
+from frappe.utils import cint, flt, now
+
+# (base interval, max interval) in seconds for jobs whose per-router polling adapts.
+# Jobs not listed here visit every router on every run.
+ADAPTIVE_INTERVALS = {
+    "sync_router_status": (120, 900),
+    "sync_usage_data": (3600, 4 * 3600),
+    "sync_all_routers": (300, 1800),
+}
+BACKOFF_FACTOR = 1.5
+# Fraction of scanned subscriptions that must change for a router to be polled at the base rate
+BUSY_CHANGE_RATE = 0.01
+# Never poll a router more often than this multiple of its own run time
+DURATION_HEADROOM = 2
+SCHEDULE_TTL = 7 * 24 * 60 * 60
+
+
+def get_schedule_key(job_name):
+    return f"mikrotik_router_schedule::{job_name}"
+
+
+def get_backlog_key(job_name):
+    return f"mikrotik_sync_backlog::{job_name}"
+
+
+def get_due_routers(job_name, routers):
+    """Split routers into those due for a poll now and those that can wait
+
+    Returns (due, overdue) where overdue counts the due routers that are later
+    than their interval, which means workers are not keeping up.
+    """
+    if job_name not in ADAPTIVE_INTERVALS:
+        return list(routers), 0
+
+    schedule = frappe.cache().hgetall(get_schedule_key(job_name)) or {}
+    current = time.time()
+    due = []
+    overdue = 0
+
+    for router in routers:
+        state = schedule.get(router) or schedule.get(router.encode())
+        if not state or current >= state.get("next_run", 0):
+            due.append(router)
+            if state and current - state.get("next_run", current) > state.get("interval", 0):
+                overdue += 1
+
+    return due, overdue
+
+
+def update_router_schedule(job_name, router, duration, result):
+    """Work out when a router should next be polled from its last run
+
+    Quiet routers back off towards the max interval, routers with changes go back
+    to the base interval, and slow routers are never polled faster than their run
+    time allows.
+    """
+    if job_name not in ADAPTIVE_INTERVALS or (result or {}).get("skipped"):
+        return
+
+    base, maximum = ADAPTIVE_INTERVALS[job_name]
+    cache = frappe.cache()
+    key = get_schedule_key(job_name)
+    state = cache.hget(key, router) or {}
+
+    avg_duration = flt(state.get("avg_duration")) or duration
+    avg_duration = 0.7 * avg_duration + 0.3 * duration
+
+    scanned = cint(result.get("scanned"))
+    change_rate = cint(result.get("changed")) / scanned if scanned else 0
+
+    interval = flt(state.get("interval")) or base
+    if result.get("errors") or change_rate >= BUSY_CHANGE_RATE:
+        interval = base
+    else:
+        interval = min(interval * BACKOFF_FACTOR, maximum)
+    interval = max(interval, avg_duration * DURATION_HEADROOM)
+
+    cache.hset(key, router, {
+        "interval": interval,
+        "avg_duration": avg_duration,
+        "change_rate": change_rate,
+        # A little slack so a router is not missed by seconds when the cron fires
+        "next_run": time.time() + interval - min(base / 4, 30),
+        "last_run": now()
+    })
+    cache.expire(cache.make_key(key), SCHEDULE_TTL)
+
+
+def record_backlog(job_name, due=0, overdue=0, in_flight=0, skipped_run=False):
+    """Keep a small backlog metric per job for monitoring worker capacity"""
+    cache = frappe.cache()
+    backlog = cache.get_value(get_backlog_key(job_name)) or {}
+    backlog.update({
+        "due": due,
+        "overdue": overdue,
+        "in_flight": in_flight,
+        "skipped_runs": cint(backlog.get("skipped_runs")) + (1 if skipped_run else 0),
+        "last_skipped": now() if skipped_run else backlog.get("last_skipped"),
+        "updated": now()
+    })
+    cache.set_value(get_backlog_key(job_name), backlog)
+
+
+@frappe.whitelist()
+def get_sync_backlog():
+    """Return backlog metrics and router schedules for the sync jobs"""
+    frappe.only_for("System Manager")
+
+    cache = frappe.cache()
+    jobs = {}
+    for job_name in ["process_expired_subscriptions", *ADAPTIVE_INTERVALS]:
+        schedule = cache.hgetall(get_schedule_key(job_name)) or {}
+        jobs[job_name] = {
+            "backlog": cache.get_value(get_backlog_key(job_name)) or {},
+            "routers": {
+                frappe.safe_decode(router): state for router, state in schedule.items()
+            }
+        }
+    return jobs
@@ -0,0 +1,217 @@
+import bisect
+import hashlib
+import time
+from contextlib import nullcontext
+
+import frappe
+from frappe.utils import now
+
+from mikrotik_integration.mikrotik_integration.doctype.mikrotik_sync_run.mikrotik_sync_run import record_sync_run
+from mikrotik_integration.mikrotik_integration.profiler import profile_job
+from mikrotik_integration.mikrotik_integration.scheduling import (
+    get_due_routers,
+    record_backlog,
+    update_router_schedule,
+)
+
+SHARD_JOB_TIMEOUT = 1500
+RUN_RESULT_TTL = 6 * 60 * 60
+# A run whose fan-in never happens (e.g. a killed worker) gives up its lease after this
+RUN_LEASE_TTL = 2 * SHARD_JOB_TIMEOUT
+VIRTUAL_NODES = 64
+
+
+class HashRing:
+    """Consistent hash ring mapping router names onto worker queues
+
+    Each queue is placed on the ring many times so routers spread evenly, and
+    adding or removing a queue only moves the routers next to it.
+    """
+
+    def __init__(self, nodes, replicas=VIRTUAL_NODES):
+        self.ring = []
+        for node in nodes:
+            for i in range(replicas):
+                self.ring.append((self.hash(f"{node}#{i}"), node))
+        self.ring.sort()
+        self.keys = [key for key, _node in self.ring]
+
+    @staticmethod
+    def hash(value):
+        return int(hashlib.md5(value.encode()).hexdigest()[:16], 16)
+
+    def get_node(self, key):
+        if not self.ring:
+            return None
+        index = bisect.bisect(self.keys, self.hash(key)) % len(self.ring)
+        return self.ring[index][1]
+
+
+def get_sync_queues():
+    """Queues that router sync jobs are spread over
+
+    Set `mikrotik_sync_queues` in site config to a list of queues, each served by
+    its own bench workers, to scale sync out. Defaults to the short queue.
+    """
+    queues = frappe.conf.get("mikrotik_sync_queues") or ["short"]
+    if isinstance(queues, str):
+        queues = [q.strip() for q in queues.split(",") if q.strip()]
+    return queues
+
+
+def get_queue_for_router(router, queues=None):
+    return HashRing(queues or get_sync_queues()).get_node(router)
+
+
+def acquire_lease(key, ttl=SHARD_JOB_TIMEOUT):
+    """Take an expiring lock in Redis, returning a token or None if it is held"""
+    cache = frappe.cache()
+    token = frappe.generate_hash(length=12)
+    if cache.set(cache.make_key(key), token, nx=True, ex=ttl):
+        return token
+    return None
+
+
+def release_lease(key, token):
+    """Release a lease, but only if it is still ours"""
+    cache = frappe.cache()
+    redis_key = cache.make_key(key)
+    held = cache.get(redis_key)
+    if held and held.decode() == token:
+        cache.delete(redis_key)
+
+
+def get_router_lease_key(job_name, router):
+    return f"mikrotik_router_lease::{job_name}::{router}"
+
+
+def get_run_lease_key(job_name):
+    return f"mikrotik_run_lease::{job_name}"
+
+
+def fan_out(job_name, method, routers, **kwargs):
+    """Enqueue one job per router on its consistent-hash queue
+
+    `method` is called as method(router, **kwargs) and should return a dict of
+    counters. Once the last router finishes, the counters are summed up by
+    `fan_in`.
+    """
+    routers = sorted(set(filter(None, routers)))
+    if not routers:
+        return None
+
+    # Skip this run entirely while the previous run's routers are still in flight
+    run_lease = acquire_lease(get_run_lease_key(job_name), ttl=RUN_LEASE_TTL)
+    if not run_lease:
+        record_backlog(job_name, due=len(routers), skipped_run=True)
+        return None
+
+    routers, overdue = get_due_routers(job_name, routers)
+    if not routers:
+        release_lease(get_run_lease_key(job_name), run_lease)
+        record_backlog(job_name, overdue=overdue)
+        return None
+
+    cache = frappe.cache()
+    run_id = f"{job_name}::{frappe.generate_hash(length=10)}"
+    cache.set(cache.make_key(f"mikrotik_sync_pending::{run_id}"), len(routers), ex=RUN_RESULT_TTL)
+    cache.set_value(f"mikrotik_sync_run_lease::{run_id}", run_lease, expires_in_sec=RUN_RESULT_TTL)
+    ring = HashRing(get_sync_queues())
+    already_queued = 0
+
+    for router in routers:
+        job = frappe.enqueue(
+            "mikrotik_integration.mikrotik_integration.sharding.run_router_job",
+            queue=ring.get_node(router),
+            timeout=SHARD_JOB_TIMEOUT,
+            job_id=f"{job_name}::{router}",
+            deduplicate=True,
+            sync_job=job_name,
+            method=method,
+            run_id=run_id,
+            router=router,
+            job_kwargs=kwargs
+        )
+        if not job:
+            # The router's job from an earlier run has not started yet
+            already_queued += 1
+
+    record_backlog(job_name, due=len(routers), overdue=overdue, in_flight=already_queued)
+    if already_queued and cache.decr(cache.make_key(f"mikrotik_sync_pending::{run_id}"), already_queued) <= 0:
+        fan_in(job_name, run_id)
+
+    return run_id
+
+
+def run_router_job(sync_job, method, run_id, router, job_kwargs=None):
+    """Run one router's share of a sync job under the router lease"""
+    lease_key = get_router_lease_key(sync_job, router)
+    token = acquire_lease(lease_key)
+    result = {"skipped": 1}
+    started = time.monotonic()
+
+    try:
+        # The profile is saved outside the ledger block, so its insert is not counted in the run's writes.
+        # Errors are handled inside, so neither is ever saved with a failed job's writes.
+        with profile_job(sync_job, router, run_id) if token else nullcontext():
+            with record_sync_run(sync_job, router, run_id) as run:
+                if token:
+                    result = call_router_method(sync_job, method, router, job_kwargs, run)
+                run.result = result
+    finally:
+        if token:
+            release_lease(lease_key, token)
+        update_router_schedule(sync_job, router, time.monotonic() - started, result)
+        record_router_result(sync_job, run_id, router, result)
+
+
+def call_router_method(sync_job, method, router, job_kwargs=None, run=None):
+    try:
+        return frappe.get_attr(method)(router, **(job_kwargs or {})) or {}
+    except Exception as e:
+        if run is not None:
+            run.error = str(e)
+        frappe.log_error(f"Error in {sync_job} for router {router}: {str(e)}", "Router Sync Error")
+        frappe.db.rollback()
+        return {"errors": 1}
+
+
+def record_router_result(job_name, run_id, router, result):
+    cache = frappe.cache()
+    results_key = f"mikrotik_sync_results::{run_id}"
+    cache.hset(results_key, router, result)
+    cache.expire(cache.make_key(results_key), RUN_RESULT_TTL)
+
+    # The job that brings the pending count to zero performs the fan-in
+    if cache.decr(cache.make_key(f"mikrotik_sync_pending::{run_id}")) <= 0:
+        fan_in(job_name, run_id)
+
+
+def fan_in(job_name, run_id):
+    """Aggregate per-router counters once every router job has reported"""
+    cache = frappe.cache()
+    results_key = f"mikrotik_sync_results::{run_id}"
+    results = cache.hgetall(results_key) or {}
+
+    totals = {}
+    for result in results.values():
+        for key, value in (result or {}).items():
+            totals[key] = totals.get(key, 0) + value
+
+    summary = {
+        "job": job_name,
+        "run_id": run_id,
+        "routers": len(results),
+        "totals": totals,
+        "finished_at": now()
+    }
+    cache.set_value(f"mikrotik_sync_last_result::{job_name}", summary)
+    cache.delete_value(results_key)
+    cache.delete(cache.make_key(f"mikrotik_sync_pending::{run_id}"))
+
+    run_lease = cache.get_value(f"mikrotik_sync_run_lease::{run_id}")
+    if run_lease:
+        release_lease(get_run_lease_key(job_name), run_lease)
+        cache.delete_value(f"mikrotik_sync_run_lease::{run_id}")
+    frappe.publish_realtime("mikrotik_sync_complete", summary)
+    return summary
@@ -0,0 +1,159 @@
+import re
+import time
+
+import frappe
+from frappe.utils import cint, flt
+
+# Ring buffers per router: (tier, seconds per slot, slots). Each slot holds the
+# aggregate of the samples in its period and is overwritten once the buffer
+# wraps, so storage per router is fixed whatever the sync interval.
+TIERS = (
+    ("5m", 5 * 60, 288),
+    ("1h", 60 * 60, 168),
+    ("1d", 24 * 60 * 60, 90),
+)
+# Dynamic interfaces (one per PPPoE or L2TP session) are left out; of the rest
+# only the busiest are kept
+MAX_INTERFACES = 16
+INTERFACE_FIELDS = "name,type,running,disabled,dynamic,rx-byte,tx-byte"
+LATEST_KEY = "mikrotik_telemetry_latest"
+COUNTERS_KEY = "mikrotik_interface_counters"
+UPTIME_UNITS = {"w": 7 * 24 * 60 * 60, "d": 24 * 60 * 60, "h": 60 * 60, "m": 60, "s": 1}
+
+
+def get_tier_key(router, tier):
+    return f"mikrotik_telemetry::{router}::{tier}"
+
+
+def parse_uptime(uptime):
+    """Seconds in a RouterOS duration such as 2w3d4h5m6s"""
+    return sum(cint(value) * UPTIME_UNITS[unit] for value, unit in re.findall(r"(\d+)([wdhms])", uptime or ""))
+
+
+def get_system_resource(api):
+    """/system/resource of a connection, reusing the row read when it was opened"""
+    resource = getattr(api, "system_resource", None)
+    if resource is None:
+        resource = api.get_resource("/system/resource").get()
+    return (resource or [{}])[0]
+
+
+def get_interface_rates(api, router, sampled_at):
+    """Bits per second per interface since the previous sample of the router
+
+    Rates come from the byte counters, so one print per run is enough. A
+    counter that went down (reboot or reset) gives no rate for that run.
+    """
+    rows = api.get_resource("/interface").call("print", {".proplist": INTERFACE_FIELDS})
+    counters = {
+        row.get("name"): (cint(row.get("rx-byte")), cint(row.get("tx-byte")))
+        for row in rows
+        if row.get("dynamic") != "true" and row.get("disabled") != "true"
+    }
+
+    cache = frappe.cache()
+    previous = cache.hget(COUNTERS_KEY, router) or {}
+    cache.hset(COUNTERS_KEY, router, {"at": sampled_at, "counters": counters})
+
+    elapsed = sampled_at - flt(previous.get("at"))
+    if not previous or elapsed <= 0:
+        return {}
+
+    rates = {}
+    for name, (rx, tx) in counters.items():
+        before = previous["counters"].get(name)
+        if before and rx >= before[0] and tx >= before[1]:
+            rates[name] = ((rx - before[0]) * 8 / elapsed, (tx - before[1]) * 8 / elapsed)
+    return top_interfaces(rates)
+
+
+def top_interfaces(rates):
+    busiest = sorted(rates.items(), key=lambda item: -(item[1][0] + item[1][1]))
+    return dict(busiest[:MAX_INTERFACES])
+
+
+def collect_router_telemetry(api, router):
+    """Sample a router's CPU, memory, uptime and interface rates into its ring buffers"""
+    sampled_at = time.time()
+    resource = get_system_resource(api)
+    total_memory = flt(resource.get("total-memory"))
+
+    sample = {
+        "at": sampled_at,
+        "cpu": flt(resource.get("cpu-load")),
+        "memory": (1 - flt(resource.get("free-memory")) / total_memory) * 100 if total_memory else None,
+        "uptime": parse_uptime(resource.get("uptime")),
+        "version": resource.get("version"),
+        "interfaces": get_interface_rates(api, router, sampled_at)
+    }
+
+    cache = frappe.cache()
+    cache.hset(LATEST_KEY, router, sample)
+    for tier, resolution, slots in TIERS:
+        add_to_slot(cache, get_tier_key(router, tier), resolution, slots, sample)
+    return sample
+
+
+def add_to_slot(cache, key, resolution, slots, sample):
+    """Fold a sample into the slot of its period, replacing a slot left from an earlier lap"""
+    period = int(sample["at"] // resolution)
+    slot = period % slots
+    bucket = cache.hget(key, slot)
+    if not bucket or bucket["period"] != period:
+        bucket = {"period": period, "count": 0, "cpu": 0.0, "cpu_max": 0.0,
+                  "memory": 0.0, "memory_count": 0, "interfaces": {}}
+
+    bucket["count"] += 1
+    bucket["cpu"] += sample["cpu"]
+    bucket["cpu_max"] = max(bucket["cpu_max"], sample["cpu"])
+    if sample["memory"] is not None:
+        bucket["memory"] += sample["memory"]
+        bucket["memory_count"] += 1
+    bucket["uptime"] = sample["uptime"]
+
+    interfaces = bucket["interfaces"]
+    for name, (rx, tx) in sample["interfaces"].items():
+        total = interfaces.get(name, (0.0, 0.0, 0))
+        interfaces[name] = (total[0] + rx, total[1] + tx, total[2] + 1)
+    if len(interfaces) > MAX_INTERFACES:
+        bucket["interfaces"] = dict(
+            sorted(interfaces.items(), key=lambda item: -(item[1][0] + item[1][1]) / item[1][2])[:MAX_INTERFACES]
+        )
+
+    cache.hset(key, slot, bucket)
+
+
+def get_latest_samples(routers=None):
+    """Last sample of each router, keyed by router"""
+    # Redis returns the hash's field names as bytes
+    samples = {
+        frappe.safe_decode(router): sample
+        for router, sample in (frappe.cache().hgetall(LATEST_KEY) or {}).items()
+    }
+    if routers is not None:
+        samples = {router: sample for router, sample in samples.items() if router in routers}
+    return samples
+
+
+def get_series(router, tier="5m"):
+    """A router's buffered history in one tier, oldest first, as per-period averages"""
+    resolution, slots = next((res, count) for name, res, count in TIERS if name == tier)
+    oldest = int(time.time() // resolution) - slots + 1
+
+    series = []
+    for bucket in sorted((frappe.cache().hgetall(get_tier_key(router, tier)) or {}).values(),
+                         key=lambda bucket: bucket["period"]):
+        if bucket["period"] < oldest or not bucket["count"]:
+            continue
+        series.append({
+            "at": bucket["period"] * resolution,
+            "cpu": bucket["cpu"] / bucket["count"],
+            "cpu_max": bucket["cpu_max"],
+            "memory": bucket["memory"] / bucket["memory_count"] if bucket["memory_count"] else None,
+            "uptime": bucket.get("uptime"),
+            "interfaces": {
+                name: {"rx_bps": rx / count, "tx_bps": tx / count}
+                for name, (rx, tx, count) in bucket["interfaces"].items()
+            }
+        })
+    return series
@@ -0,0 +1,173 @@
+import hashlib
+import ssl
+import time
+from collections import OrderedDict
+
+import frappe
+from frappe.utils import cint, flt
+
+API_SSL_PORT = 8729
+VERIFY_FULL = "Verify Certificate and Hostname"
+VERIFY_CERTIFICATE = "Verify Certificate"
+VERIFY_NONE = "No Verification"
+# TLS sessions kept per worker process, oldest dropped first
+MAX_SESSIONS = 1024
+METRICS_TTL = 7 * 24 * 60 * 60
+
+# Contexts live for the whole worker process: Python only resumes a session
+# with the context that created it
+_contexts = {}
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """SSL context that resumes earlier TLS sessions with the same router
+
+    routeros_api wraps every new socket with the pool's context, so resuming
+    here makes each later connection to a router an abbreviated handshake
+    (session ID or session ticket) instead of a full one. The handshake time
+    of every connection is recorded per router.
+    """
+
+    router = None
+    fingerprint = None
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        server_hostname = kwargs.get("server_hostname")
+        port = sock.getpeername()[1]
+        key = (server_hostname, port)
+        if kwargs.get("session") is None:
+            kwargs["session"] = self.get_sessions().get(key)
+
+        started = time.perf_counter()
+        ssl_sock = super().wrap_socket(sock, *args, **kwargs)
+        handshake_ms = (time.perf_counter() - started) * 1000
+
+        if self.fingerprint:
+            self.check_fingerprint(ssl_sock)
+
+        record_handshake(self.router, handshake_ms, ssl_sock.session_reused)
+        self.remember_session(key, ssl_sock)
+        return ssl_sock
+
+    def get_sessions(self):
+        if not hasattr(self, "_sessions"):
+            self._sessions = OrderedDict()
+        return self._sessions
+
+    def remember_session(self, key, ssl_sock):
+        """Keep the socket's session for the next connection to the same router
+
+        TLS 1.3 tickets arrive after the handshake, so this is called again
+        when the connection is closed.
+        """
+        session = ssl_sock.session
+        if not session:
+            return
+        sessions = self.get_sessions()
+        sessions[key] = session
+        sessions.move_to_end(key)
+        while len(sessions) > MAX_SESSIONS:
+            sessions.popitem(last=False)
+
+    def check_fingerprint(self, ssl_sock):
+        """Pin the router certificate by its SHA-256 fingerprint"""
+        certificate = ssl_sock.getpeercert(binary_form=True) or b""
+        if hashlib.sha256(certificate).hexdigest() != self.fingerprint:
+            ssl_sock.close()
+            raise ssl.SSLError(f"Certificate fingerprint of router {self.router} does not match")
+
+
+def normalize_fingerprint(fingerprint):
+    return "".join(c for c in (fingerprint or "").lower() if c in "0123456789abcdef")
+
+
+def get_ssl_context(router_doc):
+    """Return the worker's TLS context for a router, built from its settings"""
+    verify_mode = router_doc.get("ssl_verify_mode") or VERIFY_FULL
+    ca_certificate = (router_doc.get("ssl_ca_certificate") or "").strip()
+    fingerprint = normalize_fingerprint(router_doc.get("ssl_certificate_fingerprint"))
+
+    config_key = hashlib.md5(f"{verify_mode}|{ca_certificate}|{fingerprint}".encode()).hexdigest()
+    cached = _contexts.get(router_doc.name)
+    if cached and cached[0] == config_key:
+        return cached[1]
+
+    context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.router = router_doc.name
+    context.fingerprint = fingerprint or None
+
+    if fingerprint or verify_mode == VERIFY_NONE:
+        # A pinned fingerprint replaces CA validation, which self-signed router certificates fail
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    else:
+        context.check_hostname = verify_mode == VERIFY_FULL
+        context.verify_mode = ssl.CERT_REQUIRED
+        if ca_certificate:
+            context.load_verify_locations(cadata=ca_certificate)
+        else:
+            context.load_default_certs()
+
+    _contexts[router_doc.name] = (config_key, context)
+    return context
+
+
+def close_pool(pool):
+    """Disconnect a pool, keeping its TLS session for the next connection"""
+    wrapped = getattr(pool.socket, "socket", None)
+    context = getattr(wrapped, "context", None)
+    if isinstance(context, ResumingSSLContext):
+        try:
+            context.remember_session((wrapped.server_hostname, wrapped.getpeername()[1]), wrapped)
+        except OSError:
+            # The router already closed the connection
+            pass
+    pool.disconnect()
+
+
+METRIC_FIELDS = ("full_handshakes", "full_ms", "resumed_handshakes", "resumed_ms", "last_ms", "last_resumed")
+
+
+def get_metrics_key(router, field):
+    return f"mikrotik_tls_metrics::{router}::{field}"
+
+
+def record_handshake(router, handshake_ms, resumed):
+    """Count full and resumed handshakes and their total time per router
+
+    Plain Redis counters, so every worker adds to the same totals atomically.
+    """
+    if not router:
+        return
+    cache = frappe.cache()
+    kind = "resumed" if resumed else "full"
+    pipe = cache.pipeline()
+    pipe.incr(cache.make_key(get_metrics_key(router, f"{kind}_handshakes")))
+    pipe.incrbyfloat(cache.make_key(get_metrics_key(router, f"{kind}_ms")), handshake_ms)
+    pipe.set(cache.make_key(get_metrics_key(router, "last_ms")), handshake_ms)
+    pipe.set(cache.make_key(get_metrics_key(router, "last_resumed")), int(bool(resumed)))
+    for field in METRIC_FIELDS:
+        pipe.expire(cache.make_key(get_metrics_key(router, field)), METRICS_TTL)
+    pipe.execute()
+
+
+def get_handshake_metrics(router):
+    """Handshake counts, resumption rate and average latency for one router"""
+    cache = frappe.cache()
+    values = dict(zip(
+        METRIC_FIELDS,
+        cache.mget([cache.make_key(get_metrics_key(router, field)) for field in METRIC_FIELDS])
+    ))
+
+    full = cint(values["full_handshakes"])
+    resumed = cint(values["resumed_handshakes"])
+    return {
+        "handshakes": full + resumed,
+        "resumed": resumed,
+        "resumption_rate": resumed / (full + resumed) if full + resumed else 0,
+        "avg_full_ms": flt(values["full_ms"]) / full if full else None,
+        "avg_resumed_ms": flt(values["resumed_ms"]) / resumed if resumed else None,
+        "last_ms": flt(values["last_ms"]) if values["last_ms"] is not None else None,
+        "last_resumed": bool(cint(values["last_resumed"]))
+    }
@@ -17,5 +17,10 @@ def after_install():
 
 def after_migrate():
     """Update app after migration"""
-    pass
-    # Custom fields are handled via fixtures
\ No newline at end of file
+    # Custom fields are handled via fixtures
+    from mikrotik_integration.mikrotik_integration.doctype.mikrotik_router_counter.mikrotik_router_counter import (
+        rebuild_all_counters,
+    )
+
+    # Make sure the dashboard counters exist and match the subscriptions
+    rebuild_all_counters()
\ No newline at end of file
@@ -0,0 +1,20 @@
+import frappe
+from frappe import _
+
+from mikrotik_integration.mikrotik_integration.portal import PORTAL_TTL, get_portal_data
+
+no_cache = 1
+
+
+def get_context(context):
+    if frappe.session.user == "Guest":
+        frappe.throw(_("You need to be logged in to see your usage"), frappe.PermissionError)
+
+    # Rendered from the cached portal data; the page refreshes itself through get_my_usage
+    data = get_portal_data()
+    context.subscriptions = data["subscriptions"]
+    context.etag = data["etag"]
+    context.refresh_seconds = PORTAL_TTL
+    context.title = _("My Internet")
+    context.show_sidebar = True
+    return context
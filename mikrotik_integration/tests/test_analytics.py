@@ -0,0 +1,83 @@
+# Copyright (c) 2026, ronoh and Contributors
+# See license.txt
+
+import numpy as np
+from frappe.tests.utils import FrappeTestCase
+
+from mikrotik_integration.mikrotik_integration.analytics import compute_usage_stats
+
+INTERVAL = 300
+
+
+def make_fleet(previous_mb, current_mb):
+	"""A one-router fleet sampled twice, INTERVAL seconds apart"""
+	count = len(current_mb)
+	return {
+		"names": np.array([f"SUB-{index:05d}" for index in range(count)]),
+		"router_index": np.zeros(count, dtype=np.int32),
+		"previous_mb": np.asarray(previous_mb, dtype=np.float64),
+		"current_mb": np.asarray(current_mb, dtype=np.float64),
+		"seconds": np.full(count, INTERVAL, dtype=np.float64),
+		"routers": ["_Test Router"],
+	}
+
+
+def mb_for_rate(mbps):
+	return np.asarray(mbps, dtype=np.float64) * INTERVAL / 8
+
+
+class TestUsageStats(FrappeTestCase):
+	def test_mostly_idle_fleet_is_not_all_flagged(self):
+		rates = np.concatenate([np.zeros(700), np.random.default_rng(7).uniform(1.5, 20, 300)])
+		previous = np.full(len(rates), 1000.0)
+
+		stats = compute_usage_stats(make_fleet(previous, previous + mb_for_rate(rates)))
+
+		self.assertEqual(int(stats["spike"].sum()), 0)
+		self.assertFalse(stats["reset"].any())
+
+	def test_heavy_user_of_a_mostly_idle_fleet_is_a_spike(self):
+		rates = np.concatenate([np.zeros(700), np.random.default_rng(7).uniform(1.5, 20, 300), [400]])
+		previous = np.full(len(rates), 1000.0)
+
+		stats = compute_usage_stats(make_fleet(previous, previous + mb_for_rate(rates)))
+
+		self.assertEqual(np.flatnonzero(stats["spike"]).tolist(), [len(rates) - 1])
+
+	def test_equal_users_are_not_spikes(self):
+		rates = np.full(50, 5.0)
+		rates[0] = 5.2
+		previous = np.zeros(len(rates))
+
+		stats = compute_usage_stats(make_fleet(previous, mb_for_rate(rates)))
+
+		self.assertFalse(stats["spike"].any())
+
+	def test_lower_total_counts_again_from_zero(self):
+		stats = compute_usage_stats(make_fleet([500.0, 100.0], [20.0, 130.0]))
+
+		self.assertEqual(stats["reset"].tolist(), [True, False])
+		self.assertEqual(stats["delta_mb"].tolist(), [20.0, 30.0])
+		self.assertAlmostEqual(stats["rate_mbps"][0], 20 * 8 / INTERVAL)
+
+	def test_impossible_rate_is_a_jump(self):
+		rates = np.array([5.0, 10.0, 2000.0])
+		previous = np.full(len(rates), 100.0)
+
+		stats = compute_usage_stats(make_fleet(previous, previous + mb_for_rate(rates)))
+
+		self.assertEqual(stats["jump"].tolist(), [False, False, True])
+
+	def test_top_talkers_fastest_first(self):
+		rates = np.array([1.0, 8.0, 3.0, 9.0, 0.0])
+		previous = np.zeros(len(rates))
+
+		stats = compute_usage_stats(make_fleet(previous, mb_for_rate(rates)), top=3)
+
+		self.assertEqual(stats["top"].tolist(), [3, 1, 2])
+
+	def test_empty_fleet(self):
+		stats = compute_usage_stats(make_fleet([], []))
+
+		self.assertEqual(stats["users"], 0)
+		self.assertEqual(stats["percentiles"], {})
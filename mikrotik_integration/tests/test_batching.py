@@ -0,0 +1,140 @@
+# Copyright (c) 2026, ronoh and Contributors
+# See license.txt
+
+from unittest.mock import MagicMock, call, patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from mikrotik_integration.mikrotik_integration.batching import (
+	SAVEPOINT,
+	CommitPolicy,
+	after_row,
+	iter_chunks,
+	iter_rows,
+)
+
+
+class FakeTable:
+	"""Answers `frappe.get_all` from in-memory rows, honouring the `name` range and equality filters"""
+
+	def __init__(self, count):
+		self.rows = [frappe._dict(name=f"SUB-{index:04d}", status="Active") for index in range(count)]
+		self.queries = []
+
+	def get_all(self, doctype, filters=None, fields=None, order_by=None, limit_page_length=None):
+		self.queries.append(dict(filters))
+		matching = []
+		for row in sorted(self.rows, key=lambda row: row.name):
+			after = filters.get("name")
+			if after and not row.name > after[1]:
+				continue
+			if any(row.get(field) != value for field, value in filters.items() if field != "name"):
+				continue
+			matching.append(frappe._dict({field: row.get(field) for field in fields}))
+		return matching[:limit_page_length]
+
+
+class TestIterChunks(FrappeTestCase):
+	def iterate(self, table, **kwargs):
+		with patch("frappe.get_all", side_effect=table.get_all):
+			return [[row.name for row in chunk] for chunk in iter_chunks("Customer Subscription", **kwargs)]
+
+	def test_no_rows_yield_no_chunks(self):
+		table = FakeTable(0)
+		self.assertEqual(self.iterate(table, chunk_size=3), [])
+		self.assertEqual(len(table.queries), 1)
+
+	def test_exact_multiple_ends_on_an_empty_query(self):
+		table = FakeTable(6)
+		chunks = self.iterate(table, chunk_size=3)
+
+		self.assertEqual([len(chunk) for chunk in chunks], [3, 3])
+		self.assertEqual(len(table.queries), 3)
+		self.assertEqual(table.queries[1]["name"], [">", "SUB-0002"])
+		self.assertEqual(table.queries[2]["name"], [">", "SUB-0005"])
+
+	def test_short_chunk_ends_without_another_query(self):
+		table = FakeTable(7)
+		chunks = self.iterate(table, chunk_size=3)
+
+		self.assertEqual([len(chunk) for chunk in chunks], [3, 3, 1])
+		self.assertEqual(len(table.queries), 3)
+
+	def test_rows_changed_by_the_job_are_neither_skipped_nor_repeated(self):
+		table = FakeTable(7)
+		seen = []
+		with patch("frappe.get_all", side_effect=table.get_all):
+			for chunk in iter_chunks("Customer Subscription", {"status": "Active"}, ["status"], chunk_size=3):
+				for row in chunk:
+					seen.append(row.name)
+					# The job suspends each row it handles, so it stops matching the filters
+					next(stored for stored in table.rows if stored.name == row.name).status = "Suspended"
+
+		self.assertEqual(seen, [row.name for row in table.rows])
+
+	def test_name_is_always_fetched(self):
+		table = FakeTable(2)
+		with patch("frappe.get_all", side_effect=table.get_all):
+			rows = list(iter_rows("Customer Subscription", fields=["status"], chunk_size=5))
+
+		self.assertEqual([row.name for row in rows], ["SUB-0000", "SUB-0001"])
+
+
+class TestCommitPolicy(FrappeTestCase):
+	def setUp(self):
+		patcher = patch("frappe.db", MagicMock())
+		self.db = patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def test_failing_row_only_rolls_back_its_savepoint(self):
+		commits = CommitPolicy(every=10)
+
+		with commits.row():
+			pass
+		with self.assertRaises(ValueError), commits.row():
+			raise ValueError("router refused the change")
+
+		self.assertEqual(self.db.savepoint.call_args_list, [call(SAVEPOINT), call(SAVEPOINT)])
+		self.db.rollback.assert_called_once_with(save_point=SAVEPOINT)
+		self.db.commit.assert_not_called()
+		# The failed row is not counted towards the next commit
+		self.assertEqual(commits.pending, 1)
+
+	def test_commits_every_n_rows(self):
+		commits = CommitPolicy(every=3)
+
+		for _index in range(7):
+			with commits.row():
+				pass
+
+		self.assertEqual(self.db.commit.call_count, 2)
+		self.assertEqual(commits.pending, 1)
+
+		commits.commit()
+		self.assertEqual(self.db.commit.call_count, 3)
+		self.assertEqual(commits.pending, 0)
+
+	def test_commit_interval_is_at_least_one(self):
+		self.assertEqual(CommitPolicy(every=-5).every, 1)
+
+	def test_after_row_waits_for_the_row(self):
+		commits = CommitPolicy(every=10)
+		sent = []
+
+		with commits.row():
+			after_row(lambda: sent.append("first"))
+			self.assertEqual(sent, [])
+		self.assertEqual(sent, ["first"])
+
+		with self.assertRaises(ValueError), commits.row():
+			after_row(lambda: sent.append("failed"))
+			raise ValueError("router refused the change")
+		self.assertEqual(sent, ["first"])
+
+	def test_after_row_outside_a_row_runs_at_once(self):
+		sent = []
+
+		after_row(lambda: sent.append("now"))
+
+		self.assertEqual(sent, ["now"])
@@ -0,0 +1,141 @@
+# Copyright (c) 2026, ronoh and Contributors
+# See license.txt
+
+from unittest.mock import MagicMock, patch
+
+import routeros_api
+from frappe.tests.utils import FrappeTestCase
+
+from mikrotik_integration.mikrotik_integration import drivers
+from mikrotik_integration.mikrotik_integration.drivers import HotspotDriver, PPPDriver, get_driver, pipeline
+
+
+def router_error(message):
+	return routeros_api.exceptions.RouterOsApiCommunicationError(message, message.encode())
+
+
+class Promise:
+	def __init__(self, result):
+		self.result = result
+
+	def get(self):
+		if isinstance(self.result, Exception):
+			raise self.result
+		return self.result
+
+
+class FakeResource:
+	"""Answers each async call from `reply(command, arguments, queries)` and records when it was sent"""
+
+	def __init__(self, reply):
+		self.reply = reply
+		self.sent = []
+
+	def call_async(self, command, arguments, queries):
+		self.sent.append((command, arguments, queries))
+		return Promise(self.reply(command, arguments, queries))
+
+
+def make_driver(driver_class, users=None, sessions=None):
+	api = MagicMock()
+	resources = {}
+
+	def get_resource(path):
+		if path not in resources:
+			rows = sessions if path == driver_class.session_path else users
+			resource = FakeResource(lambda command, arguments, queries: [
+				row for row in rows or [] if all(row.get(k) == v for k, v in queries.items())
+			] if command == "print" else [])
+			resource.get = MagicMock(side_effect=lambda **query: [
+				row for row in rows or [] if all(row.get(k) == v for k, v in query.items())
+			])
+			resources[path] = resource
+		return resources[path]
+
+	api.get_resource.side_effect = get_resource
+	return driver_class(api), resources
+
+
+class TestPipeline(FrappeTestCase):
+	def test_replies_and_errors_keep_their_order(self):
+		error = router_error("failure: already have user with this name")
+		resource = FakeResource(lambda command, arguments, queries: error if arguments["name"] == "b" else "ok")
+
+		results = pipeline(resource, "add", [({"name": name}, {}) for name in "abc"])
+
+		self.assertEqual(results, ["ok", error, "ok"])
+
+	def test_commands_are_sent_in_windows(self):
+		"""No more than PIPELINE_SIZE replies are outstanding at a time"""
+		outstanding = []
+		peak = []
+
+		class CountingPromise(Promise):
+			def get(self):
+				outstanding.pop()
+				return super().get()
+
+		class CountingResource(FakeResource):
+			def call_async(self, command, arguments, queries):
+				outstanding.append(1)
+				peak.append(len(outstanding))
+				return CountingPromise("ok")
+
+		with patch.object(drivers, "PIPELINE_SIZE", 3):
+			results = pipeline(CountingResource(None), "set", [({}, {})] * 7)
+
+		self.assertEqual(len(results), 7)
+		self.assertEqual(max(peak), 3)
+
+
+class TestServiceDriver(FrappeTestCase):
+	def test_drivers_are_shared_per_menu(self):
+		api = MagicMock(spec=["get_resource"])
+		self.assertIs(get_driver(api, "pppoe"), get_driver(api, "l2tp"))
+		self.assertIsInstance(get_driver(api, "hotspot"), HotspotDriver)
+
+	def test_few_names_use_filtered_prints(self):
+		driver, resources = make_driver(HotspotDriver, users=[{"name": "a"}, {"name": "b"}, {"name": "c"}])
+
+		found = driver.list(["a", "c", "missing"])
+
+		self.assertEqual(set(found), {"a", "c"})
+		users = resources[HotspotDriver.user_path]
+		self.assertEqual(len(users.sent), 3)
+		users.get.assert_not_called()
+
+	def test_full_print_is_kept_until_a_change(self):
+		driver, resources = make_driver(PPPDriver, users=[{"name": "a"}, {"name": "b"}])
+		users = driver.users()
+
+		self.assertEqual(set(driver.list()), {"a", "b"})
+		self.assertEqual(driver.list(["b"]), {"b": {"name": "b"}})
+		self.assertEqual(users.get.call_count, 1)
+
+		driver.set_many([("*1", {"disabled": "yes"})])
+		driver.list()
+		self.assertEqual(users.get.call_count, 2)
+
+	def test_kick_ignores_sessions_that_already_ended(self):
+		driver, _resources = make_driver(
+			HotspotDriver,
+			sessions=[{"id": "*1", "user": "a"}, {"id": "*2", "user": "b"}]
+		)
+		sessions = driver.sessions()
+		sessions.reply = lambda command, arguments, queries: (
+			router_error("no such item") if arguments["id"] == "*2" else []
+		)
+
+		self.assertEqual(driver.kick(["a", "b"]), 1)
+
+	def test_kick_raises_other_errors(self):
+		driver, _resources = make_driver(HotspotDriver, sessions=[{"id": "*1", "user": "a"}])
+		driver.sessions().reply = lambda command, arguments, queries: router_error("not enough permissions")
+
+		self.assertRaises(routeros_api.exceptions.RouterOsApiCommunicationError, driver.kick, ["a", "b"])
+
+	def test_kick_without_names_sends_nothing(self):
+		driver, _resources = make_driver(HotspotDriver, sessions=[{"id": "*1", "user": "a"}])
+
+		self.assertEqual(driver.kick([None, ""]), 0)
+		self.assertEqual(driver.sessions().sent, [])
@@ -0,0 +1,148 @@
+# Copyright (c) 2026, ronoh and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from mikrotik_integration.mikrotik_integration.pcq import (
+	SHARED_PCQ,
+	compile_connection_type,
+	ensure_queue_objects,
+	get_objects_key,
+)
+
+
+class FakeConnectionType(frappe._dict):
+	def get_bandwidth_limits(self):
+		return self.limits
+
+
+def make_connection_type(limits=None, **values):
+	return FakeConnectionType(dict({
+		"name": "_Test PCQ Home 10M",
+		"profile_name": "home-10m",
+		"service_name": "hotspot",
+		"bandwidth_mode": SHARED_PCQ,
+		"limits": {"speed_limit_rx": "10M", "speed_limit_tx": "2M"} if limits is None else limits
+	}, **values))
+
+
+class FakeMenu:
+	def __init__(self, router, path):
+		self.router = router
+		self.path = path
+		self.rows = []
+
+	def get(self, **query):
+		return [row for row in self.rows if all(row.get(key) == value for key, value in query.items())]
+
+	def add(self, **values):
+		self.router.commands.append(("add", self.path))
+		self.rows.append(dict(values, id=f"*{len(self.rows) + 1}"))
+
+	def set(self, id, **values):
+		self.router.commands.append(("set", self.path, tuple(sorted(values))))
+		next(row for row in self.rows if row["id"] == id).update(values)
+
+
+class FakeRouter:
+	"""An API connection whose menus keep the objects added to them"""
+
+	def __init__(self):
+		self.menus = {}
+		self.commands = []
+
+	def get_resource(self, path):
+		return self.menus.setdefault(path, FakeMenu(self, path))
+
+
+class TestCompileConnectionType(FrappeTestCase):
+	def test_queue_types_per_direction(self):
+		spec = compile_connection_type(make_connection_type())
+
+		self.assertEqual(spec["queue_types"], [
+			{"name": "mi-test-pcq-home-10m-down", "kind": "pcq", "pcq-rate": "10M", "pcq-classifier": "dst-address"},
+			{"name": "mi-test-pcq-home-10m-up", "kind": "pcq", "pcq-rate": "2M", "pcq-classifier": "src-address"},
+		])
+
+	def test_burst_is_added_when_set(self):
+		spec = compile_connection_type(make_connection_type({
+			"speed_limit_rx": "10M", "burst_limit_rx": "20M", "speed_limit_tx": "2M"
+		}))
+
+		down, up = spec["queue_types"]
+		self.assertEqual(
+			(down["pcq-burst-rate"], down["pcq-burst-threshold"], down["pcq-burst-time"]), ("20M", "10M", "10s")
+		)
+		self.assertNotIn("pcq-burst-rate", up)
+
+	def test_unlimited_direction(self):
+		spec = compile_connection_type(make_connection_type({}))
+
+		self.assertEqual([queue_type["pcq-rate"] for queue_type in spec["queue_types"]], ["0", "0"])
+
+	def test_mangle_rules_mark_the_address_list(self):
+		spec = compile_connection_type(make_connection_type())
+		down, up = spec["mangle"]
+
+		self.assertEqual(down["comment"], "mikrotik_integration:mi-test-pcq-home-10m:down")
+		self.assertEqual(down["dst-address-list"], "mi-test-pcq-home-10m")
+		self.assertEqual(down["new-packet-mark"], "mi-test-pcq-home-10m-down")
+		self.assertEqual(up["src-address-list"], "mi-test-pcq-home-10m")
+		self.assertEqual(up["new-packet-mark"], "mi-test-pcq-home-10m-up")
+		self.assertEqual(
+			[(queue["packet-mark"], queue["queue"]) for queue in spec["queue_tree"]],
+			[("mi-test-pcq-home-10m-down",) * 2, ("mi-test-pcq-home-10m-up",) * 2]
+		)
+
+	def test_profile_puts_users_on_the_list_without_own_queues(self):
+		spec = compile_connection_type(make_connection_type())
+
+		self.assertEqual(spec["profile"], {"name": "home-10m", "address-list": "mi-test-pcq-home-10m", "rate-limit": ""})
+
+
+class TestEnsureQueueObjects(FrappeTestCase):
+	def setUp(self):
+		self.router_doc = frappe._dict(name=f"_Test PCQ Router {frappe.generate_hash(length=6)}", router_generation=1)
+		self.api = FakeRouter()
+
+	def tearDown(self):
+		frappe.cache().delete_value(get_objects_key(self.router_doc.name))
+
+	def test_objects_are_created_once(self):
+		conn_type = make_connection_type()
+
+		self.assertTrue(ensure_queue_objects(self.api, self.router_doc, conn_type))
+		self.assertEqual(len(self.api.commands), 7)
+		self.assertNotIn("rate-limit", self.api.menus["/ip/hotspot/user/profile"].rows[0])
+
+		self.assertFalse(ensure_queue_objects(self.api, self.router_doc, conn_type))
+		self.assertEqual(len(self.api.commands), 7)
+
+	def test_changed_limits_only_set_what_differs(self):
+		ensure_queue_objects(self.api, self.router_doc, make_connection_type())
+		self.api.commands.clear()
+
+		changed = make_connection_type({"speed_limit_rx": "20M", "speed_limit_tx": "2M"})
+		self.assertTrue(ensure_queue_objects(self.api, self.router_doc, changed))
+
+		self.assertEqual(self.api.commands, [("set", "/queue/type", ("pcq-rate",))])
+
+	def test_reset_router_is_updated_again(self):
+		conn_type = make_connection_type()
+		ensure_queue_objects(self.api, self.router_doc, conn_type)
+
+		self.router_doc.router_generation = 2
+		self.assertTrue(ensure_queue_objects(self.api, self.router_doc, conn_type))
+
+	def test_force_skips_the_digest(self):
+		conn_type = make_connection_type()
+		ensure_queue_objects(self.api, self.router_doc, conn_type)
+
+		self.assertTrue(ensure_queue_objects(self.api, self.router_doc, conn_type, force=True))
+
+	def test_per_user_types_are_left_alone(self):
+		conn_type = make_connection_type(bandwidth_mode="Per User Rate Limit")
+
+		self.assertFalse(ensure_queue_objects(self.api, self.router_doc, conn_type))
+		self.assertEqual(self.api.commands, [])
@@ -0,0 +1,149 @@
+# Copyright (c) 2026, ronoh and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from mikrotik_integration.mikrotik_integration import placement
+from mikrotik_integration.mikrotik_integration.placement import (
+	PLACED_KEY,
+	get_rebalancing_moves,
+	pick_router,
+	score_entry,
+)
+
+
+def make_entry(router, subscriptions=0, sessions=0, capacity=100, cpu=None, memory=None):
+	return score_entry({
+		"router": router,
+		"capacity": capacity,
+		"reference": capacity or 100,
+		"subscriptions": subscriptions,
+		"sessions": sessions,
+		"cpu": cpu,
+		"memory": memory
+	})
+
+
+class TestScoreEntry(FrappeTestCase):
+	def test_unknown_load_is_left_out(self):
+		entry = make_entry("a", subscriptions=50)
+
+		self.assertEqual(entry["occupancy"], 0.5)
+		self.assertEqual(entry["score"], 0.5)
+		self.assertFalse(entry["full"])
+
+	def test_cpu_and_memory_are_weighed_in(self):
+		entry = make_entry("a", subscriptions=50, cpu=1.0, memory=0.0)
+
+		self.assertAlmostEqual(entry["score"], 0.6 * 0.5 + 0.25 * 1.0)
+
+	def test_sessions_count_when_higher(self):
+		entry = make_entry("a", subscriptions=10, sessions=80)
+
+		self.assertEqual(entry["occupancy"], 0.8)
+		# Only subscriptions fill a router; guests do not
+		self.assertFalse(entry["full"])
+
+	def test_full_at_capacity(self):
+		self.assertTrue(make_entry("a", subscriptions=100)["full"])
+		self.assertFalse(make_entry("a", subscriptions=1000, capacity=0)["full"])
+
+
+class TestPickRouter(FrappeTestCase):
+	def setUp(self):
+		suffix = frappe.generate_hash(length=6)
+		self.routers = [f"_Test Placement A {suffix}", f"_Test Placement B {suffix}"]
+
+	def tearDown(self):
+		frappe.cache().hdel(PLACED_KEY, self.routers)
+
+	def pick(self, scores, count):
+		with patch.object(placement, "get_router_scores", return_value=scores):
+			return [pick_router() for _i in range(count)]
+
+	def test_sign_ups_are_spread_out(self):
+		busy, idle = self.routers
+		scores = [make_entry(idle, subscriptions=10), make_entry(busy, subscriptions=12)]
+
+		picked = self.pick(scores, 6)
+
+		self.assertEqual(picked.count(idle), 4)
+		self.assertEqual(picked.count(busy), 2)
+		# The cached scores themselves are left alone
+		self.assertEqual(scores[0]["subscriptions"], 10)
+
+	def test_placed_counts_are_shared(self):
+		"""Every worker reads and increments the same counters"""
+		first, second = self.routers
+		scores = [make_entry(first, subscriptions=10), make_entry(second, subscriptions=10)]
+
+		self.assertEqual(self.pick(scores, 1), [first])
+		self.assertEqual(self.pick([dict(entry) for entry in scores], 1), [second])
+
+	def test_full_routers_are_skipped(self):
+		full, free = self.routers
+		scores = [make_entry(full, subscriptions=2, capacity=3), make_entry(free, subscriptions=80)]
+
+		self.assertEqual(self.pick(scores, 2), [full, free])
+
+	def test_no_room_anywhere(self):
+		scores = [make_entry(router, subscriptions=100) for router in self.routers]
+
+		self.assertRaises(frappe.ValidationError, self.pick, scores, 1)
+
+
+class TestRebalancingMoves(FrappeTestCase):
+	def plan(self, entries, candidates, **kwargs):
+		def get_all(doctype, filters=None, **_kwargs):
+			return [frappe._dict(row) for row in candidates.get(filters["mikrotik_settings"], [])]
+
+		with patch.object(placement, "compute_router_scores", return_value=entries), \
+				patch("frappe.get_all", side_effect=get_all):
+			return get_rebalancing_moves(**kwargs)
+
+	def make_candidates(self, router, count):
+		return [
+			{
+				"name": f"SUB-{router}-{index}",
+				"customer": None,
+				"customer_name": None,
+				"username_mikrotik": f"{router}{index}"
+			}
+			for index in range(count)
+		]
+
+	def test_moves_until_within_tolerance(self):
+		entries = [make_entry("busy", subscriptions=60), make_entry("idle", subscriptions=20)]
+
+		result = self.plan(entries, {"busy": self.make_candidates("busy", 30)}, max_moves=50, tolerance=0.15)
+
+		self.assertEqual({(move["from_router"], move["to_router"]) for move in result["moves"]}, {("busy", "idle")})
+		self.assertEqual(len(result["moves"]), 13)
+		scores = {entry["router"]: entry["score"] for entry in result["scores"]}
+		self.assertLessEqual(scores["busy"] - scores["idle"], 0.15)
+
+	def test_balanced_routers_need_no_moves(self):
+		entries = [make_entry("a", subscriptions=40), make_entry("b", subscriptions=45)]
+
+		self.assertEqual(self.plan(entries, {"a": self.make_candidates("a", 5)})["moves"], [])
+
+	def test_full_routers_take_no_users(self):
+		entries = [make_entry("busy", subscriptions=90), make_entry("full", subscriptions=10, capacity=10)]
+
+		self.assertEqual(self.plan(entries, {"busy": self.make_candidates("busy", 5)})["moves"], [])
+
+	def test_router_without_subscriptions_to_move_is_dropped(self):
+		"""Unmanaged sessions cannot be moved, so the next busiest router is balanced instead"""
+		entries = [
+			make_entry("guests", sessions=90),
+			make_entry("busy", subscriptions=60),
+			make_entry("idle", subscriptions=20)
+		]
+
+		moves = self.plan(entries, {"busy": self.make_candidates("busy", 30)}, max_moves=5)["moves"]
+
+		self.assertEqual(len(moves), 5)
+		self.assertEqual({move["from_router"] for move in moves}, {"busy"})
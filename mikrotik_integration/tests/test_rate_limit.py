@@ -0,0 +1,72 @@
+# Copyright (c) 2026, ronoh and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from mikrotik_integration.mikrotik_integration.rate_limit import (
+	PRIORITY_BACKGROUND,
+	PRIORITY_INTERACTIVE,
+	TOKEN_BUCKET_SCRIPT,
+	TokenBucket,
+	get_bucket_key,
+)
+
+
+class TestTokenBucket(FrappeTestCase):
+	def setUp(self):
+		self.router = f"_Test Bucket {frappe.generate_hash(length=6)}"
+
+	def tearDown(self):
+		frappe.cache().delete_value(get_bucket_key(self.router))
+
+	def test_reserve_is_kept_for_interactive_commands(self):
+		bucket = TokenBucket(self.router, rate=0.001, burst=4, reserve=50)
+
+		self.assertEqual(bucket.try_acquire(PRIORITY_BACKGROUND), 0)
+		self.assertEqual(bucket.try_acquire(PRIORITY_BACKGROUND), 0)
+		self.assertGreater(bucket.try_acquire(PRIORITY_BACKGROUND), 0)
+		self.assertEqual(bucket.try_acquire(PRIORITY_INTERACTIVE), 0)
+
+	def test_background_gets_a_token_with_a_burst_of_one(self):
+		"""A reserve larger than the burst allows must not starve the background lane"""
+		bucket = TokenBucket(self.router, rate=0.5, burst=1, reserve=25)
+
+		self.assertEqual(bucket.try_acquire(PRIORITY_BACKGROUND), 0)
+
+	def test_script_clamps_the_floor(self):
+		"""The script itself caps the floor below the burst, whatever the caller passes"""
+		cache = frappe.cache()
+		wait = cache.eval(TOKEN_BUCKET_SCRIPT, 1, cache.make_key(get_bucket_key(self.router)), 1, 40, 39.6, 60)
+
+		self.assertEqual(wait, 0)
+
+	def test_empty_bucket_reports_the_wait(self):
+		bucket = TokenBucket(self.router, rate=2, burst=1)
+
+		self.assertEqual(bucket.try_acquire(), 0)
+		wait = bucket.try_acquire()
+		self.assertGreater(wait, 0)
+		self.assertLessEqual(wait, 500)
+
+
+class TestCommandBurstValidation(FrappeTestCase):
+	def make_router(self, **values):
+		return frappe.get_doc(dict({
+			"doctype": "MikroTik Settings",
+			"router_name": "_Test Burst Router",
+			"api_host": "127.0.0.1",
+			"api_port": 8728,
+			"username": "admin"
+		}, **values))
+
+	def test_reserve_leaving_no_background_token_is_rejected(self):
+		for values in (
+			{"command_rate_limit": 1, "interactive_reserve": 25},
+			{"command_rate_limit": 10, "command_burst": 1, "interactive_reserve": 25},
+			{"command_rate_limit": 10, "command_burst": 40, "interactive_reserve": 99},
+		):
+			self.assertRaises(frappe.ValidationError, self.make_router(**values).validate)
+
+	def test_reserve_leaving_a_background_token_is_accepted(self):
+		self.make_router(command_rate_limit=10, command_burst=40, interactive_reserve=25).validate()
@@ -0,0 +1,82 @@
+# Copyright (c) 2026, ronoh and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from mikrotik_integration.mikrotik_integration.scheduling import (
+	ADAPTIVE_INTERVALS,
+	get_due_routers,
+	get_schedule_key,
+	update_router_schedule,
+)
+
+JOB = "sync_router_status"
+BASE, MAXIMUM = ADAPTIVE_INTERVALS[JOB]
+QUIET = {"scanned": 100, "changed": 0, "errors": 0}
+BUSY = {"scanned": 100, "changed": 5, "errors": 0}
+
+
+class TestRouterSchedule(FrappeTestCase):
+	def setUp(self):
+		suffix = frappe.generate_hash(length=6)
+		self.router = f"_Test Schedule Router {suffix}"
+		self.other = f"_Test Schedule Other {suffix}"
+
+	def tearDown(self):
+		frappe.cache().hdel(get_schedule_key(JOB), [self.router, self.other])
+
+	def get_state(self):
+		return frappe.cache().hget(get_schedule_key(JOB), self.router)
+
+	def poll(self, result, times=1, duration=1):
+		for _index in range(times):
+			update_router_schedule(JOB, self.router, duration, result)
+		return self.get_state()["interval"]
+
+	def test_quiet_router_backs_off_up_to_the_maximum(self):
+		self.assertEqual(self.poll(QUIET), BASE * 1.5)
+		self.assertEqual(self.poll(QUIET), BASE * 1.5 * 1.5)
+		self.assertEqual(self.poll(QUIET, times=20), MAXIMUM)
+
+	def test_changes_reset_the_interval(self):
+		self.poll(QUIET, times=5)
+
+		self.assertEqual(self.poll(BUSY), BASE)
+
+	def test_errors_reset_the_interval(self):
+		self.poll(QUIET, times=5)
+
+		self.assertEqual(self.poll({"scanned": 100, "changed": 0, "errors": 1}), BASE)
+
+	def test_slow_router_is_not_polled_faster_than_it_runs(self):
+		self.assertEqual(self.poll(BUSY, duration=600), 1200)
+		# The average run time moves towards faster runs gradually
+		self.assertAlmostEqual(self.poll(BUSY, duration=100), (0.7 * 600 + 0.3 * 100) * 2)
+
+	def test_skipped_run_keeps_the_schedule(self):
+		update_router_schedule(JOB, self.router, 1, {"skipped": 1})
+
+		self.assertIsNone(self.get_state())
+
+	def test_jobs_without_adaptive_polling_visit_every_router(self):
+		update_router_schedule("process_expired_subscriptions", self.router, 1, QUIET)
+
+		self.assertEqual(
+			get_due_routers("process_expired_subscriptions", [self.router, self.other]), ([self.router, self.other], 0)
+		)
+
+	def test_due_routers(self):
+		self.poll(QUIET)
+		next_run = self.get_state()["next_run"]
+
+		self.assertEqual(get_due_routers(JOB, [self.router, self.other]), ([self.other], 0))
+
+		with patch("time.time", return_value=next_run):
+			self.assertEqual(get_due_routers(JOB, [self.router, self.other]), ([self.router, self.other], 0))
+
+		# Later than a whole interval past its turn: workers are not keeping up
+		with patch("time.time", return_value=next_run + BASE * 1.5 + 1):
+			self.assertEqual(get_due_routers(JOB, [self.router]), ([self.router], 1))
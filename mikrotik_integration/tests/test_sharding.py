@@ -0,0 +1,120 @@
+# Copyright (c) 2026, ronoh and Contributors
+# See license.txt
+
+from unittest.mock import MagicMock, patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from mikrotik_integration.mikrotik_integration import sharding
+from mikrotik_integration.mikrotik_integration.sharding import (
+	HashRing,
+	fan_out,
+	get_run_lease_key,
+	record_router_result,
+)
+
+ROUTERS = [f"router-{index}" for index in range(500)]
+
+
+class TestHashRing(FrappeTestCase):
+	def assign(self, queues):
+		ring = HashRing(queues)
+		return {router: ring.get_node(router) for router in ROUTERS}
+
+	def test_same_router_same_queue(self):
+		self.assertEqual(self.assign(["q1", "q2", "q3"]), self.assign(["q3", "q1", "q2"]))
+
+	def test_routers_spread_over_every_queue(self):
+		counts = {}
+		for queue in self.assign(["q1", "q2", "q3", "q4"]).values():
+			counts[queue] = counts.get(queue, 0) + 1
+
+		self.assertEqual(set(counts), {"q1", "q2", "q3", "q4"})
+		self.assertGreater(min(counts.values()), len(ROUTERS) / 4 / 2)
+
+	def test_added_queue_only_takes_routers(self):
+		before = self.assign(["q1", "q2", "q3"])
+		after = self.assign(["q1", "q2", "q3", "q4"])
+
+		moved = [router for router in ROUTERS if before[router] != after[router]]
+		self.assertTrue(moved)
+		self.assertEqual({after[router] for router in moved}, {"q4"})
+		self.assertLess(len(moved), len(ROUTERS) / 2)
+
+	def test_removed_queue_only_gives_away_its_routers(self):
+		before = self.assign(["q1", "q2", "q3", "q4"])
+		after = self.assign(["q1", "q2", "q3"])
+
+		moved = [router for router in ROUTERS if before[router] != after[router]]
+		self.assertEqual(moved, [router for router in ROUTERS if before[router] == "q4"])
+
+	def test_empty_ring(self):
+		self.assertIsNone(HashRing([]).get_node("router-1"))
+
+
+class TestFanOutFanIn(FrappeTestCase):
+	def setUp(self):
+		# Not an adaptive job, so every router is due on every run
+		self.job_name = f"_test_fan_out_{frappe.generate_hash(length=6)}"
+		self.routers = ["router-a", "router-b", "router-c"]
+		self.fan_ins = []
+		real_fan_in = sharding.fan_in
+
+		def fan_in(job_name, run_id):
+			self.fan_ins.append(run_id)
+			return real_fan_in(job_name, run_id)
+
+		for patcher in (
+			patch.object(sharding, "fan_in", side_effect=fan_in),
+			patch("frappe.publish_realtime"),
+		):
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+	def tearDown(self):
+		cache = frappe.cache()
+		cache.delete(cache.make_key(get_run_lease_key(self.job_name)))
+		cache.delete_value(f"mikrotik_sync_last_result::{self.job_name}")
+
+	def fan_out(self, queued=None):
+		"""Fan out the test job; routers not in `queued` already have a job waiting"""
+		queued = self.routers if queued is None else queued
+		with patch("frappe.enqueue", side_effect=lambda *args, **kwargs: MagicMock() if kwargs["router"] in queued else None):
+			return fan_out(self.job_name, "unused.method", self.routers)
+
+	def test_last_router_fans_in_once(self):
+		run_id = self.fan_out()
+
+		record_router_result(self.job_name, run_id, "router-a", {"scanned": 2})
+		record_router_result(self.job_name, run_id, "router-b", {"scanned": 3, "errors": 1})
+		self.assertEqual(self.fan_ins, [])
+
+		record_router_result(self.job_name, run_id, "router-c", {"scanned": 5})
+		self.assertEqual(self.fan_ins, [run_id])
+
+		summary = frappe.cache().get_value(f"mikrotik_sync_last_result::{self.job_name}")
+		self.assertEqual(summary["routers"], 3)
+		self.assertEqual(summary["totals"], {"scanned": 10, "errors": 1})
+
+	def test_already_queued_routers_are_not_waited_for(self):
+		run_id = self.fan_out(queued=["router-a", "router-b"])
+
+		record_router_result(self.job_name, run_id, "router-a", {"scanned": 1})
+		record_router_result(self.job_name, run_id, "router-b", {"scanned": 1})
+
+		self.assertEqual(self.fan_ins, [run_id])
+
+	def test_run_with_every_router_queued_fans_in_at_once(self):
+		run_id = self.fan_out(queued=[])
+
+		self.assertEqual(self.fan_ins, [run_id])
+
+	def test_next_run_waits_for_the_fan_in(self):
+		run_id = self.fan_out()
+		self.assertIsNone(self.fan_out())
+
+		for router in self.routers:
+			record_router_result(self.job_name, run_id, router, {})
+
+		self.assertIsNotNone(self.fan_out())
@@ -0,0 +1,119 @@
+# Copyright (c) 2026, ronoh and Contributors
+# See license.txt
+
+from unittest.mock import MagicMock
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from mikrotik_integration.mikrotik_integration.api import get_router_health
+from mikrotik_integration.mikrotik_integration.telemetry import (
+	COUNTERS_KEY,
+	LATEST_KEY,
+	TIERS,
+	add_to_slot,
+	collect_router_telemetry,
+	get_tier_key,
+	get_interface_rates,
+	parse_uptime,
+)
+
+
+def make_api(rows):
+	api = MagicMock()
+	api.get_resource.return_value.call.return_value = rows
+	return api
+
+
+def make_sample(at, cpu, interfaces=None):
+	return {"at": at, "cpu": cpu, "memory": 50.0, "uptime": 60, "interfaces": interfaces or {}}
+
+
+class TestTelemetry(FrappeTestCase):
+	def setUp(self):
+		self.router = f"_Test Telemetry {frappe.generate_hash(length=6)}"
+		self.key = f"mikrotik_telemetry_test::{self.router}"
+
+	def tearDown(self):
+		frappe.cache().hdel(COUNTERS_KEY, [self.router])
+		frappe.cache().hdel(LATEST_KEY, [self.router])
+		frappe.cache().delete_value([self.key] + [get_tier_key(self.router, tier) for tier, _res, _slots in TIERS])
+
+	def test_parse_uptime(self):
+		self.assertEqual(parse_uptime("2w3d4h5m6s"), 2 * 604800 + 3 * 86400 + 4 * 3600 + 5 * 60 + 6)
+		self.assertEqual(parse_uptime("45s"), 45)
+		self.assertEqual(parse_uptime(None), 0)
+
+	def test_interface_rates_from_counters(self):
+		"""Rates need a previous sample; dynamic interfaces are left out"""
+		first = make_api([
+			{"name": "ether1", "rx-byte": "1000", "tx-byte": "2000"},
+			{"name": "<pppoe-a>", "dynamic": "true", "rx-byte": "0", "tx-byte": "0"},
+		])
+		self.assertEqual(get_interface_rates(first, self.router, 100.0), {})
+
+		second = make_api([
+			{"name": "ether1", "rx-byte": "2000", "tx-byte": "4000"},
+			{"name": "<pppoe-a>", "dynamic": "true", "rx-byte": "500", "tx-byte": "500"},
+		])
+		self.assertEqual(get_interface_rates(second, self.router, 110.0), {"ether1": (800.0, 1600.0)})
+
+	def test_counter_wrap_gives_no_rate(self):
+		"""A counter that went down (reboot or wrap) is skipped for that run"""
+		get_interface_rates(make_api([
+			{"name": "ether1", "rx-byte": "5000", "tx-byte": "5000"},
+			{"name": "ether2", "rx-byte": "100", "tx-byte": "100"},
+		]), self.router, 100.0)
+
+		rates = get_interface_rates(make_api([
+			{"name": "ether1", "rx-byte": "10", "tx-byte": "6000"},
+			{"name": "ether2", "rx-byte": "200", "tx-byte": "200"},
+		]), self.router, 110.0)
+
+		self.assertEqual(rates, {"ether2": (80.0, 80.0)})
+
+	def test_samples_of_one_period_share_a_slot(self):
+		cache = frappe.cache()
+		add_to_slot(cache, self.key, 300, 4, make_sample(600, 10, {"ether1": (100.0, 50.0)}))
+		add_to_slot(cache, self.key, 300, 4, make_sample(650, 30, {"ether1": (300.0, 150.0)}))
+
+		bucket = cache.hget(self.key, 2)
+		self.assertEqual(bucket["period"], 2)
+		self.assertEqual(bucket["count"], 2)
+		self.assertEqual(bucket["cpu"], 40)
+		self.assertEqual(bucket["cpu_max"], 30)
+		self.assertEqual(bucket["interfaces"]["ether1"], (400.0, 200.0, 2))
+
+	def test_slot_from_an_earlier_lap_is_replaced(self):
+		cache = frappe.cache()
+		add_to_slot(cache, self.key, 300, 4, make_sample(600, 10))
+		# Four periods later the buffer has wrapped onto the same slot
+		add_to_slot(cache, self.key, 300, 4, make_sample(600 + 4 * 300, 70))
+
+		bucket = cache.hget(self.key, 2)
+		self.assertEqual(bucket["period"], 6)
+		self.assertEqual(bucket["count"], 1)
+		self.assertEqual(bucket["cpu"], 70)
+
+	def test_collected_samples_reach_the_router_health(self):
+		"""Samples are read back by router name, although Redis returns the hash keys as bytes"""
+		frappe.get_doc({
+			"doctype": "MikroTik Settings",
+			"router_name": self.router,
+			"api_host": "127.0.0.1",
+			"api_port": 8728,
+			"username": "admin"
+		}).insert()
+		api = make_api([{"name": "ether1", "rx-byte": "1000", "tx-byte": "2000"}])
+		api.system_resource = [{"cpu-load": "12", "total-memory": "1000", "free-memory": "250", "uptime": "1h"}]
+
+		collect_router_telemetry(api, self.router)
+		health = get_router_health(self.router)
+
+		self.assertEqual(len(health["routers"]), 1)
+		row = health["routers"][0]
+		self.assertEqual(row["router"], self.router)
+		self.assertEqual(row["cpu"], 12)
+		self.assertEqual(row["memory"], 75)
+		self.assertEqual(row["uptime"], 3600)
+		self.assertEqual(health["chart"]["cpu"], [12])
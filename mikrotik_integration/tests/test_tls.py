@@ -0,0 +1,124 @@
+# Copyright (c) 2026, ronoh and Contributors
+# See license.txt
+
+import hashlib
+import ssl
+from unittest.mock import MagicMock, patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from mikrotik_integration.mikrotik_integration import tls
+from mikrotik_integration.mikrotik_integration.tls import (
+	VERIFY_CERTIFICATE,
+	VERIFY_FULL,
+	ResumingSSLContext,
+	get_ssl_context,
+	normalize_fingerprint,
+)
+
+CERTIFICATE = b"router certificate"
+FINGERPRINT = hashlib.sha256(CERTIFICATE).hexdigest()
+
+
+def make_router(**values):
+	return frappe._dict(dict({"name": "_Test TLS Router"}, **values))
+
+
+def make_ssl_sock(certificate=CERTIFICATE, reused=False):
+	ssl_sock = MagicMock()
+	ssl_sock.getpeercert.return_value = certificate
+	ssl_sock.session_reused = reused
+	return ssl_sock
+
+
+class TestNormalizeFingerprint(FrappeTestCase):
+	def test_separators_and_case_are_dropped(self):
+		self.assertEqual(normalize_fingerprint("AB:CD:ef 01"), "abcdef01")
+		self.assertEqual(normalize_fingerprint(FINGERPRINT.upper()), FINGERPRINT)
+
+	def test_empty_fingerprint(self):
+		self.assertEqual(normalize_fingerprint(None), "")
+		self.assertEqual(normalize_fingerprint(""), "")
+
+
+class TestGetSSLContext(FrappeTestCase):
+	def tearDown(self):
+		tls._contexts.pop("_Test TLS Router", None)
+
+	def test_pinned_fingerprint_replaces_ca_validation(self):
+		context = get_ssl_context(make_router(ssl_certificate_fingerprint=":".join(
+			FINGERPRINT[i:i + 2].upper() for i in range(0, len(FINGERPRINT), 2)
+		)))
+
+		self.assertEqual(context.fingerprint, FINGERPRINT)
+		self.assertEqual(context.verify_mode, ssl.CERT_NONE)
+		self.assertFalse(context.check_hostname)
+
+	def test_verify_modes(self):
+		context = get_ssl_context(make_router(ssl_verify_mode=VERIFY_FULL))
+		self.assertTrue(context.check_hostname)
+		self.assertEqual(context.verify_mode, ssl.CERT_REQUIRED)
+		self.assertIsNone(context.fingerprint)
+
+		context = get_ssl_context(make_router(ssl_verify_mode=VERIFY_CERTIFICATE))
+		self.assertFalse(context.check_hostname)
+		self.assertEqual(context.verify_mode, ssl.CERT_REQUIRED)
+
+	def test_context_is_kept_until_the_settings_change(self):
+		"""Sessions only resume with the context that created them"""
+		router = make_router(ssl_certificate_fingerprint=FINGERPRINT)
+		context = get_ssl_context(router)
+
+		self.assertIs(get_ssl_context(router), context)
+		self.assertIsNot(get_ssl_context(make_router(ssl_certificate_fingerprint="00" * 32)), context)
+
+
+class TestResumingSSLContext(FrappeTestCase):
+	def setUp(self):
+		self.context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+		self.context.check_hostname = False
+		self.context.verify_mode = ssl.CERT_NONE
+		self.context.router = "_Test TLS Router"
+		self.context.fingerprint = FINGERPRINT
+
+	def wrap(self, ssl_sock, **kwargs):
+		sock = MagicMock()
+		sock.getpeername.return_value = ("10.0.0.1", 8729)
+		with patch.object(ssl.SSLContext, "wrap_socket", return_value=ssl_sock) as wrap_socket, \
+				patch.object(tls, "record_handshake") as record_handshake:
+			self.context.wrap_socket(sock, server_hostname="10.0.0.1", **kwargs)
+		return wrap_socket, record_handshake
+
+	def test_matching_fingerprint_is_accepted(self):
+		ssl_sock = make_ssl_sock()
+
+		_wrap_socket, record_handshake = self.wrap(ssl_sock)
+
+		ssl_sock.close.assert_not_called()
+		record_handshake.assert_called_once()
+
+	def test_mismatching_fingerprint_is_rejected(self):
+		ssl_sock = make_ssl_sock(certificate=b"someone else's certificate")
+
+		self.assertRaises(ssl.SSLError, self.wrap, ssl_sock)
+		ssl_sock.close.assert_called_once()
+
+	def test_missing_certificate_is_rejected(self):
+		self.assertRaises(ssl.SSLError, self.wrap, make_ssl_sock(certificate=None))
+
+	def test_session_is_offered_on_the_next_connection(self):
+		first = make_ssl_sock()
+		self.wrap(first)
+
+		wrap_socket, record_handshake = self.wrap(make_ssl_sock(reused=True))
+
+		self.assertIs(wrap_socket.call_args.kwargs["session"], first.session)
+		self.assertTrue(record_handshake.call_args.args[2])
+
+	def test_oldest_sessions_are_dropped(self):
+		with patch.object(tls, "MAX_SESSIONS", 2):
+			for port in (1, 2, 3):
+				self.context.remember_session(("10.0.0.1", port), make_ssl_sock())
+
+		self.assertEqual(list(self.context.get_sessions()), [("10.0.0.1", 2), ("10.0.0.1", 3)])
@@ -0,0 +1,100 @@
+# Copyright (c) 2026, ronoh and Contributors
+# See license.txt
+
+from contextlib import ExitStack
+from unittest.mock import MagicMock, patch
+
+import frappe
+from frappe.utils import add_days, today
+
+from mikrotik_integration.mikrotik_integration.doctype.customer_subscription.customer_subscription import (
+	CustomerSubscription,
+)
+from mikrotik_integration.mikrotik_integration.doctype.mikrotik_settings.mikrotik_settings import MikroTikSettings
+
+TEST_CUSTOMER = "_Test MikroTik Customer"
+TEST_CONNECTION_CODE = "_TEST_HOTSPOT"
+TEST_PLAN = "_Test MikroTik Plan"
+
+
+def make_router(router_name="_Test MikroTik Router"):
+	if not frappe.db.exists("MikroTik Settings", router_name):
+		frappe.get_doc({
+			"doctype": "MikroTik Settings",
+			"router_name": router_name,
+			"api_host": "127.0.0.1",
+			"api_port": 8728,
+			"username": "admin"
+		}).insert()
+	return router_name
+
+
+def make_customer():
+	if not frappe.db.exists("Customer", TEST_CUSTOMER):
+		frappe.get_doc({
+			"doctype": "Customer",
+			"customer_name": TEST_CUSTOMER,
+			"customer_type": "Individual",
+			"customer_group": frappe.db.get_single_value("Selling Settings", "customer_group")
+			or frappe.db.get_value("Customer Group", {"is_group": 0}),
+			"territory": frappe.db.get_single_value("Selling Settings", "territory")
+			or frappe.db.get_value("Territory", {"is_group": 0})
+		}).insert()
+	return TEST_CUSTOMER
+
+
+def make_internet_plan():
+	plan = frappe.db.get_value("Internet Plan", {"plan_name": TEST_PLAN})
+	if plan:
+		return plan
+
+	connection_type = frappe.db.get_value("Connection Type", {"connection_code": TEST_CONNECTION_CODE})
+	if not connection_type:
+		connection_type = frappe.get_doc({
+			"doctype": "Connection Type",
+			"connection_code": TEST_CONNECTION_CODE,
+			"service_name": "hotspot",
+			"profile_name": "default"
+		}).insert().name
+
+	return frappe.get_doc({
+		"doctype": "Internet Plan",
+		"plan_name": TEST_PLAN,
+		"connection_type": connection_type,
+		"validity_days": 30,
+		"billing_type": "Prepaid",
+		"price": 100,
+		"currency": frappe.db.get_default("currency") or "USD"
+	}).insert().name
+
+
+def make_subscription(router=None, submit=True, **values):
+	"""A subscription of the test customer on a test router, without touching the router"""
+	subscription = frappe.get_doc(dict({
+		"doctype": "Customer Subscription",
+		"customer": make_customer(),
+		"internet_plan": make_internet_plan(),
+		"mikrotik_settings": router or make_router(),
+		"phone_number": "254700000000",
+		"start_date": today()
+	}, **values))
+	with offline_router():
+		subscription.insert()
+		if submit:
+			subscription.submit()
+	return subscription
+
+
+def expired_values():
+	return {"start_date": add_days(today(), -40), "expiry_date": add_days(today(), -10)}
+
+
+def offline_router():
+	"""Stub out every router call of Customer Subscription while the context is open"""
+	stack = ExitStack()
+	for method in (
+		"provision_mikrotik_user", "remove_mikrotik_user", "set_mikrotik_user_disabled", "kick_active_sessions"
+	):
+		stack.enter_context(patch.object(CustomerSubscription, method))
+	stack.enter_context(patch.object(MikroTikSettings, "get_api_connection", return_value=MagicMock()))
+	return stack
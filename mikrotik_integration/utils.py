@@ -4,27 +4,66 @@ from datetime import datetime
 
 def sync_all_routers():
     """Sync all MikroTik routers"""
+    from mikrotik_integration.mikrotik_integration.sharding import fan_out
+
     try:
-        routers = frappe.get_all("MikroTik Settings", fields=["name"])
-        for router in routers:
-            try:
-                router_doc = frappe.get_doc("MikroTik Settings", router.name)
-                # Test connection
-                api = router_doc.get_api_connection()
-                api.get_resource('/system/identity').get()
-                # Update last sync time
-                router_doc.last_sync = now()
-                router_doc.save()
-                api.close()
-                frappe.db.commit()
-            except Exception as e:
-                frappe.log_error(
-                    f"Error syncing router {router.name}: {str(e)}",
-                    "Router Sync Error"
-                )
+        routers = frappe.get_all("MikroTik Settings", filters={"disabled": 0}, pluck="name")
+        fan_out("sync_all_routers", "mikrotik_integration.utils.sync_router", routers)
     except Exception as e:
         frappe.log_error(f"Error in sync_all_routers: {str(e)}")
 
+def sync_router(router_name):
+    """Check that a router answers, sample its telemetry and record the sync time"""
+    from mikrotik_integration.mikrotik_integration.doctype.mikrotik_router_operation.mikrotik_router_operation import (
+        enqueue_outbox_drain,
+    )
+    from mikrotik_integration.mikrotik_integration.doctype.hotspot_voucher.hotspot_voucher import (
+        sync_router_vouchers,
+    )
+    from mikrotik_integration.mikrotik_integration.pcq import ensure_router_queue_objects
+    from mikrotik_integration.mikrotik_integration.placement import collect_router_load
+    from mikrotik_integration.mikrotik_integration.rate_limit import PRIORITY_BACKGROUND
+    from mikrotik_integration.mikrotik_integration.telemetry import collect_router_telemetry
+
+    try:
+        router_doc = frappe.get_doc("MikroTik Settings", router_name)
+        # Test connection
+        api = router_doc.get_api_connection(priority=PRIORITY_BACKGROUND)
+        identity = api.get_resource('/system/identity').get()
+        before = (router_doc.router_identity, router_doc.router_generation)
+        router_doc.update_identity(identity[0].get('name') if identity else None)
+        # Recreate shared PCQ objects on new or reset routers
+        ensure_router_queue_objects(api, router_doc)
+        # CPU, memory, uptime and interface rates for the dashboard, sessions for placement
+        try:
+            sample = collect_router_telemetry(api, router_name)
+            collect_router_load(api, router_name, sample)
+        except Exception as e:
+            frappe.log_error(f"Error reading telemetry of router {router_name}: {str(e)}", "Router Sync Error")
+        # Vouchers start on their first session and are removed once they run out
+        try:
+            sync_router_vouchers(api, router_name)
+        except Exception as e:
+            frappe.log_error(f"Error syncing vouchers of router {router_name}: {str(e)}", "Router Sync Error")
+        api.close()
+        # Only the sync time changes on most runs, so write just the changed columns
+        values = {"last_sync": now()}
+        if (router_doc.router_identity, router_doc.router_generation) != before:
+            values.update(router_identity=router_doc.router_identity, router_generation=router_doc.router_generation)
+        router_doc.db_set(values, update_modified=False)
+        # The router answered, so replay anything queued while it was down
+        if frappe.db.exists("MikroTik Router Operation", {"router": router_name, "status": "Pending"}):
+            enqueue_outbox_drain(router_name)
+        frappe.db.commit()
+        return {"scanned": 1, "changed": 1}
+    except Exception as e:
+        frappe.log_error(
+            f"Error syncing router {router_name}: {str(e)}",
+            "Router Sync Error"
+        )
+        frappe.db.rollback()
+        return {"scanned": 1, "errors": 1}
+
 def format_bytes(bytes):
     """Format bytes to human readable format"""
     for unit in ['B', 'KB', 'MB', 'GB', 'TB']: